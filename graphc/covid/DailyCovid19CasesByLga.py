@@ -5,13 +5,12 @@ import copy
 import sys
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 
+from graphc.da import layer_pool
 from graphc.covid.source.VIC_SourceData import VicData
 from graphc.covid.source.NSW_SourceData import NswNotificationData
 from graphc.data.abs2019 import LGA2019
 from graphc.data.abs2020 import LGA2020
-from graphc.da import da_arcpy
 
 
 default_service_url = r'https://services9.arcgis.com/7eQuDPPaB6g9029K/arcgis/rest/services/DailyCovid19CasesByLga/FeatureServer/0'
@@ -19,7 +18,7 @@ default_service_url = r'https://services9.arcgis.com/7eQuDPPaB6g9029K/arcgis/res
 
 class DailyCovid19CasesByLGA(object):
     def __init__(self, service_url=default_service_url):
-        self.layer = FeatureLayer(service_url)
+        self.layer = layer_pool.default_pool.layer(service_url)
         self.lga_code_field = 'LGA_CODE'
         self.lga_name_field = 'LGA_NAME'
         self.lga_version_field = 'LGA_Version'
@@ -134,9 +133,7 @@ class UpdateFromSourceTask(object):
         sorted_data = sorted(source_data, key=lambda x: (x[self.nsw_source.lga_code_field], x[self.nsw_source.date_field]))
 
         # convert to input rows
-        xys = da_arcpy.load_xy_geometries(source=self.lga2019._source,
-                                          id_field=self.lga2019.lga_code_field,
-                                          where_clause="{} = '1'".format(self.lga2019.ste_code_field))
+        xys = self.lga2019.xy_arrays(where_clause="{} = '1'".format(self.lga2019.ste_code_field))
 
         totals = {}
         wkg = {}
@@ -162,7 +159,7 @@ class UpdateFromSourceTask(object):
                             'cases': 1,
                             'total_cases': total,
                             'lga_version': '2019',
-                            'xy': xys.get(lga_code, None)}
+                            'xy': xys.xy(lga_code)}
                 wkg[key] = wkg_item
         return wkg.values()
 
@@ -173,13 +170,11 @@ class UpdateFromSourceTask(object):
     def _get_vic_source(self):
         source_data = self.vic_source.daily_cases_by_lga()
 
-        xys = da_arcpy.load_xy_geometries(source=self.lga2020._source,
-                                          id_field=self.lga2020.lga_code_field,
-                                          where_clause="{} = '2'".format(self.lga2020.ste_code_field))
+        xys = self.lga2020.xy_arrays(where_clause="{} = '2'".format(self.lga2020.ste_code_field))
 
         for source_item in source_data:
             source_id = source_item['lga_code']
-            source_item['xy'] = xys.get(source_id, None)
+            source_item['xy'] = xys.xy(source_id)
             source_item['lga_version'] = '2020'
 
         return source_data
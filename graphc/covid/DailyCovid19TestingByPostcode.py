@@ -4,10 +4,9 @@ import argparse
 import sys
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 
+from graphc.da import layer_pool
 from graphc.covid.source.NSW_SourceData import NswTestData
-from graphc.da import da_arcpy
 from graphc.data.abs2016 import POA2016
 
 
@@ -16,7 +15,7 @@ default_service_url = r'https://services9.arcgis.com/7eQuDPPaB6g9029K/arcgis/res
 
 class DailyCovid19TestingByPostcode(object):
     def __init__(self, service_url=default_service_url):
-        self.layer = FeatureLayer(service_url)
+        self.layer = layer_pool.default_pool.layer(service_url)
         self.postcode_field = 'Postcode'
         self.date_field = 'Date'
         self.date_code_field = 'DateCode'
@@ -134,8 +133,7 @@ class UpdateFromSourceTask(object):
         sorted_data = sorted(source_data, key=lambda x: (x[self.nsw_source.postcode_field], x[self.nsw_source.date_field]))
 
         # get postcode xys
-        xys = da_arcpy.load_xy_geometries(source=self.geometry_source._source,
-                                          id_field=self.geometry_source.poa_code_field)
+        xys = self.geometry_source.xy_arrays()
 
         # convert to input rows
         totals = {}
@@ -155,7 +153,7 @@ class UpdateFromSourceTask(object):
                 wkg_item['tests'] += 1
                 wkg_item['total_tests'] = total
             else:
-                xy = xys.get(postcode, None)
+                xy = xys.xy(postcode)
                 wkg_item = {'postcode': postcode,
                             'date_code': date_str,
                             'tests': 1,
@@ -4,10 +4,9 @@ import argparse
 import sys
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 
+from graphc.da import layer_pool
 from graphc.covid.source.NSW_SourceData import NswNotificationData
-from graphc.da import da_arcpy
 from graphc.data.abs2016 import POA2016
 
 
@@ -20,7 +19,7 @@ class TotalCovid19CasesByPostcode(object):
     - Each postcode is represented by a single record.  There should be no duplicate postcodes in this feature layer.
     """
     def __init__(self, service_url=default_service_url):
-        self.layer = FeatureLayer(service_url)
+        self.layer = layer_pool.default_pool.layer(service_url)
         self.postcode_field = 'PostCode'
         self.total_cases_field = 'TotalCases'
         self.date_of_last_case_field = 'DateOfLastCase'
@@ -179,11 +178,10 @@ class UpdateFromSourceTask(object):
         """
 
         # get postcode xys
-        xys = da_arcpy.load_xy_geometries(source=self.geometry_source._source,
-                                          id_field=self.geometry_source.poa_code_field)
+        xys = self.geometry_source.xy_arrays()
 
         for postcode, postcode_item in postcode_items.items():
-            postcode_item['xy'] = xys.get(postcode, None)
+            postcode_item['xy'] = xys.xy(postcode)
 
         return postcode_items
 
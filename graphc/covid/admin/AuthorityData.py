@@ -3,6 +3,7 @@ import copy
 import datetime
 import logging
 
+from graphc.covid.admin import statistics
 from graphc.covid.source import NSW_SourceData
 from graphc.covid.source import JHU_SourceData
 from graphc.data.abs2016 import POA2016
@@ -714,46 +715,42 @@ class NotificationsByDateAndPostcode(object):
         """
         # get the source data sorted by Postcode then DateCode
         source_data = sorted(self.data(), key=lambda x: (x['postcode'], x['date_code']))
+        if not source_data:
+            return {}
+
+        # totals are calculated to the current date, or the last report date if later.
+        finish_date = max(datetime.datetime.now().date(),
+                          datetime.datetime.strptime(max(item['date_code'] for item in source_data), '%Y%m%d').date())
+        totals = statistics.cumulative_daily_totals_by_group(data=source_data,
+                                                              group_id_field='postcode',
+                                                              value_field='notifications',
+                                                              date_field='date_code',
+                                                              end_date=finish_date,
+                                                              as_array=True)
 
         # create initial result by registering only days for each postcode where new cases are registered
         result = {}
-        postcode_start_dates = {}
-        current_postcode = 'xxxx'
-        total = 0
+        geometries = {}
         for item in source_data:
             postcode = item['postcode']
             date_code = item['date_code']
-            if postcode == current_postcode:  # still working with same postcode
-                new_notifications = item['notifications']
-                total += new_notifications  # add the current notifications to the current cumulative total
-                item['new_notifications'] = new_notifications
-                item['notifications'] = total  # update the item to show the cumulative total
-            else:  # setup for new postcode.  For first postcode record cumulative total and notifications are equal.
-                current_postcode = postcode
-                total = item['notifications']
-                item['new_notifications'] = item['notifications']
-                postcode_start_dates[postcode] = date_code
+            item['new_notifications'] = item['notifications']
+            item['notifications'] = totals.get(postcode, datetime.datetime.strptime(date_code, '%Y%m%d').date())
             key = '{}_{}'.format(date_code, postcode)
             result[key] = item
+            geometries[postcode] = item['shape']
 
         if all_days:
-            # if all_days, fill in date gaps from loaded data.
-            finish_date = datetime.datetime.now()
-            notifications = None
-            geometry = None
-            for postcode, start_date in postcode_start_dates.items():
-                date_value = datetime.datetime.strptime(start_date, '%Y%m%d')
-                while date_value < finish_date:
-                    date_code = date_value.strftime('%Y%m%d')
-                    key = '{}_{}'.format(date_code, postcode)
-                    item = result.get(key, None)
-                    if item:
-                        notifications = item['notifications']
-                        geometry = item['shape']
-                    else:
-                        result[key] = {'date_code': date_code, 'postcode': postcode,
-                                       'notifications': notifications, 'new_notifications': 0, 'shape': geometry}
-                    date_value += datetime.timedelta(days=1)
+            # if all_days, fill in date gaps from the daily totals.
+            date_codes = totals.date_codes()
+            last_column = datetime.datetime.now().date().toordinal() - totals.start_ordinal
+            for row, postcode in enumerate(totals.groups):
+                values = totals.values[row].tolist()
+                for column in range(int(totals.first[row]), last_column + 1):
+                    key = '{}_{}'.format(date_codes[column], postcode)
+                    if key not in result:
+                        result[key] = {'date_code': date_codes[column], 'postcode': postcode,
+                                       'notifications': values[column], 'new_notifications': 0, 'shape': geometries[postcode]}
 
         return result
 
@@ -34,7 +34,7 @@ class CasesByDateAndState2(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = StateCapitals()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         for item in covid_source.source_data():
             date_value = item[covid_source.fields.date]
@@ -108,7 +108,7 @@ class CasesByDateAndState(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = StateCapitals()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         # load jhu source first.  Most states do not have their own source.
         jhu_data = jhu_source.counts_by_date_and_state(use_abbreviation=True)
@@ -180,7 +180,7 @@ class DeathsByDateAndState2(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = StateCapitals()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         for item in covid_source.source_data():
             date_value = item[covid_source.fields.date]
@@ -237,7 +237,7 @@ class DeathsByDateAndState(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = StateCapitals()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         # load jhu source.  No other deaths by state yet.
         jhu_data = jhu_source.counts_by_date_and_state(use_abbreviation=True)
@@ -307,7 +307,7 @@ class TestsByDateAndState2(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = StateCapitals()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         for item in covid_source.source_data():
             date_value = item[covid_source.fields.date]
@@ -380,7 +380,7 @@ class TestsByDateAndState(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = StateCapitals()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         # load nsw source.  No other tests data yet
         state = 'NSW'
@@ -445,7 +445,7 @@ class CasesByDateAndPostcode(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = POA2016.centroids()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         # load nsw source.  NSW source values override any existing jhu values for nsw.
         for key, case_count in nsw_source.counts_by_date_and_postcode().items():
@@ -497,7 +497,7 @@ class CasesByDatePostcodeSource(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = POA2016.centroids()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         # load nsw source.  NSW source values override any existing jhu values for nsw.
         for key, case_count in nsw_source.counts_by_date_postcode_source().items():
@@ -540,7 +540,7 @@ class TestsByDateAndPostcode(TableBase):
         # get state capital geometries indexed by state abbreviation
         if not geometry_source:
             geometry_source = POA2016.centroids()
-        features = geometry_source.values_by_id(value_field='SHAPE@')
+        features = geometry_source.geometries_by_id()
 
         # load nsw source.
         for key, test_count in nsw_source.counts_by_date_and_postcode().items():
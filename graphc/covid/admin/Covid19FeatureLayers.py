@@ -1,14 +1,13 @@
 import datetime
 import logging
 
-from arcgis.features import FeatureLayer
-
 from graphc.data.pois import StateCapitals
 from graphc.covid.admin import AuthorityData
 from graphc.covid.admin import AuthorityData2
 from graphc.covid.admin import statistics
 from graphc.covid.admin import utilities
 from graphc.da import da_agol
+from graphc.da import layer_pool
 
 
 class CrisperStatisticsByState(object):
@@ -27,7 +26,7 @@ class CrisperStatisticsByState(object):
         self.total_deaths_field = 'TotalDeaths'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def synchronize(self, new_data):
         logging.info('Synchronizing: ' + self.service_url)
@@ -280,7 +279,7 @@ class CrisperCaseStatisticsByDateStateAndName(object):
         self.statistic_value_field = statistic_value_field
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -351,7 +350,7 @@ class CrisperCaseStatisticsByDateStateAndName(object):
 #         self.date_code_format = '%Y%m%d'
 #
 #     def layer(self):
-#         return FeatureLayer(self.service_url)
+#         return layer_pool.default_pool.layer(self.service_url)
 #
 #     def query(self, where_clause='1=1'):
 #         return self.layer().query(where=where_clause)
@@ -414,7 +413,7 @@ class Covid19CaseLocationsByPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -480,7 +479,7 @@ class Covid19NotificationsByDateAndPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -518,7 +517,8 @@ class Covid19NotificationsByDateAndPostcode(object):
                    "geometry": utilities.geometry_to_json(new_item['shape'])}
             adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates)
+        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates,
+                                    add_key_field=self.id_field)
 
 
 class Covid19TotalNotificationsByPostcode(object):
@@ -535,7 +535,7 @@ class Covid19TotalNotificationsByPostcode(object):
         self.most_recent_new_field = 'MostRecentNew'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -592,7 +592,8 @@ class Covid19TotalNotificationsByPostcode(object):
                    "geometry": utilities.geometry_to_json(new_item['shape'])}
             adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=None, updates=updates)
+        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=None, updates=updates,
+                                    add_key_field=self.postcode_field)
 
 
 # ---------------------------------------------
@@ -624,7 +625,7 @@ class Covid19StatisticsByDateAndState(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -790,7 +791,8 @@ class Covid19StatisticsByDateAndState(object):
                    "geometry": utilities.geometry_to_json(new_item['shape'])}
             adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates)
+        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates,
+                                    add_key_field=self.id_field)
 
 
 class Covid19StatisticsByDateAndPostcode(object):
@@ -809,7 +811,7 @@ class Covid19StatisticsByDateAndPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -924,7 +926,8 @@ class Covid19StatisticsByDateAndPostcode(object):
                    "geometry": utilities.geometry_to_json(new_item['shape'])}
             adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates)
+        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates,
+                                    add_key_field=self.id_field)
 
 # ---------------------------------------------
 # Test by Postcode
@@ -945,7 +948,7 @@ class Covid19TestsByDateAndPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -984,7 +987,8 @@ class Covid19TestsByDateAndPostcode(object):
                    "geometry": utilities.geometry_to_json(new_item['shape'])}
             adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates)
+        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates,
+                                    add_key_field=self.id_field)
 
 
 class Covid19TotalTestsByPostcode(object):
@@ -1001,7 +1005,7 @@ class Covid19TotalTestsByPostcode(object):
         self.most_recent_tests_field = 'MostRecentNewTests'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -1059,7 +1063,8 @@ class Covid19TotalTestsByPostcode(object):
                    "geometry": utilities.geometry_to_json(new_item['shape'])}
             adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=None, updates=updates)
+        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=None, updates=updates,
+                                    add_key_field=self.postcode_field)
 
 
 class Covid19CumulativeTestsByDateAndPostcode(object):
@@ -1076,7 +1081,7 @@ class Covid19CumulativeTestsByDateAndPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -1114,4 +1119,5 @@ class Covid19CumulativeTestsByDateAndPostcode(object):
                    "geometry": utilities.geometry_to_json(new_item['shape'])}
             adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates)
\ No newline at end of file
+        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates,
+                                    add_key_field=self.id_field)
\ No newline at end of file
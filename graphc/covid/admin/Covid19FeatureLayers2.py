@@ -1,4 +1,5 @@
 import datetime
+import logging
 
 from graphc.covid.admin import AuthorityData2
 from graphc.covid.admin import filters
@@ -308,7 +309,15 @@ class CrisperTotalCasesByDatePostcodeSource(TableBase):
         else:
             return '{}_{}_{}'.format(date, postcode, likely_source)
 
-    def update_from_source(self, cases: AuthorityData2.CasesByDatePostcodeSource = AuthorityData2.CasesByDatePostcodeSource()):
+    def update_from_source(self, cases: AuthorityData2.CasesByDatePostcodeSource = AuthorityData2.CasesByDatePostcodeSource(),
+                           store=None):
+        """
+        :param cases: The cases by date, postcode and likely source.
+        :type cases: AuthorityData2.CasesByDatePostcodeSource
+        :param store: Optional.  The cumulative totals of the previous update.  If supplied, only the rows on or after the
+        first changed date are calculated and updated, and the store is saved once the update has been applied.
+        :type store: graphc.covid.admin.statistics_store.CumulativeTotalsStore
+        """
         new_records = {}
 
         # Cases data
@@ -325,8 +334,21 @@ class CrisperTotalCasesByDatePostcodeSource(TableBase):
             if postcode not in geometries:
                 geometries[postcode] = record['SHAPE@']
 
-        data = statistics.cumulative_daily_totals_by_group(data=records, group_id_field='group_id', value_field=cases.cases_field,
-                                                           date_field=cases.date_field, none_value=0)
+        where_clause = None
+        if store is None:
+            data = statistics.cumulative_daily_totals_by_group(data=records, group_id_field='group_id', value_field=cases.cases_field,
+                                                               date_field=cases.date_field, none_value=0)
+        else:
+            # an empty store updates all rows, otherwise only the rows from the first changed date are updated.
+            update_all = len(store) == 0
+            first_date, totals = store.update(data=records, group_id_field='group_id', value_field=cases.cases_field,
+                                              date_field=cases.date_field)
+            if totals is None:
+                logging.info('No changes to cumulative totals')
+                return
+            data = totals.to_dict()
+            if not update_all:
+                where_clause = "{} >= DATE '{}'".format(self.date_field, first_date.strftime('%Y-%m-%d'))
 
         new_records = {}
         for key, value in data.items():
@@ -337,13 +359,17 @@ class CrisperTotalCasesByDatePostcodeSource(TableBase):
             new_records[new_record[self.id_field]] = new_record
 
         target_fields = [self.id_field, self.date_field, self.postcode_field, self.likely_source_field, self.cases_field]
-        self.update_records(new_data=new_records,
-                            fields=target_fields,
-                            where_clause=None,
-                            add_new=True,
-                            delete_unmatched=True,
-                            rounding=4,
-                            case_sensitive=True)
+        result = self.update_records(new_data=new_records,
+                                     fields=target_fields,
+                                     where_clause=where_clause,
+                                     add_new=True,
+                                     delete_unmatched=True,
+                                     rounding=4,
+                                     case_sensitive=True)
+
+        # a failed update is recalculated on the next run.
+        if store is not None and store.path and not (result or {}).get('failures'):
+            store.save()
 
 
 class Covid19StatisticsByDateAndState(TableBase):
@@ -1115,13 +1141,12 @@ class CrisperMovingDailyAverageCasesByDateAndState(TableBase):
                 geometries[item[cases.state_field]] = item[cases.shape_field]
 
         new_records = {}
-        for interval in self.intervals:
-            interval_values = statistics.moving_daily_averages_by_date_and_group(data=case_data,
-                                                                                 group_id_field=cases.state_field,
-                                                                                 value_field=cases.cases_field,
-                                                                                 date_field=cases.date_field,
-                                                                                 n=interval)
-
+        averages = statistics.moving_daily_averages_by_interval(data=case_data,
+                                                                group_id_field=cases.state_field,
+                                                                value_field=cases.cases_field,
+                                                                date_field=cases.date_field,
+                                                                intervals=self.intervals)
+        for interval, interval_values in averages.items():
             for date_state, mda in interval_values.items():
                 date, state = date_state.split('_')
                 state_geom = geometries.get(state, None)
@@ -1183,13 +1208,12 @@ class CrisperMovingDailyAverageDeathsByDateAndState(TableBase):
                 geometries[item[deaths.state_field]] = item[deaths.shape_field]
 
         new_records = {}
-        for interval in self.intervals:
-            interval_values = statistics.moving_daily_averages_by_date_and_group(data=death_data,
-                                                                                 group_id_field=deaths.state_field,
-                                                                                 value_field=deaths.deaths_field,
-                                                                                 date_field=deaths.date_field,
-                                                                                 n=interval)
-
+        averages = statistics.moving_daily_averages_by_interval(data=death_data,
+                                                                group_id_field=deaths.state_field,
+                                                                value_field=deaths.deaths_field,
+                                                                date_field=deaths.date_field,
+                                                                intervals=self.intervals)
+        for interval, interval_values in averages.items():
             for date_state, mda in interval_values.items():
                 date, state = date_state.split('_')
                 state_geom = geometries.get(state, None)
@@ -1251,13 +1275,12 @@ class CrisperMovingDailyAverageTestsByDateAndState(TableBase):
                 geometries[item[tests.state_field]] = item[tests.shape_field]
 
         new_records = {}
-        for interval in self.intervals:
-            interval_values = statistics.moving_daily_averages_by_date_and_group(data=test_data,
-                                                                                 group_id_field=tests.state_field,
-                                                                                 value_field=tests.tests_field,
-                                                                                 date_field=tests.date_field,
-                                                                                 n=interval)
-
+        averages = statistics.moving_daily_averages_by_interval(data=test_data,
+                                                                group_id_field=tests.state_field,
+                                                                value_field=tests.tests_field,
+                                                                date_field=tests.date_field,
+                                                                intervals=self.intervals)
+        for interval, interval_values in averages.items():
             for date_state, mda in interval_values.items():
                 date, state = date_state.split('_')
                 state_geom = geometries.get(state, None)
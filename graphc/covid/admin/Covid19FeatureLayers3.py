@@ -1,16 +1,17 @@
 import datetime
-import copy
 
 from graphc.covid.admin import DataEngine
 from graphc.covid.admin import FeatureSources
 from graphc.covid.admin import filters
+from graphc.covid.admin import statistic_builder
 from graphc.covid.admin import statistics
 from graphc.da.arcgis_helpers import TableBase
 
 # these imports support Covid19CaseLocationsByPostcode
 import logging
-from arcgis.features import FeatureLayer
 from graphc.da import da_agol
+from graphc.da import layer_pool
+from graphc.da.diff_engine import RecordDiff
 from graphc.covid.admin import utilities
 
 
@@ -29,7 +30,7 @@ class Covid19CaseLocationsByPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -37,7 +38,7 @@ class Covid19CaseLocationsByPostcode(object):
     def synch_with_authority(self, data_engine: DataEngine.DataEngine, feature_source: FeatureSources.FeatureSources):
         logging.info('Synchronizing: ' + self.service_url)
 
-        source_records = copy.deepcopy(data_engine.cases_by_date_postcode_and_source().records())  # make a copy so we don't alter source.
+        source_records = data_engine.cases_by_date_postcode_and_source().records()  # read-only, the diff does not alter the records.
         source_data = {}
         for record in source_records:
             date_code = record['Date'].strftime('%Y%m%d')
@@ -47,42 +48,33 @@ class Covid19CaseLocationsByPostcode(object):
 
         logging.info('Identifying Changes')
 
-        deletes = []
+        diff = RecordDiff(source_data)
 
         target_layer = self.layer()
         query_result = target_layer.query()
         for row in query_result:
             key = '{}_{}_{}'.format(row.attributes[self.date_code_field], row.attributes[self.postcode_field],
                                     row.attributes[self.likely_source_field])
-            update_item = source_data.get(key, None)
-            if update_item:
-                # if an update item was found, subtract 1 from the notifications total.
-                update_item['Cases'] -= 1
-                if update_item['Cases'] < 1:
-                    # If the new notifications total is less than 1, then this was the last notification for the postcode/date.
-                    # Remove the postcode/date item from the collection of update items so any additional records associated with
-                    # this date/postcode combo will be deleted from the online data.
-                    source_data.pop(key, None)
-            else:
+            # each existing row claims one of the cases for its date/postcode/source.  Once all cases have been claimed, any
+            # additional records associated with this date/postcode/source combo are deleted from the online data.
+            if not diff.claim(key, 'Cases'):
                 # if no matching update item was found, delete the record from online.
-                deletes.append(row.attributes[query_result.object_id_field_name])
+                diff.deletes.append(row.attributes[query_result.object_id_field_name])
 
         # any remaining data_models items are new records
-        adds = []
-
-        for key, new_item in source_data.items():
+        for key, new_item in diff.unmatched():
             date_code, postcode, likely_source = key.split('_')
             date = datetime.datetime.strptime(date_code, '%Y%m%d')
-            for i in range(new_item['Cases']):
+            for i in range(diff.remaining(key, 'Cases')):
                 row = {"attributes":
                        {self.date_code_field: date_code,
                         self.date_field: date,
                         self.postcode_field: postcode.upper(),
                         self.likely_source_field: likely_source},
-                       "geometry": utilities.geometry_to_json(shapes.get(postcode, None))}
-                adds.append(row)
+                       "geometry": utilities.geometry_to_json(shapes.get(postcode, None), key=('postcode_points', postcode))}
+                diff.adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=None)
+        return da_agol.update_layer(layer=target_layer, adds=diff.adds, deletes=diff.deletes, updates=None)
 
 
 class Covid19TotalNotificationsByPostcode(TableBase):
@@ -177,76 +169,20 @@ class Covid19StatisticsByDateAndPostcode(TableBase):
 
     def update_from_source(self, data_engine: DataEngine.DataEngine, feature_source: FeatureSources.FeatureSources):
 
-        new_records = {}
-
-        # Cases data
         shapes = feature_source.postcode_points().items()
-        records = data_engine.cases_by_date_and_postcode().records()
-        for record in records:
-            postcode = record['Postcode']
-            date_value = record['Date']
-            shape_value = shapes.get(postcode, None)
-            new_record = self.create_record(date=date_value,
-                                            postcode=postcode,
-                                            new_cases=record['Cases'],
-                                            shape=shape_value)
-            new_records[new_record[self.id_field]] = new_record
 
-        # Cumulative cases.
-        data = statistics.cumulative_daily_totals_by_group(data=records,
-                                                           group_id_field='Postcode',
-                                                           value_field='Cases',
-                                                           date_field='Date')
-        for id_value, value in data.items():
-            record = new_records.get(id_value, None)
-            if not record:
-                date_code, postcode = id_value.split('_')
-                record = self.create_record(date=date_code, date_format='%Y%m%d', postcode=postcode, shape=shapes.get(postcode, None))
-                new_records[id_value] = record
-            record[self.total_cases_field] = value
-
-        # -----------------------------------------------------------------------------------------------------
-        # Tests
-
-        records = data_engine.tests_by_date_and_postcode().records()
-        for record in records:
-            postcode = record['Postcode']
-            date_value = record['Date']
-            tests_value = record['Tests']
-            id_value = self.create_id(date=date_value, postcode=postcode)
+        builder = statistic_builder.DailyStatisticsBuilder(group_id_field='Postcode', date_field='Date')
+        builder.add(records=data_engine.cases_by_date_and_postcode().records(),
+                    value_field='Cases',
+                    operations=[('new', self.new_cases_field),
+                                ('cumsum', self.total_cases_field)])
+        builder.add(records=data_engine.tests_by_date_and_postcode().records(),
+                    value_field='Tests',
+                    operations=[('new', self.new_tests_field),
+                                ('cumsum', self.total_tests_field),
+                                ('rolling-7', self.ave_7_tests_field)])
 
-            new_record = new_records.get(id_value, None)
-            if not new_record:
-                new_record = self.create_record(date=date_value, postcode=postcode, shape=shapes.get(postcode, None))
-                new_records[id_value] = new_record
-            new_record[self.new_tests_field] = tests_value
-
-        # Cumulative deaths.
-        data = statistics.cumulative_daily_totals_by_group(data=records,
-                                                           group_id_field='Postcode',
-                                                           value_field='Tests',
-                                                           date_field='Date')
-        for id_value, value in data.items():
-            record = new_records.get(id_value, None)
-            if not record:
-                date_code, postcode = id_value.split('_')
-                record = self.create_record(date=date_code, date_format='%Y%m%d', postcode=postcode, shape=shapes.get(postcode, None))
-                new_records[id_value] = record
-            record[self.total_tests_field] = value
-
-        # Tests 7 day Average
-        data = statistics.moving_daily_averages_by_date_and_group(data=records,
-                                                                  group_id_field='Postcode',
-                                                                  value_field='Tests',
-                                                                  date_field='Date',
-                                                                  n=7)
-        for id_value, value in data.items():
-            record = new_records.get(id_value, None)
-            if not record:
-                date_code, postcode = id_value.split('_')
-                record = self.create_record(date=date_code, date_format='%Y%m%d', postcode=postcode, shape=shapes.get(postcode, None))
-                new_records[id_value] = record
-            record[self.ave_7_tests_field] = value
+        new_records = builder.build(lambda date, postcode: self.create_record(date=date, postcode=postcode, shape=shapes.get(postcode, None)))
 
         target_fields = [self.id_field, self.date_field, self.date_code_field, self.date_field,
                          self.new_cases_field, self.total_cases_field,
@@ -390,171 +326,28 @@ class Covid19StatisticsByDateAndState(TableBase):
         # get geometries indexed by state abbreviation.
         shapes = feature_source.state_capital_points().items()
 
-        new_records = {}
-
-        # Cases data
-        last_date = datetime.datetime.min
-        records = data_engine.cases_by_date_and_state().records()
-        for record in records:
-            state = record['State']
-            date_value = record['Date']
-            shape_value = shapes.get(state, None)
-            if date_value > last_date:
-                last_date = date_value
-            new_record = self.create_record(date=date_value,
-                                            state=state,
-                                            new_cases=record['Cases'],
-                                            shape=shape_value)
-            new_records[new_record[self.id_field]] = new_record
-
-        # Cumulative cases.
-        data = statistics.cumulative_daily_totals_by_group(data=records,
-                                                           group_id_field='State',
-                                                           value_field='Cases',
-                                                           date_field='Date',
-                                                           end_date=last_date)
-
-        for id_value, value in data.items():
-            record = new_records.get(id_value, None)
-            if not record:
-                date_code, state = id_value.split('_')
-                record = self.create_record(date=date_code, date_format='%Y%m%d', state=state, shape=shapes.get(state, None))
-                new_records[id_value] = record
-
-            record[self.total_cases_field] = value
-
-        # Cases 7 day Average
-        data = statistics.moving_daily_averages_by_date_and_group(data=records,
-                                                                  group_id_field='State',
-                                                                  value_field='Cases',
-                                                                  date_field='Date',
-                                                                  n=7,
-                                                                  end_date=last_date)
-
-        for id_value, value in data.items():
-            date_code, state = id_value.split('_')
-            record = new_records.get(id_value, None)
-            if not record:
-                record = self.create_record(date=date_code, date_format='%Y%m%d', state=state, shape=shapes.get(state, None))
-                new_records[id_value] = record
-
-            record_date = record[self.date_field]
-            if record_date > last_date:
-                record[self.cases_7_day_ave_field] = None
-            else:
-                record[self.cases_7_day_ave_field] = value
-
-        # ---------------------------------------------------------------------------------
-        # Deaths
-        last_date = datetime.datetime.min
-
-        records = data_engine.deaths_by_date_and_state().records()
-        for record in records:
-            state = record['State']
-            date_value = record['Date']
-            if date_value > last_date:
-                last_date = date_value
-            deaths_value = record['Deaths']
-            id_value = self.create_id(date=date_value, state=state)
-
-            new_record = new_records.get(id_value, None)
-            if not new_record:
-                new_record = self.create_record(date=date_value, state=state, shape=shapes.get(state, None))
-                new_records[id_value] = new_record
-            new_record[self.new_deaths_field] = deaths_value
-
-        # Cumulative deaths.
-        data = statistics.cumulative_daily_totals_by_group(data=records,
-                                                           group_id_field='State',
-                                                           value_field='Deaths',
-                                                           date_field='Date',
-                                                           end_date=last_date)
-
-        for id_value, value in data.items():
-            record = new_records.get(id_value, None)
-            if not record:
-                date_code, state = id_value.split('_')
-                record = self.create_record(date=date_code, date_format='%Y%m%d', state=state, shape=shapes.get(state, None))
-                new_records[id_value] = record
-
-            record[self.total_deaths_field] = value
-
-        # Deaths 7 day Average
-        data = statistics.moving_daily_averages_by_date_and_group(data=records,
-                                                                  group_id_field='State',
-                                                                  value_field='Deaths',
-                                                                  date_field='Date',
-                                                                  n=7,
-                                                                  end_date=last_date)
-
-        for id_value, value in data.items():
-            date_code, state = id_value.split('_')
-            record = new_records.get(id_value, None)
-            if not record:
-                record = self.create_record(date=date_code, date_format='%Y%m%d', state=state, shape=shapes.get(state, None))
-                new_records[id_value] = record
-
-            record_date = record[self.date_field]
-            if record_date > last_date:
-                record[self.deaths_7_day_ave_field] = None
-            else:
-                record[self.deaths_7_day_ave_field] = value
-
-        # -----------------------------------------------------------------------------------------------------
-        # Tests
-        last_date = datetime.datetime.min
-
-        records = data_engine.tests_by_date_and_state().records()
-        for record in records:
-            state = record['State']
-            date_value = record['Date']
-            if date_value > last_date:
-                last_date = date_value
-            tests_value = record['Tests']
-            id_value = self.create_id(date=date_value, state=state)
-
-            new_record = new_records.get(id_value, None)
-            if not new_record:
-                new_record = self.create_record(date=date_value, state=state, shape=shapes.get(state, None))
-                new_records[id_value] = new_record
-            new_record[self.new_tests_field] = tests_value
-
-        # Cumulative tests.
-        data = statistics.cumulative_daily_totals_by_group(data=records,
-                                                           group_id_field='State',
-                                                           value_field='Tests',
-                                                           date_field='Date',
-                                                           end_date=last_date)
-
-        for id_value, value in data.items():
-            record = new_records.get(id_value, None)
-            if not record:
-                date_code, state = id_value.split('_')
-                record = self.create_record(date=date_code, date_format='%Y%m%d', state=state, shape=shapes.get(state, None))
-                new_records[id_value] = record
-
-            record[self.total_tests_field] = value
-
-        # Tests 7 day Average
-        data = statistics.moving_daily_averages_by_date_and_group(data=records,
-                                                                  group_id_field='State',
-                                                                  value_field='Tests',
-                                                                  date_field='Date',
-                                                                  n=7,
-                                                                  end_date=last_date)
-
-        for id_value, value in data.items():
-            date_code, state = id_value.split('_')
-            record = new_records.get(id_value, None)
-            if not record:
-                record = self.create_record(date=date_code, date_format='%Y%m%d', state=state, shape=shapes.get(state, None))
-                new_records[id_value] = record
-
-            record_date = record[self.date_field]
-            if record_date > last_date:
-                record[self.tests_7_day_ave_field] = None
-            else:
-                record[self.tests_7_day_ave_field] = value
+        # all statistics end at the last date found in their source.
+        builder = statistic_builder.DailyStatisticsBuilder(group_id_field='State', date_field='Date')
+        builder.add(records=data_engine.cases_by_date_and_state().records(),
+                    value_field='Cases',
+                    operations=[('new', self.new_cases_field),
+                                ('cumsum', self.total_cases_field),
+                                ('rolling-7', self.cases_7_day_ave_field)],
+                    end_at_last_date=True)
+        builder.add(records=data_engine.deaths_by_date_and_state().records(),
+                    value_field='Deaths',
+                    operations=[('new', self.new_deaths_field),
+                                ('cumsum', self.total_deaths_field),
+                                ('rolling-7', self.deaths_7_day_ave_field)],
+                    end_at_last_date=True)
+        builder.add(records=data_engine.tests_by_date_and_state().records(),
+                    value_field='Tests',
+                    operations=[('new', self.new_tests_field),
+                                ('cumsum', self.total_tests_field),
+                                ('rolling-7', self.tests_7_day_ave_field)],
+                    end_at_last_date=True)
+
+        new_records = builder.build(lambda date, state: self.create_record(date=date, state=state, shape=shapes.get(state, None)))
 
         for record in new_records.values():
             tests = record[self.new_tests_field]
@@ -781,13 +574,12 @@ class CrisperMovingDailyAverageCasesByDateAndState(TableBase):
         shapes = feature_source.state_capital_points().items()
 
         new_records = {}
-        for interval in self.intervals:
-            interval_values = statistics.moving_daily_averages_by_date_and_group(data=case_data,
-                                                                                 group_id_field='State',
-                                                                                 value_field='Cases',
-                                                                                 date_field='Date',
-                                                                                 n=interval)
-
+        averages = statistics.moving_daily_averages_by_interval(data=case_data,
+                                                                group_id_field='State',
+                                                                value_field='Cases',
+                                                                date_field='Date',
+                                                                intervals=self.intervals)
+        for interval, interval_values in averages.items():
             for date_state, mda in interval_values.items():
                 date, state = date_state.split('_')
                 state_geom = shapes.get(state, None)
@@ -845,13 +637,12 @@ class CrisperMovingDailyAverageDeathsByDateAndState(TableBase):
         shapes = feature_source.state_capital_points().items()
 
         new_records = {}
-        for interval in self.intervals:
-            interval_values = statistics.moving_daily_averages_by_date_and_group(data=death_data,
-                                                                                 group_id_field='State',
-                                                                                 value_field='Deaths',
-                                                                                 date_field='Date',
-                                                                                 n=interval)
-
+        averages = statistics.moving_daily_averages_by_interval(data=death_data,
+                                                                group_id_field='State',
+                                                                value_field='Deaths',
+                                                                date_field='Date',
+                                                                intervals=self.intervals)
+        for interval, interval_values in averages.items():
             for date_state, mda in interval_values.items():
                 date, state = date_state.split('_')
                 state_geom = shapes.get(state, None)
@@ -909,13 +700,12 @@ class CrisperMovingDailyAverageTestsByDateAndState(TableBase):
         shapes = feature_source.state_capital_points().items()
 
         new_records = {}
-        for interval in self.intervals:
-            interval_values = statistics.moving_daily_averages_by_date_and_group(data=test_data,
-                                                                                 group_id_field='State',
-                                                                                 value_field='Tests',
-                                                                                 date_field='Date',
-                                                                                 n=interval)
-
+        averages = statistics.moving_daily_averages_by_interval(data=test_data,
+                                                                group_id_field='State',
+                                                                value_field='Tests',
+                                                                date_field='Date',
+                                                                intervals=self.intervals)
+        for interval, interval_values in averages.items():
             for date_state, mda in interval_values.items():
                 date, state = date_state.split('_')
                 state_geom = shapes.get(state, None)
@@ -1,4 +1,4 @@
-import arcpy
+from graphc.da import geometry_cache
 
 
 class FeatureSources(object):
@@ -35,19 +35,13 @@ class PostcodePoints(object):
 
     def items(self):
         """
-        Returns the geometries indexed by the id_field
+        Returns the geometries indexed by the id_field.  Geometries are read from the on-disk geometry cache, which is
+        refreshed when the source changes.
         :return:
         :rtype:
         """
         if not self._items:
-            result = {}
-
-            fields = [self.id_field, 'SHAPE@']
-            with arcpy.da.SearchCursor(self.source, fields) as cursor:
-                for row in cursor:
-                    result[row[0].upper()] = row[1]
-
-            self._items = result
+            self._items = geometry_cache.default_cache().load(source=self.source, id_field=self.id_field, upper_ids=True)
 
         return self._items
 
@@ -60,19 +54,13 @@ class PostcodePolygons(object):
 
     def items(self):
         """
-        Returns the geometries indexed by the id_field
+        Returns the geometries indexed by the id_field.  Geometries are read from the on-disk geometry cache, which is
+        refreshed when the source changes.
         :return:
         :rtype:
         """
         if not self._items:
-            result = {}
-
-            fields = [self.id_field, 'SHAPE@']
-            with arcpy.da.SearchCursor(self.source, fields) as cursor:
-                for row in cursor:
-                    result[row[0].upper()] = row[1]
-
-            self._items = result
+            self._items = geometry_cache.default_cache().load(source=self.source, id_field=self.id_field, upper_ids=True)
 
         return self._items
 
@@ -85,18 +73,12 @@ class StateCapitalPoints(object):
 
     def items(self):
         """
-        Returns the geometries indexed by the id_field
+        Returns the geometries indexed by the id_field.  Geometries are read from the on-disk geometry cache, which is
+        refreshed when the source changes.
         :return:
         :rtype:
         """
         if not self._items:
-            result = {}
-
-            fields = [self.id_field, 'SHAPE@']
-            with arcpy.da.SearchCursor(self.source, fields) as cursor:
-                for row in cursor:
-                    result[row[0].upper()] = row[1]
-
-            self._items = result
+            self._items = geometry_cache.default_cache().load(source=self.source, id_field=self.id_field, upper_ids=True)
 
         return self._items
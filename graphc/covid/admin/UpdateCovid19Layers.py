@@ -12,9 +12,21 @@ from arcgis.gis import GIS
 from graphc.covid.admin import AuthorityData2
 from graphc.covid.admin import Covid19FeatureLayers
 from graphc.covid.admin import Covid19FeatureLayers2
+from graphc.covid.admin.statistics_store import CumulativeTotalsStore
+from graphc.da.layer_mirror import LayerMirror
 
 
-def update():
+def update(mirror_path=None, totals_path=None):
+    """
+    :param mirror_path: Optional.  The path to a local mirror database.  If supplied, the feature service layers are
+    diffed against the local mirror, rather than downloading each target layer.  See graphc.da.layer_mirror
+    :type mirror_path: str
+    :param totals_path: Optional.  The path to the json file holding the state of the cumulative case totals.  If
+    supplied, only the totals from the first changed date are updated.  See graphc.covid.admin.statistics_store
+    :type totals_path: str
+    """
+    mirror = LayerMirror(mirror_path) if mirror_path else None
+
     cases = AuthorityData2.CasesByDateAndState2()
     cases.update_from_source()
     deaths = AuthorityData2.DeathsByDateAndState2()
@@ -25,22 +37,27 @@ def update():
     time_stamper = Covid19FeatureLayers2.DataExtractDates()
 
     updater = Covid19FeatureLayers2.CrisperStatisticsByState()
+    updater.use_mirror(mirror)
     updater.update_from_source(cases=cases, deaths=deaths, tests=tests)
     time_stamper.set_update_time(updater.source)
 
     updater = Covid19FeatureLayers2.Covid19StatisticsByDateAndState()
+    updater.use_mirror(mirror)
     updater.update_from_source(cases=cases, deaths=deaths, tests=tests)
     time_stamper.set_update_time(updater.source)
 
     updater = Covid19FeatureLayers2.CrisperMovingDailyAverageCasesByDateAndState()
+    updater.use_mirror(mirror)
     updater.update_from_source(cases=cases)
     time_stamper.set_update_time(updater.source)
 
     updater = Covid19FeatureLayers2.CrisperMovingDailyAverageDeathsByDateAndState()
+    updater.use_mirror(mirror)
     updater.update_from_source(deaths=deaths)
     time_stamper.set_update_time(updater.source)
 
     updater = Covid19FeatureLayers2.CrisperMovingDailyAverageTestsByDateAndState()
+    updater.use_mirror(mirror)
     updater.update_from_source(tests=tests)
     time_stamper.set_update_time(updater.source)
 
@@ -50,14 +67,17 @@ def update():
     tests.update_from_source()
 
     updater = Covid19FeatureLayers2.Covid19StatisticsByDateAndPostcode()
+    updater.use_mirror(mirror)
     updater.update_from_source(cases=cases, tests=tests)
     time_stamper.set_update_time(updater.source)
 
     updater = Covid19FeatureLayers2.Covid19TotalNotificationsByPostcode()
+    updater.use_mirror(mirror)
     updater.update_from_source(cases=cases)
     time_stamper.set_update_time(updater.source)
 
     updater = Covid19FeatureLayers2.Covid19PostcodeStatisticPolygons()
+    updater.use_mirror(mirror)
     updater.update_from_source(cases=cases)
     time_stamper.set_update_time(updater.source)
 
@@ -70,7 +90,9 @@ def update():
     time_stamper.set_update_time(updater.service_url)
 
     updater = Covid19FeatureLayers2.CrisperTotalCasesByDatePostcodeSource()
-    updater.update_from_source(notifications_by_date_and_postcode)
+    updater.use_mirror(mirror)
+    store = CumulativeTotalsStore(totals_path) if totals_path else None
+    updater.update_from_source(notifications_by_date_and_postcode, store=store)
     time_stamper.set_update_time(updater.source)
 
 
@@ -117,6 +139,14 @@ if __name__ == "__main__":
                         required=False,
                         default=r'E:\Documents2\tmp\UpdateOnlineCovid19Layers2.log',
                         help='Log file to be created or used.')
+    parser.add_argument("-m", "--mirror",
+                        required=False,
+                        default=None,
+                        help='Optional local mirror database used to diff the target layers without downloading them.')
+    parser.add_argument("-t", "--totals",
+                        required=False,
+                        default=None,
+                        help='Optional json file holding the cumulative case totals, so only changed dates are updated.')
 
     args = parser.parse_args()
 
@@ -136,7 +166,7 @@ if __name__ == "__main__":
 
     # execute
     try:
-        log_entry = '"{}" -p "{}" -l "{}"'.format(sys.argv[0], args.profile, args.log)
+        log_entry = '"{}" -p "{}" -l "{}" -m "{}" -t "{}"'.format(sys.argv[0], args.profile, args.log, args.mirror, args.totals)
 
         logging.info(log_entry)
         # create GIS connection
@@ -144,7 +174,7 @@ if __name__ == "__main__":
         gis = GIS(profile=args.profile)
         logging.info('End signin using profile credentials')
 
-        update()
+        update(mirror_path=args.mirror, totals_path=args.totals)
 
     except Exception as e:
         print(e)
@@ -0,0 +1,287 @@
+"""
+Dense group by day matrices used to calculate daily statistics with numpy.
+Groups and dates are mapped to integer row and column indexes, the record values are added (or assigned) to their
+cells in a single pass, and the statistics are then calculated along the date axis for all groups at once.
+Each group has its own first column, so a group's statistics start from its own first date as they do when the
+statistics are calculated group by group.
+"""
+import datetime
+
+import numpy
+
+from graphc.utilities import datetime_utils
+
+
+def _value_dtype(values, none_value):
+    """Returns int64 for integer values, float64 for floats and object for any other values, so results keep their type."""
+    kinds = set(type(value) for value in values)
+    kinds.add(type(none_value))
+    if kinds <= {int, bool}:
+        return numpy.int64
+    if kinds <= {int, bool, float}:
+        return numpy.float64
+    return object
+
+
+class DailyMatrix(object):
+    def __init__(self, groups, start_ordinal, values, first=None):
+        """
+        :param groups: The group ids, in the order of the matrix rows.
+        :type groups: list
+        :param start_ordinal: The date ordinal of the first column.  See datetime.date.toordinal
+        :type start_ordinal: int
+        :param values: The daily values.  shape: (groups, days)
+        :type values: numpy.ndarray
+        :param first: The first column of each group.  Columns before the first column of a group are not part of the
+        results.  If None, all groups start at the first column.
+        :type first: numpy.ndarray
+        """
+        self.groups = groups
+        self.start_ordinal = start_ordinal
+        self.values = values
+        self.first = first if first is not None else numpy.zeros(len(groups), dtype=numpy.int64)
+        self._group_index = None
+
+    @property
+    def days(self):
+        return self.values.shape[1]
+
+    @staticmethod
+    def from_records(data, group_id_field, value_field, date_field, date_format='%Y%m%d', start_date=None, end_date=None,
+                     none_value=0, aggregate='sum', none_as_value=True):
+        """
+        Builds the matrix of daily values for each group.
+        :param data: A list of records in the form [{group_field: group_id, value_field: value, date_field: date}, ...]
+        :type data: list
+        :param group_id_field: The name of the field containing the group ids.  If None, all records are in a single group, with an id of None.
+        :type group_id_field: str
+        :param value_field: The name of the field containing the values.
+        :type value_field: str
+        :param date_field: The name of the field containing the date values
+        :type date_field: str
+        :param date_format: If the date values in the data are date strings, set this parameter to the date format string.
+        :type date_format: str
+        :param start_date: Optional.  Records before this date are ignored and all groups start at this date.  If None,
+        each group starts at its first date.
+        :type start_date: datetime.date
+        :param end_date: Optional.  Records after this date are ignored and the matrix ends at this date.  If None, the
+        matrix ends at the last date found.
+        :type end_date: datetime.date
+        :param none_value: The value of days without a record, and of None values where none_as_value is True.
+        :type none_value: float
+        :param aggregate: 'sum' adds the values of records for the same group and date, 'last' uses the last value found.
+        :type aggregate: str
+        :param none_as_value: If True, None values are replaced with the none_value.
+        :type none_as_value: bool
+        :return:
+        :rtype: DailyMatrix
+        """
+        low = start_date.toordinal() if start_date else datetime.date.min.toordinal()
+        high = end_date.toordinal() if end_date else datetime.date.max.toordinal()
+
+        # dates are converted once for each distinct value.
+        ordinals = {}
+        group_index = {}
+        groups = []
+        rows = []
+        columns = []
+        values = []
+        for item in data:
+            date_value = item[date_field]
+            ordinal = ordinals.get(date_value, None)
+            if ordinal is None:
+                ordinal = datetime_utils.to_date(date_value, date_format).toordinal()
+                ordinals[date_value] = ordinal
+            if not low <= ordinal <= high:
+                continue
+
+            group = item[group_id_field] if group_id_field else None
+            row = group_index.get(group, None)
+            if row is None:
+                row = len(groups)
+                group_index[group] = row
+                groups.append(group)
+
+            rows.append(row)
+            columns.append(ordinal)
+            values.append(item[value_field])
+
+        return DailyMatrix.from_cells(groups, rows, columns, values, start_date=start_date, end_date=end_date,
+                                      none_value=none_value, aggregate=aggregate, none_as_value=none_as_value)
+
+    @staticmethod
+    def from_cells(groups, rows, ordinals, values, start_date=None, end_date=None, none_value=0, aggregate='sum',
+                   none_as_value=True):
+        """
+        Builds the matrix of daily values for each group from values that have already been indexed by group and date.
+        See from_records for the other arguments.
+        :param groups: The group ids.
+        :type groups: list
+        :param rows: The index of the group of each value.
+        :type rows: list
+        :param ordinals: The date ordinal of each value.
+        :type ordinals: list
+        :param values: The values.
+        :type values: list
+        :return:
+        :rtype: DailyMatrix
+        """
+        start_ordinal = start_date.toordinal() if start_date else None
+        end_ordinal = end_date.toordinal() if end_date else None
+
+        rows = numpy.array(rows, dtype=numpy.int64)
+        columns = numpy.array(ordinals, dtype=numpy.int64)
+        if start_ordinal is not None or end_ordinal is not None:
+            keep = numpy.ones(len(columns), dtype=bool)
+            if start_ordinal is not None:
+                keep &= columns >= start_ordinal
+            if end_ordinal is not None:
+                keep &= columns <= end_ordinal
+            if not keep.all():
+                rows = rows[keep]
+                columns = columns[keep]
+                values = [value for value, kept in zip(values, keep.tolist()) if kept]
+
+        if none_as_value:
+            values = [none_value if value is None else value for value in values]
+
+        if not values:
+            return DailyMatrix(groups=[], start_ordinal=start_ordinal or 0, values=numpy.zeros((0, 0), dtype=numpy.int64))
+
+        # groups without values in the date range are not included.
+        used = numpy.zeros(len(groups), dtype=bool)
+        used[rows] = True
+        if not used.all():
+            groups = [group for group, group_used in zip(groups, used.tolist()) if group_used]
+            rows = (numpy.cumsum(used) - 1)[rows]
+
+        if start_ordinal is None:
+            start_ordinal = int(columns.min())
+        if end_ordinal is None:
+            end_ordinal = int(columns.max())
+
+        columns = columns - start_ordinal
+        days = max(end_ordinal - start_ordinal + 1, 0)
+        dtype = _value_dtype(values, none_value)
+
+        if aggregate == 'sum':
+            sums = numpy.zeros((len(groups), days), dtype=dtype)
+            numpy.add.at(sums, (rows, columns), numpy.array(values, dtype=dtype))
+        elif aggregate == 'last':
+            # assign through a dictionary so the last value found for each cell is used.
+            cells = dict(zip(zip(rows.tolist(), columns.tolist()), values))
+            sums = numpy.zeros((len(groups), days), dtype=dtype)
+            cell_rows, cell_columns = zip(*cells.keys())
+            sums[list(cell_rows), list(cell_columns)] = numpy.array(list(cells.values()), dtype=dtype)
+        else:
+            raise ValueError('Unhandled aggregate: {}'.format(aggregate))
+
+        present = numpy.zeros((len(groups), days), dtype=bool)
+        present[rows, columns] = True
+        matrix = numpy.where(present, sums, numpy.array(none_value, dtype=dtype)).astype(dtype)
+
+        if start_date:
+            first = numpy.zeros(len(groups), dtype=numpy.int64)
+        else:
+            first = numpy.full(len(groups), days, dtype=numpy.int64)
+            numpy.minimum.at(first, rows, columns)
+            # days before the first date of a group are outside the group's results.
+            matrix[numpy.arange(days)[None, :] < first[:, None]] = 0
+
+        return DailyMatrix(groups=groups, start_ordinal=start_ordinal, values=matrix, first=first)
+
+    def with_values(self, values):
+        """Returns a matrix with the same groups, dates and first columns and new values."""
+        return DailyMatrix(groups=self.groups, start_ordinal=self.start_ordinal, values=values, first=self.first)
+
+    def cumulative(self):
+        """
+        Returns the running total of the daily values for each group.
+        :rtype: DailyMatrix
+        """
+        return self.with_values(numpy.cumsum(self.values, axis=1, dtype=self.values.dtype))
+
+    def rolling_sums(self, intervals):
+        """
+        Returns the sum of the values for the past n days, for each interval.  Each sum is the difference between two
+        running totals, so the cost of each day does not depend on the interval.  Days before the first column of a
+        group are 0, so the windows at the start of a group only include the group's own days.
+        Floating point sums may differ from a direct sum of the window values in the last few bits.
+        :param intervals: The window lengths in days.  eg: [7, 14]
+        :type intervals: list
+        :return: {n: DailyMatrix}
+        :rtype: dict
+        """
+        groups, days = self.values.shape
+        totals = numpy.zeros((groups, days + 1), dtype=self.values.dtype)
+        numpy.cumsum(self.values, axis=1, out=totals[:, 1:])
+
+        ends = numpy.arange(1, days + 1)
+        result = {}
+        for n in intervals:
+            if n < 1:
+                raise ValueError('Invalid interval: {}'.format(n))
+            starts = numpy.maximum(ends - n, 0)
+            result[n] = self.with_values(totals[:, ends] - totals[:, starts])
+        return result
+
+    def rolling_means(self, intervals):
+        """
+        Returns the average value for the past n days, for each interval.  Sums are always divided by n, including the
+        first days of each group.  See rolling_sums.
+        :param intervals: The window lengths in days.  eg: [7, 14]
+        :type intervals: list
+        :return: {n: DailyMatrix}
+        :rtype: dict
+        """
+        return {n: sums.with_values(sums.values / float(n)) for n, sums in self.rolling_sums(intervals).items()}
+
+    def date_codes(self, date_format='%Y%m%d'):
+        """Returns the formatted date of each column."""
+        return [datetime.date.fromordinal(self.start_ordinal + i).strftime(date_format) for i in range(self.days)]
+
+    def date(self, column):
+        return datetime.date.fromordinal(self.start_ordinal + column)
+
+    def row(self, group):
+        if self._group_index is None:
+            self._group_index = {group_id: i for i, group_id in enumerate(self.groups)}
+        return self._group_index.get(group, None)
+
+    def get(self, group, date, default=None):
+        """
+        Returns the value for a group and date, or the default if the date is outside the group's results.
+        :rtype:
+        """
+        row = self.row(group)
+        if row is None:
+            return default
+        column = date.toordinal() - self.start_ordinal
+        if column < self.first[row] or column >= self.days:
+            return default
+        return self.values[row, column].item() if self.values.dtype != object else self.values[row, column]
+
+    def to_dict(self, date_format='%Y%m%d'):
+        """
+        Returns the results in the form {yyyymmdd_group: value}, ordered by group and date.
+        :rtype: dict
+        """
+        codes = self.date_codes(date_format)
+        result = {}
+        for row, group in enumerate(self.groups):
+            first = int(self.first[row])
+            suffix = '_{}'.format(group)
+            result.update(zip([code + suffix for code in codes[first:]], self.values[row, first:].tolist()))
+        return result
+
+    def to_date_dict(self, date_format='%Y%m%d'):
+        """
+        Returns the results of a single group matrix in the form {yyyymmdd: value}.
+        :rtype: dict
+        """
+        codes = self.date_codes(date_format)
+        result = {}
+        for row in range(len(self.groups)):
+            first = int(self.first[row])
+            result.update(zip(codes[first:], self.values[row, first:].tolist()))
+        return result
@@ -0,0 +1,187 @@
+"""
+Builds daily statistics records from a declarative list of statistics.
+Each statistic is a set of source records, the field holding the daily values and the operations to be calculated,
+each written to a target field:
+- 'new': the value of the record for the group and date.  Only set where a record exists.
+- 'cumsum': the cumulative total of the values.  See statistics.cumulative_daily_totals_by_group
+- 'rolling-n': the average value of the past n days.  eg: 'rolling-7'.  See statistics.moving_daily_averages_by_date_and_group
+The records of each statistic are read once, and all statistics share the same group and date indexes, so the dates are
+only parsed and the record ids only formatted once.
+eg:
+    builder = DailyStatisticsBuilder(group_id_field='Postcode', date_field='Date')
+    builder.add(records=case_records, value_field='Cases', operations=[('new', 'NewCases'), ('cumsum', 'TotalCases')])
+    builder.add(records=test_records, value_field='Tests', operations=[('new', 'NewTests'), ('rolling-7', 'Tests7DayAve')])
+    new_records = builder.build(create_record)
+"""
+import datetime
+
+from graphc.covid.admin.daily_matrix import DailyMatrix
+from graphc.utilities import datetime_utils
+
+NEW = 'new'
+CUMSUM = 'cumsum'
+ROLLING = 'rolling'
+
+
+def parse_operation(operation):
+    """
+    Returns the operation name and interval of an operation.  eg: 'rolling-7' returns ('rolling', 7)
+    :rtype: tuple
+    """
+    name, _, interval = operation.partition('-')
+    if name == ROLLING:
+        if not interval.isdigit() or int(interval) < 1:
+            raise ValueError('Invalid rolling interval: {}'.format(operation))
+        return name, int(interval)
+    if name in (NEW, CUMSUM) and not interval:
+        return name, None
+    raise ValueError('Unhandled operation: {}'.format(operation))
+
+
+class _Statistic(object):
+    def __init__(self, value_field, operations, end_date, end_at_last_date):
+        self.value_field = value_field
+        self.operations = [(parse_operation(operation), target_field) for operation, target_field in operations]
+        self.end_date = end_date
+        self.end_at_last_date = end_at_last_date
+
+        self.rows = []
+        self.ordinals = []
+        self.values = []
+        self.cells = {}  # {(row, ordinal): [first date value, last value]}
+        self.last_ordinal = None
+
+
+class DailyStatisticsBuilder(object):
+    def __init__(self, group_id_field, date_field, date_format='%Y%m%d'):
+        """
+        :param group_id_field: The name of the field containing the group ids in the source records.  eg: 'Postcode'
+        :type group_id_field: str
+        :param date_field: The name of the field containing the dates in the source records.
+        :type date_field: str
+        :param date_format: If the date values are date strings, the date format string.
+        :type date_format: str
+        """
+        self.group_id_field = group_id_field
+        self.date_field = date_field
+        self.date_format = date_format
+
+        self.groups = []
+        self._group_index = {}
+        self._ordinals = {}  # {date value: date ordinal}
+        self._statistics = []
+
+    def add(self, records, value_field, operations, end_date=None, end_at_last_date=False):
+        """
+        Adds a statistic.  The records are read when added.
+        :param records: The source records.  [{group_id_field: group_id, date_field: date, value_field: value}, ...]
+        :type records: list
+        :param value_field: The name of the field containing the daily values.
+        :type value_field: str
+        :param operations: The operations to be calculated and the field each is written to.  [(operation, target_field), ...]
+        Operations are applied in order.
+        :type operations: list
+        :param end_date: Optional.  The last date for which values will be calculated.  If None, cumulative totals end at
+        the current date and averages at the last date found in the records.
+        :type end_date: datetime.date
+        :param end_at_last_date: If True and no end date is defined, all values end at the last date found in the records.
+        :type end_at_last_date: bool
+        """
+        statistic = _Statistic(value_field, operations, end_date, end_at_last_date)
+        cells = statistic.cells
+        for record in records:
+            date_value = record[self.date_field]
+            ordinal = self._ordinals.get(date_value, None)
+            if ordinal is None:
+                ordinal = datetime_utils.to_date(date_value, self.date_format).toordinal()
+                self._ordinals[date_value] = ordinal
+
+            group = record[self.group_id_field]
+            row = self._group_index.get(group, None)
+            if row is None:
+                row = len(self.groups)
+                self._group_index[group] = row
+                self.groups.append(group)
+
+            value = record[value_field]
+            statistic.rows.append(row)
+            statistic.ordinals.append(ordinal)
+            statistic.values.append(value)
+
+            cell = cells.get((row, ordinal), None)
+            if cell is None:
+                cells[(row, ordinal)] = [date_value, value]
+            else:
+                cell[1] = value
+
+            if statistic.last_ordinal is None or ordinal > statistic.last_ordinal:
+                statistic.last_ordinal = ordinal
+
+        self._statistics.append(statistic)
+
+    def _end_date(self, statistic, operation):
+        if statistic.end_date:
+            return statistic.end_date
+        if statistic.last_ordinal is None:
+            return None
+        if operation == CUMSUM and not statistic.end_at_last_date:
+            return datetime.datetime.now().date()
+        return datetime.date.fromordinal(statistic.last_ordinal)
+
+    def build(self, create_record):
+        """
+        Calculates the statistics and returns the new records.
+        :param create_record: The function used to create a record for a group and date.  create_record(date, group_id)
+        The date is the date value of the first source record for the group and date, or a yyyymmdd date code where
+        the record is created for a calculated value.
+        :type create_record: function
+        :return: {yyyymmdd_group: record}
+        :rtype: dict
+        """
+        result = {}
+        date_codes = {}
+        group_codes = ['_{}'.format(group) for group in self.groups]
+
+        def get_record(row, ordinal, date_value=None):
+            date_code = date_codes.get(ordinal, None)
+            if date_code is None:
+                date_code = datetime.date.fromordinal(ordinal).strftime('%Y%m%d')
+                date_codes[ordinal] = date_code
+            key = date_code + group_codes[row]
+            record = result.get(key, None)
+            if record is None:
+                record = create_record(date_value if date_value is not None else date_code, self.groups[row])
+                result[key] = record
+            return record
+
+        for statistic in self._statistics:
+            intervals = [interval for (name, interval), _ in statistic.operations if name == ROLLING]
+            averages = None
+            for (name, interval), target_field in statistic.operations:
+                if name == NEW:
+                    for (row, ordinal), (date_value, value) in statistic.cells.items():
+                        get_record(row, ordinal, date_value)[target_field] = value
+                    continue
+
+                if name == CUMSUM:
+                    daily = DailyMatrix.from_cells(self.groups, statistic.rows, statistic.ordinals, statistic.values,
+                                                   end_date=self._end_date(statistic, CUMSUM))
+                    values = daily.cumulative()
+                else:
+                    if averages is None:
+                        # the last value found is used, and all intervals are calculated together.
+                        daily = DailyMatrix.from_cells(self.groups, statistic.rows, statistic.ordinals, statistic.values,
+                                                       end_date=self._end_date(statistic, ROLLING), aggregate='last',
+                                                       none_as_value=False)
+                        averages = daily.rolling_means(intervals)
+                    values = averages[interval]
+
+                for matrix_row, group in enumerate(values.groups):
+                    row = self._group_index[group]
+                    first = int(values.first[matrix_row])
+                    ordinal = values.start_ordinal + first
+                    for value in values.values[matrix_row, first:].tolist():
+                        get_record(row, ordinal)[target_field] = value
+                        ordinal += 1
+
+        return result
@@ -1,4 +1,5 @@
 import datetime
+from graphc.covid.admin.daily_matrix import DailyMatrix
 from graphc.utilities import datetime_utils
 
 
@@ -81,7 +82,8 @@ def cumulative_daily_totals_by_group(data,
                                      date_format='%Y%m%d',
                                      start_date: datetime.date = None,
                                      end_date: datetime.date = None,
-                                     none_value=0):
+                                     none_value=0,
+                                     as_array=False):
     """
     For each group found, for each date, calculates the sum of all previous dates for that group.
     :param data: A list of records in the form [{group_field: group_id, value_field: value, date_field: date}, ...]
@@ -103,8 +105,10 @@ def cumulative_daily_totals_by_group(data,
     :param none_value: The value to be used if no record is found for a specific date/region, or if the value in a data record is None.
     The default value is 0
     :type none_value: float
-    :return: {yyyymmdd_group: avg}
-    :rtype:
+    :param as_array: If True, the totals are returned as a DailyMatrix of groups by dates, rather than a dictionary.
+    :type as_array: bool
+    :return: {yyyymmdd_group: total}
+    :rtype: dict
     """
     # calculate start and end dates
     if not start_date:
@@ -120,45 +124,15 @@ def cumulative_daily_totals_by_group(data,
     if none_value is None:
         none_value = 0
 
-    # extract relevant data and separate into groups
-    group_data = {}
-    for item in data:
-        date_value = datetime_utils.to_date(item[date_field], date_format)
-
-        if start_date <= date_value <= end_date:
-            group = item[group_id_field]
-
-            stat_value = item[value_field]
-            if stat_value is None:
-                stat_value = none_value
-
-            # separate items into groups
-            group_values = group_data.get(group, None)
-            if not group_values:
-                group_values = {}
-                group_data[group] = group_values
-            group_values[date_value] = group_values.get(date_value, 0) + stat_value
+    # if the start date was defined, all groups start at that date, otherwise at the first date in each group.
+    daily = DailyMatrix.from_records(data, group_id_field, value_field, date_field, date_format=date_format,
+                                     start_date=start_date if start_date > datetime.date.min else None,
+                                     end_date=end_date, none_value=none_value)
+    totals = daily.cumulative()
+    if as_array:
+        return totals
 
-    # calculate cumulative daily totals
-    result = {}
-    for group, group_values in group_data.items():
-        # if the start date was defined, use that date, otherwise use the first date in the group.
-        if start_date > datetime.date.min:
-            group_date = start_date
-        else:
-            group_date = min(group_values.keys())
-
-        step = datetime.timedelta(days=1)
-
-        total = 0
-        while group_date <= end_date:
-            total += group_values.get(group_date, none_value)
-            key = '{}_{}'.format(group_date.strftime('%Y%m%d'), group)
-            result[key] = total
-
-            group_date += step
-
-    return result
+    return totals.to_dict()
 
 
 def moving_daily_averages(data,
@@ -190,36 +164,17 @@ def moving_daily_averages(data,
     :rtype:
     """
 
-    wkg = {}
-    for item in data:
-        date_value = datetime_utils.to_datetime(item[date_field], date_format)
-        date_code = date_value.strftime('%Y%m%d')
-        value = item[value_field]
-        if value is None:
-            value = none_value
-
-        wkg[date_code] = wkg.get(date_code, 0) + value
-
-    # calculate start and end dates
-    start_date = datetime_utils.to_datetime(min(wkg.keys()), '%Y%m%d')
+    if none_value is None:
+        none_value = 0
 
     if end_date:
-        end_date = datetime_utils.to_datetime(end_date, date_format)
+        end_date = datetime_utils.to_date(end_date, date_format)
     else:
-        end_date = datetime.datetime.now()
-
-    result = {}
-    value_list = []
-    while start_date <= end_date:
-        date_code = start_date.strftime('%Y%m%d')
-        value_list.append(wkg.get(date_code, none_value))
-        if len(value_list) > n:
-            value_list.pop(0)
-        ave = sum(value_list) / float(n)
-        result[date_code] = ave
-        start_date += datetime.timedelta(days=1)
+        end_date = datetime.datetime.now().date()
 
-    return result
+    daily = DailyMatrix.from_records(data, None, value_field, date_field, date_format=date_format, end_date=end_date,
+                                     none_value=none_value)
+    return daily.rolling_means([n])[n].to_date_dict()
 
 
 def moving_daily_averages_by_date_and_group(data,
@@ -254,6 +209,53 @@ def moving_daily_averages_by_date_and_group(data,
     :rtype:
     """
 
+    intervals = moving_daily_averages_by_interval(data=data,
+                                                  group_id_field=group_id_field,
+                                                  value_field=value_field,
+                                                  date_field=date_field,
+                                                  intervals=[n],
+                                                  date_format=date_format,
+                                                  end_date=end_date,
+                                                  none_value=none_value)
+    return intervals[n]
+
+
+def moving_daily_averages_by_interval(data,
+                                      group_id_field,
+                                      value_field,
+                                      date_field,
+                                      intervals=(7, 14),
+                                      date_format='%Y%m%d',
+                                      end_date=None,
+                                      none_value=0,
+                                      as_array=False):
+    """
+    Calculates the moving daily averages by date and group for several intervals from a single pass through the data.
+    See moving_daily_averages_by_date_and_group.
+    :param data: A list of records in the form [{group_field: group_id, value_field: value, date_field: date}, ...]
+    :type data: list
+    :param group_id_field: The name of the field containing the group ids used to link group records.  For example, 'postcode'
+    :type group_id_field: str
+    :param value_field: The name of the field containing the values to be averaged.
+    :type value_field: str
+    :param date_field: The name of the field containing the date values
+    :type date_field: str
+    :param intervals: The numbers of days to be averaged.
+    :type intervals: list
+    :param date_format: If the date values in the data are date strings, set this parameter to the date format string (eg: '%Y%m%d').
+    Default is '%Y%m%d'
+    :type date_format: str
+    :param end_date: The optional last date for which values will be calculated.  If not defined, the maximum date value in the data will be used.
+    :type end_date: datetime
+    :param none_value: The value to be used if no record is found for a specific date/region.
+    The default value is 0
+    :type none_value: float
+    :param as_array: If True, the averages for each interval are returned as a DailyMatrix of groups by dates, rather than a dictionary.
+    :type as_array: bool
+    :return: {n: {yyyymmdd_group: avg}}
+    :rtype: dict
+    """
+
     # If an end date is provided, use that, otherwise use the most recent date in the dataset.
     finish_date = end_date
     if finish_date:
@@ -262,37 +264,14 @@ def moving_daily_averages_by_date_and_group(data,
     else:
         finish_date = datetime_utils.to_date(max([item[date_field] for item in data]), date_format)
 
-    wkg = {}
-    for item in data:
-        group = item[group_id_field]
-        date_value = datetime_utils.to_date(item[date_field], date_format)
-        value = item[value_field]
-
-        group_item = wkg.get(group, None)
-        if not group_item:
-            group_item = {'start_date': date_value, 'values': {date_value: value}}
-            wkg[group] = group_item
-        else:
-            group_item['values'][date_value] = value
-            if group_item['start_date'] > date_value:
-                group_item['start_date'] = date_value
+    # the last value found for each group and date is used.
+    daily = DailyMatrix.from_records(data, group_id_field, value_field, date_field, date_format=date_format,
+                                     end_date=finish_date, none_value=none_value, aggregate='last', none_as_value=False)
+    averages = daily.rolling_means(intervals)
+    if as_array:
+        return averages
 
-    result = {}
-    for group, item in wkg.items():
-        group_list = []
-        start_date = item['start_date']
-        group_values = item['values']
-
-        while start_date <= finish_date:
-            group_list.append(group_values.get(start_date, none_value))
-            if len(group_list) > n:
-                group_list.pop(0)
-            ave = sum(group_list) / float(n)
-            key = '{}_{}'.format(start_date.strftime('%Y%m%d'), group)
-            result[key] = ave
-            start_date += datetime.timedelta(days=1)
-
-    return result
+    return {n: values.to_dict() for n, values in averages.items()}
 
 
 def totals_by_group(data, group_id_field, value_field):
@@ -0,0 +1,249 @@
+"""
+A persisted store of the state of cumulative daily totals, so each run only calculates the days that have changed.
+For each group the store keeps the last date calculated, the total on that date, a checksum of the daily values, and
+the daily values of the last few days (the window).  When the records are read again, the values on or before the last
+date are checked against the store:
+- values within the window that differ mark the first changed date of the group,
+- values before the window that differ (found by the checksum) mark the whole group as changed,
+- otherwise only the days after the last date are new.
+Totals are then only calculated from the earliest changed date, starting from the sum of the values before that date,
+and the caller only needs to update the target rows on or after that date.
+Days without records add 0 to the totals.
+"""
+import datetime
+import json
+import logging
+import os
+
+import numpy
+
+from graphc.covid.admin.daily_matrix import DailyMatrix
+from graphc.utilities import datetime_utils
+
+
+class CumulativeTotalsStore(object):
+    def __init__(self, path=None, window=14):
+        """
+        :param path: Optional.  The json file used to persist the store.  If the file exists it is loaded.  The store is
+        only saved when save is called, so the caller can save it once the totals have been applied.
+        :type path: str
+        :param window: The number of days of daily values kept for each group.  Changes within the window are found by
+        date; changes before the window cause the group to be recalculated in full.
+        :type window: int
+        """
+        self.path = path
+        self.window = window
+        self.changed = {}  # {group: first changed date} from the last update
+
+        # {group: {'start': ordinal, 'end': ordinal, 'total': value, 'moment': value, 'tail': [values]}}
+        self._groups = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __contains__(self, group):
+        return group in self._groups
+
+    def update(self, data, group_id_field, value_field, date_field, date_format='%Y%m%d', end_date=None):
+        """
+        Finds the earliest date changed since the last update and returns the cumulative totals of every group from that
+        date.  The totals are the same as those returned by statistics.cumulative_daily_totals_by_group for those dates.
+        The store holds the new state once updated, but is not saved.
+        :param data: A list of records in the form [{group_field: group_id, value_field: value, date_field: date}, ...]
+        :type data: list
+        :param group_id_field: The name of the field containing the group ids.
+        :type group_id_field: str
+        :param value_field: The name of the field containing the values.  None values are 0.
+        :type value_field: str
+        :param date_field: The name of the field containing the date values
+        :type date_field: str
+        :param date_format: If the date values in the data are date strings, the date format string.
+        :type date_format: str
+        :param end_date: Optional.  The last date for which totals will be calculated.  If None, the current date is used.
+        :type end_date: datetime.date
+        :return: (first changed date, totals from that date).  If nothing has changed, (None, None) is returned.
+        :rtype: tuple
+        """
+        if end_date is None:
+            end_date = datetime.datetime.now().date()
+        end = end_date.toordinal()
+
+        # index the records.  The values are only summed from here.
+        ordinals = {}
+        group_index = {}
+        groups = []
+        rows = []
+        columns = []
+        values = []
+        for item in data:
+            date_value = item[date_field]
+            ordinal = ordinals.get(date_value, None)
+            if ordinal is None:
+                ordinal = datetime_utils.to_date(date_value, date_format).toordinal()
+                ordinals[date_value] = ordinal
+            if ordinal > end:
+                continue
+
+            group = item[group_id_field]
+            row = group_index.get(group, None)
+            if row is None:
+                row = len(groups)
+                group_index[group] = row
+                groups.append(group)
+
+            rows.append(row)
+            columns.append(ordinal)
+            values.append(item[value_field] or 0)
+
+        dtype = numpy.int64 if all(isinstance(value, int) for value in values) else numpy.float64
+        rows = numpy.array(rows, dtype=numpy.int64)
+        columns = numpy.array(columns, dtype=numpy.int64)
+        values = numpy.array(values, dtype=dtype)
+
+        starts = numpy.full(len(groups), end + 1, dtype=numpy.int64)
+        numpy.minimum.at(starts, rows, columns)
+
+        # the first changed date of each group, including groups no longer found.  The values are sorted by group once
+        # so each group is compared from a slice.
+        order = numpy.argsort(rows, kind='stable')
+        bounds = numpy.searchsorted(rows[order], numpy.arange(len(groups) + 1))
+        sorted_columns = columns[order]
+        sorted_values = values[order]
+        self.changed = {}
+        for row, group in enumerate(groups):
+            in_group = slice(bounds[row], bounds[row + 1])
+            changed = self._first_change(group, int(starts[row]), sorted_columns[in_group], sorted_values[in_group], end)
+            if changed is not None:
+                self.changed[group] = changed
+        for group, state in self._groups.items():
+            if group not in group_index:
+                self.changed[group] = state['start']
+
+        if not self.changed:
+            logging.debug('Cumulative totals unchanged')
+            return None, None
+
+        first = min(self.changed.values())
+        self.changed = {group: datetime.date.fromordinal(ordinal) for group, ordinal in self.changed.items()}
+        totals = self._totals(groups, starts, rows, columns, values, first, end)
+        self._update_state(groups, starts, rows, columns, values, end, totals)
+        logging.debug('Cumulative totals calculated from {} for {} of {} groups'.format(datetime.date.fromordinal(first),
+                                                                                        len(self.changed), len(groups)))
+        return datetime.date.fromordinal(first), totals
+
+    def _first_change(self, group, start, group_columns, group_values, end):
+        """
+        Returns the ordinal of the first changed date of a group, or None if the group is unchanged.
+        """
+        state = self._groups.get(group, None)
+        if state is None:
+            return start
+        if state['start'] != start:
+            return min(state['start'], start)
+
+        stored_end = state['end']
+        tail_start = stored_end - len(state['tail']) + 1
+
+        # values before the window are compared by their sum and moment.
+        before = group_columns < tail_start
+        stored_dtype = numpy.float64 if any(isinstance(value, float) for value in state['tail']) else group_values.dtype
+        stored_tail = numpy.array(state['tail'], dtype=stored_dtype)
+        tail_offsets = numpy.arange(tail_start, stored_end + 1) - start
+        before_total = state['total'] - stored_tail.sum()
+        before_moment = state['moment'] - (stored_tail * tail_offsets).sum()
+        if not _equal(group_values[before].sum(), before_total) or \
+                not _equal((group_values[before] * (group_columns[before] - start)).sum(), before_moment):
+            return start
+
+        # values within the window are compared by date.
+        tail = numpy.zeros(len(stored_tail), dtype=group_values.dtype)
+        in_tail = (group_columns >= tail_start) & (group_columns <= stored_end)
+        numpy.add.at(tail, group_columns[in_tail] - tail_start, group_values[in_tail])
+        differences = numpy.flatnonzero(tail != stored_tail)
+        if len(differences):
+            return tail_start + int(differences[0])
+
+        if stored_end < end:
+            return stored_end + 1
+        return None
+
+    @staticmethod
+    def _totals(groups, starts, rows, columns, values, first, end):
+        """
+        Returns the cumulative totals of each group from the first date to the end date.
+        """
+        days = end - first + 1
+        before = columns < first
+        base = numpy.zeros(len(groups), dtype=values.dtype)
+        numpy.add.at(base, rows[before], values[before])
+
+        daily = numpy.zeros((len(groups), days), dtype=values.dtype)
+        numpy.add.at(daily, (rows[~before], columns[~before] - first), values[~before])
+        totals = numpy.cumsum(daily, axis=1, dtype=values.dtype) + base[:, None]
+
+        # each group starts at its own first date.
+        group_first = numpy.maximum(starts - first, 0)
+        totals[numpy.arange(days)[None, :] < group_first[:, None]] = 0
+        return DailyMatrix(groups=list(groups), start_ordinal=first, values=totals, first=group_first)
+
+    def _update_state(self, groups, starts, rows, columns, values, end, totals):
+        moments = numpy.zeros(len(groups), dtype=values.dtype)
+        numpy.add.at(moments, rows, values * (columns - starts[rows]))
+
+        tail_start = max(end - self.window + 1, 0)
+        in_tail = columns >= tail_start
+        tails = numpy.zeros((len(groups), self.window), dtype=values.dtype)
+        numpy.add.at(tails, (rows[in_tail], columns[in_tail] - tail_start), values[in_tail])
+
+        groups_state = {}
+        for row, group in enumerate(groups):
+            start = int(starts[row])
+            groups_state[group] = {'start': start,
+                                   'end': end,
+                                   'total': totals.values[row, -1].item(),
+                                   'moment': moments[row].item(),
+                                   'tail': tails[row, max(start - tail_start, 0):].tolist()}
+        self._groups = groups_state
+
+    def save(self, path=None):
+        """
+        Saves the store as json.  The file is written to a temporary file and then replaced, so an interrupted save does
+        not corrupt the existing store.
+        :param path: Optional.  The json file.  If None, the store path is used.
+        :type path: str
+        """
+        path = path or self.path
+        content = {'window': self.window,
+                   'groups': [[group, state['start'], state['end'], state['total'], state['moment'], state['tail']]
+                              for group, state in self._groups.items()]}
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(content, f)
+        os.replace(temp_path, path)
+
+    def load(self, path=None):
+        """
+        Loads the store from json.
+        :param path: Optional.  The json file.  If None, the store path is used.
+        :type path: str
+        """
+        path = path or self.path
+        with open(path, 'r') as f:
+            content = json.load(f)
+
+        self.window = content['window']
+        self._groups = {group: {'start': start, 'end': end, 'total': total, 'moment': moment, 'tail': tail}
+                        for group, start, end, total, moment, tail in content['groups']}
+
+    def clear(self):
+        self._groups = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _equal(value, stored):
+    if isinstance(stored, float) or isinstance(value, numpy.floating):
+        return abs(float(value) - float(stored)) <= 1e-9 * max(1.0, abs(float(stored)))
+    return int(value) == int(stored)
@@ -1,19 +1,24 @@
 import arcpy
-import json
 import arcgis
 import datetime
 
+from graphc.da import geometry_json_cache
 
-def geometry_to_json(geometry: arcpy.Geometry):
+
+def geometry_to_json(geometry: arcpy.Geometry, key=None):
     """
     Converts an arcpy Geometry class from a local or enterprise feature class to a json object that can be submitted to an ArcGIS Online API
+    Each geometry is converted once, and the same (read only) dictionary is returned for later calls.  See graphc.da.geometry_json_cache
     :param geometry: The geometry to be converted.
     :type geometry: arcpy.Geometry
+    :param key: Optional.  An id for the geometry, qualified by its source, used to find the converted geometry.
+    eg: ('postcode_points', '2000')
+    :type key:
     :return: a dictionary representation of the geometry suitable for submission to a rest endpoint update, add or edit function.
     :rtype: dict
     """
     if geometry:
-        return json.loads(geometry.JSON)
+        return geometry_json_cache.default_cache.to_json(geometry, key)
     else:
         return None
 
@@ -2,10 +2,12 @@ import datetime
 import logging
 import argparse
 import sys
-import copy
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
+
+from graphc.da import da_agol
+from graphc.da import layer_pool
+from graphc.da.diff_engine import RecordDiff
 
 from graphc.covid.layers.Covid19NotificationsByDateAndPostcode import Covid19NotificationsByDateAndPostcode
 
@@ -25,10 +27,10 @@ class Covid19CaseLocationsByPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
-        return self.layer().query(where=where_clause)
+        return da_agol.query_pages(self.layer(), where=where_clause)
 
     def update(self, update_values):
         """
@@ -45,45 +47,34 @@ class Covid19CaseLocationsByPostcode(object):
         :rtype:
         """
 
-        copied_values = copy.deepcopy(update_values)
-        deletes = []
-        adds = []
+        diff = RecordDiff(update_values)
         target_layer = self.layer()
-        query_result = target_layer.query()
+        query_result = da_agol.query_pages(target_layer)
         for row in query_result:
             key = '{}_{}'.format(row.attributes[self.date_string_field], row.attributes[self.postcode_field])
-            update_item = copied_values.get(key, None)
-            if update_item:
-                # if an update item was found, subtract 1 from the notifications total.
-                update_item['notifications'] -= 1
-                if update_item['notifications'] < 1:
-                    # If the new notifications total is less than 1, then this was the last notification for the postcode/date.
-                    # Remove the postcode/date item from the collection of update items so any additional records associated with
-                    # this date/postcode combo will be deleted from the online data.
-                    copied_values.pop(key, None)
-            else:
+            # each existing row claims one of the notifications for its date/postcode.  Once all notifications for the
+            # date/postcode have been claimed, any additional records associated with this date/postcode combo are deleted.
+            if not diff.claim(key, 'notifications'):
                 # if no matching update item was found, delete the record from online.
-                deletes.append(row.attributes[query_result.object_id_field_name])
+                diff.deletes.append(row.attributes[query_result.object_id_field_name])
 
         # any remaining data_models items are new records
-        adds = []
-
-        for key, new_item in copied_values.items():
+        for key, new_item in diff.unmatched():
             date_code, postcode = key.split('_')
             date = datetime.datetime.strptime(date_code, '%Y%m%d')
-            for i in range(new_item['notifications']):
+            for i in range(diff.remaining(key, 'notifications')):
                 row = {"attributes":
                            {self.date_string_field: date_code,
                             self.date_field: date,
                             self.postcode_field: postcode.upper()},
                        "geometry": new_item['xy']}
-                adds.append(row)
+                diff.adds.append(row)
 
         logging.info('Updating: {}'.format(self.service_url))
-        logging.info('ADDS: {}'.format(len(adds)))
-        logging.info('DELETES: {}'.format(len(deletes)))
-        if adds or deletes:
-            return target_layer.edit_features(adds=adds, deletes=str(deletes))
+        logging.info('ADDS: {}'.format(len(diff.adds)))
+        logging.info('DELETES: {}'.format(len(diff.deletes)))
+        if diff.adds or diff.deletes:
+            return target_layer.edit_features(adds=diff.adds, deletes=str(diff.deletes))
         else:
             return None
 
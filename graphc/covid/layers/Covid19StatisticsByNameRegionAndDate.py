@@ -2,12 +2,13 @@ import datetime
 import logging
 import argparse
 import sys
-import copy
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 
 from graphc.da import da_agol
+from graphc.da import layer_pool
+from graphc.da.diff_engine import RecordDiff
+from graphc.da.projection import QueryProjection
 from graphc.da import da_arcpy
 from graphc.covid.source.NSW_SourceData import NswNotificationData, NswTestData
 from graphc.data.abs2016 import POA2016
@@ -42,7 +43,7 @@ class StatisticsByNameRegionAndDateCode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def get_statistic_items(self, statistic_name, include_geometry=True):
         """
@@ -58,7 +59,7 @@ class StatisticsByNameRegionAndDateCode(object):
         result = []
         target_layer = self.layer()
         where_clause = "{} = '{}'".format(self.statistic_field, statistic_name.upper())
-        query_result = target_layer.query(where=where_clause)
+        query_result = da_agol.query_pages(target_layer, where=where_clause)
         for row in query_result:
             item = {self.region_id_field: row.attributes[self.region_id_field],
                     self.date_code_field: row.attributes[self.date_code_field],
@@ -92,27 +93,31 @@ class StatisticsByNameRegionAndDateCode(object):
 
         uc_statistic_name = statistic_name.upper()
         logging.info('Updating Statistics: {}'.format(uc_statistic_name))
-        copied_values = copy.deepcopy(update_values)
-        deletes = []
-        updates = []
+        diff = RecordDiff(update_values)
         target_layer = self.layer()
         where_clause = "{} = '{}'".format(self.statistic_field, uc_statistic_name)
-        query_result = target_layer.query(where=where_clause)
-        for row in query_result:
-            key = '{}_{}'.format(row.attributes[self.date_code_field], row.attributes[self.region_id_field])
-            if key not in copied_values:
-                deletes.append(row.attributes[query_result.object_id_field_name])
-
-            item = copied_values.pop(key, None)
-            if item:
-                if row.attributes[self.value_field] != item['value']:
-                    row.attributes[self.value_field] = item['value']
-                    updates.append(row)
+        projection = QueryProjection.for_diff(target_layer, key_fields=[self.date_code_field, self.region_id_field],
+                                              compared_fields=[self.value_field], ids_only=not update_values)
+        query_result = projection.query(target_layer, where_clause=where_clause)
+        if projection.ids_only:
+            # no values remain for the statistic, so every row is deleted.
+            diff.deletes.extend(query_result)
+            row_count = len(query_result)
+        else:
+            for row in query_result:
+                key = '{}_{}'.format(row.attributes[self.date_code_field], row.attributes[self.region_id_field])
+                if not diff.available(key):
+                    diff.deletes.append(row.attributes[query_result.object_id_field_name])
+
+                item = diff.match(key)
+                if item:
+                    if row.attributes[self.value_field] != item['value']:
+                        row.attributes[self.value_field] = item['value']
+                        diff.updates.append(row)
+            row_count = len(query_result.features)
 
         # any remaining data_models items are new records
-        adds = []
-
-        for key, new_item in copied_values.items():
+        for key, new_item in diff.unmatched():
             date_code, region = key.split('_')
             date = datetime.datetime.strptime(date_code, '%Y%m%d')
             row = {"attributes":
@@ -122,9 +127,11 @@ class StatisticsByNameRegionAndDateCode(object):
                         self.value_field: new_item['value'],
                         self.date_field: date},
                    "geometry": new_item['geometry']}
-            adds.append(row)
+            diff.adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates, chunk_size=10000)
+        result = da_agol.update_layer(layer=target_layer, adds=diff.adds, deletes=diff.deletes, updates=diff.updates, chunk_size=10000)
+        result['projection'] = projection.report(row_count)
+        return result
 
 
 
@@ -147,7 +154,7 @@ class NamedStatisticsByRegionAndDate(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query_statistic(self, where_clause=None):
         """
@@ -163,7 +170,7 @@ class NamedStatisticsByRegionAndDate(object):
         if where_clause:
             full_where_clause += " AND " + where_clause
 
-        return self.layer().query(where=full_where_clause)
+        return da_agol.query_pages(self.layer(), where=full_where_clause)
 
     def update_statistic(self, update_values, allow_deletes=False):
         """
@@ -185,27 +192,31 @@ class NamedStatisticsByRegionAndDate(object):
         """
 
         logging.info('Updating Statistics: {}'.format(self.statistic_name))
-        copied_values = copy.deepcopy(update_values)
-        deletes = []
-        updates = []
+        diff = RecordDiff(update_values)
         target_layer = self.layer()
         where_clause = "Statistic = '{}'".format(self.statistic_name)
-        query_result = target_layer.query(where=where_clause)
-        for row in query_result:
-            key = '{}_{}'.format(row.attributes[self.date_code_field], row.attributes[self.region_id_field])
-            if allow_deletes and key not in copied_values:
-                deletes.append(row.attributes[query_result.object_id_field_name])
-
-            item = copied_values.pop(key, None)
-            if item:
-                if row.attributes[self.value_field] != item['value']:
-                    row.attributes[self.value_field] = item['value']
-                    updates.append(row)
+        projection = QueryProjection.for_diff(target_layer, key_fields=[self.date_code_field, self.region_id_field],
+                                              compared_fields=[self.value_field], ids_only=allow_deletes and not update_values)
+        query_result = projection.query(target_layer, where_clause=where_clause)
+        if projection.ids_only:
+            # no values were submitted, so every row is deleted.
+            diff.deletes.extend(query_result)
+            row_count = len(query_result)
+        else:
+            for row in query_result:
+                key = '{}_{}'.format(row.attributes[self.date_code_field], row.attributes[self.region_id_field])
+                if allow_deletes and not diff.available(key):
+                    diff.deletes.append(row.attributes[query_result.object_id_field_name])
+
+                item = diff.match(key)
+                if item:
+                    if row.attributes[self.value_field] != item['value']:
+                        row.attributes[self.value_field] = item['value']
+                        diff.updates.append(row)
+            row_count = len(query_result.features)
 
         # any remaining data_models items are new records
-        adds = []
-
-        for key, new_item in copied_values.items():
+        for key, new_item in diff.unmatched():
             date_code, region = key.split('_')
             date = datetime.datetime.strptime(date_code, '%Y%m%d')
             row = {"attributes":
@@ -215,9 +226,11 @@ class NamedStatisticsByRegionAndDate(object):
                         self.value_field: new_item['value'],
                         self.date_field: date},
                    "geometry": new_item['geometry']}
-            adds.append(row)
+            diff.adds.append(row)
 
-        return da_agol.update_layer(layer=target_layer, adds=adds, deletes=deletes, updates=updates, chunk_size=10000)
+        result = da_agol.update_layer(layer=target_layer, adds=diff.adds, deletes=diff.deletes, updates=diff.updates, chunk_size=10000)
+        result['projection'] = projection.report(row_count)
+        return result
 
     def get_indexed_values(self, where_clause=None, include_geometry=True):
         result = {}
@@ -265,8 +278,7 @@ class Covid19NotificationsByPostcodeAndDate(object):
         source_data = self.nsw_source.source_data()
 
         # get postcode xys
-        xys = da_arcpy.load_xy_geometries(source=self.geometry_source._source,
-                                          id_field=self.geometry_source.poa_code_field)
+        xys = self.geometry_source.xy_arrays()
 
         # convert to input rows
         data = {}
@@ -281,7 +293,7 @@ class Covid19NotificationsByPostcodeAndDate(object):
             if data_item:
                 data_item['value'] += 1
             else:
-                xy = xys.get(postcode, None)
+                xy = xys.xy(postcode)
                 data[key] = {'value': 1, 'geometry': xy}
 
         return self.target.update_statistic(update_values=data, allow_deletes=True)
@@ -303,8 +315,7 @@ class Covid19TestsByPostcodeAndDate(object):
         source_data = self.nsw_source.source_data()
 
         # get postcode xys
-        xys = da_arcpy.load_xy_geometries(source=self.geometry_source._source,
-                                          id_field=self.geometry_source.poa_code_field)
+        xys = self.geometry_source.xy_arrays()
 
         # convert to input rows
         data = {}
@@ -319,7 +330,7 @@ class Covid19TestsByPostcodeAndDate(object):
             if data_item:
                 data_item['value'] += 1
             else:
-                xy = xys.get(postcode, None)
+                xy = xys.xy(postcode)
                 data[key] = {'value': 1, 'xy': xy}
 
         return self.target.update_statistic(update_values=data, allow_deletes=True)
@@ -340,8 +351,7 @@ class Covid19TotalNotificationsByPostcodeAndDate(object):
         source_data = self.source.
 
         # get postcode xys
-        xys = da_arcpy.load_xy_geometries(source=self.geometry_source._source,
-                                          id_field=self.geometry_source.poa_code_field)
+        xys = self.geometry_source.xy_arrays()
 
         # convert to input rows
         data = {}
@@ -356,7 +366,7 @@ class Covid19TotalNotificationsByPostcodeAndDate(object):
             if data_item:
                 data_item['value'] += 1
             else:
-                xy = xys.get(postcode, None)
+                xy = xys.xy(postcode)
                 data[key] = {'value': 1, 'geometry': xy}
 
         return self.target.update_statistic(update_values=data, allow_deletes=True)
@@ -376,7 +386,7 @@ class Covid19TotalNotificationsByPostcodeAndDate(object):
 #         self.date_code_format = '%Y%m%d'
 #
 #     def layer(self):
-#         return FeatureLayer(self.service_url)
+#         return layer_pool.default_pool.layer(self.service_url)
 #
 #     def query(self, where_clause='1=1'):
 #         return self.layer().query(where=where_clause)
@@ -5,10 +5,9 @@ import sys
 import copy
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 
+from graphc.da import layer_pool
 from graphc.covid.source.NSW_SourceData import NswTestData
-from graphc.da import da_arcpy
 from graphc.data.abs2016 import POA2016
 
 
@@ -28,7 +27,7 @@ class Covid19TestsByDateAndPostcode(object):
         self.date_code_format = '%Y%m%d'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -128,8 +127,7 @@ class UpdateFromSourceTask(object):
         # sorted_data = sorted(source_data, key=lambda x: (x[self.nsw_tests_source.postcode_field], x[self.nsw_tests_source.date_field]))
 
         # get postcode xys
-        xys = da_arcpy.load_xy_geometries(source=self.postcode_feature_source.source,
-                                          id_field=self.postcode_feature_source.poa_code_field)
+        xys = self.postcode_feature_source.xy_arrays()
 
         # convert to input rows
         wkg = {}
@@ -145,7 +143,7 @@ class UpdateFromSourceTask(object):
             if wkg_item:
                 wkg_item['tests'] += 1
             else:
-                xy = xys.get(postcode, None)
+                xy = xys.xy(postcode)
                 wkg[key] = {'tests': 1, 'xy': xy}
 
         return self.feature_service.update(update_values=wkg, allow_deletes=True)
@@ -4,8 +4,8 @@ import sys
 import copy
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 
+from graphc.da import layer_pool
 from graphc.covid.layers.Covid19NotificationsByDateAndPostcode import Covid19NotificationsByDateAndPostcode
 
 
@@ -23,7 +23,7 @@ class Covid19TotalNotificationsByPostcode(object):
         self.most_recent_notification_field = 'MostRecentNotification'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
@@ -4,8 +4,8 @@ import sys
 import copy
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 
+from graphc.da import layer_pool
 from graphc.covid.layers.Covid19TestsByDateAndPostcode import Covid19TestsByDateAndPostcode
 
 
@@ -23,7 +23,7 @@ class Covid19TotalTestsByPostcode(object):
         self.most_recent_tests_field = 'MostRecentTests'
 
     def layer(self):
-        return FeatureLayer(self.service_url)
+        return layer_pool.default_pool.layer(self.service_url)
 
     def query(self, where_clause='1=1'):
         return self.layer().query(where=where_clause)
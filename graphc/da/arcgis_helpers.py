@@ -1,15 +1,42 @@
-import copy
+import collections
 import datetime
 import logging
 import json
+import re
+import sqlite3
+import struct
+from contextlib import closing
 
-import arcpy
 from arcgis.features import Feature
-from arcgis.features import FeatureLayer
 from arcgis.geometry import Geometry
 
+from graphc.da import da_agol
+from graphc.da import fingerprints
+from graphc.da import geometry_diff
+from graphc.da import geometry_json_cache
+from graphc.da import layer_pool
+from graphc.da import query_cache
+from graphc.da import records
+from graphc.da.diff_engine import RecordDiff
+from graphc.da.edit_plan import EditPlan
+from graphc.da.edit_submitter import EditSubmitter
+from graphc.da.projection import QueryProjection
 from graphc.utilities import datetime_utils
 
+try:
+    import arcpy
+except ImportError:
+    # arcpy is only available with an ArcGIS install.  SQLiteHelper sources can be used without it, with geometries
+    # held as WKB or esri json.
+    arcpy = None
+
+
+def is_arcpy_geometry(value):
+    """
+    Returns True if the value is an arcpy geometry.  Always False when arcpy is not available.
+    """
+    return arcpy is not None and isinstance(value, arcpy.Geometry)
+
 
 class FeatureSourceHelper(object):
     def __init__(self, source, id_field):
@@ -18,115 +45,205 @@ class FeatureSourceHelper(object):
         self._rounding = 4
         self._case_sensitive = True
 
-        self.__loaded = None
+        self.cache = query_cache.default_cache
 
-    def load_records(self, fields=None, where_clause=None):
+    def load_records(self, fields=None, where_clause=None, compact=False):
+        """
+        Loads all records for the fields and where clause.
+        :param compact: If True, records are returned as compact read only records.  See graphc.da.records
+        :type compact: bool
+        :rtype: list
+        """
+        result = self.iter_records(fields=fields, where_clause=where_clause)
+        if compact:
+            result = records.compact(result)
+        return list(result)
+
+    def iter_records(self, fields=None, where_clause=None, batch_size=1000):
+        """
+        Yields records from the source one at a time, so that only the current batch is held in memory.
+        :param fields: The list of fields to be returned.
+        :type fields: list
+        :param where_clause: An optional where clause
+        :type where_clause:
+        :param batch_size: The number of rows read from the source in each request.
+        :type batch_size: int
+        :return: {fieldname1: value1, fieldname2: value2, ...}
+        :rtype: generator
+        """
         raise NotImplementedError()
 
+    def iterate(self, fields=None, where_clause=None, batch_size=1000):
+        """
+        Yields the records for the fields and where clause.  If the records are already in the query cache, copies of
+        the cached records are used, otherwise the records are streamed from the source without being cached, so large tables can
+        be read without holding them in memory.  Use records to load and cache the records.
+        """
+        cached = self.cache.peek(self.cache.make_key(self.source, fields, where_clause))
+        if cached is not None:
+            return (record.as_dict for record in cached)
+
+        return self.iter_records(fields=fields, where_clause=where_clause, batch_size=batch_size)
+
     def field_names(self):
         raise NotImplementedError()
 
-    def indexed_records(self, fields, where_clause=None):
+    def indexed_records(self, fields, where_clause=None, batch_size=1000, use_cache=False):
         """
         Loads records from the feature class and returns them as a dictionary of records indexed by the id_field values.
+        The records are streamed from the source one batch at a time and are not cached, unless use_cache is True.
         :param fields: The list of fields to be returned.
         :type fields: list
         :param where_clause: An optional where clause
         :type where_clause:
+        :param batch_size: The number of rows read from the source in each request.  See iter_records
+        :type batch_size: int
+        :param use_cache: If True, the records are loaded through the query cache.  See records
+        :type use_cache: bool
         :return: {id_field_value: {id_fieldname: id_value, fieldname1: value1, fieldname2: value2, ...}, ...]
         :rtype: dict
         """
         if self.id_field not in fields:
             fields.append(self.id_field)
 
-        records = self.records(fields, where_clause)
+        if use_cache:
+            source_records = self.records(fields, where_clause)
+        else:
+            source_records = self.iter_records(fields=fields, where_clause=where_clause, batch_size=batch_size)
+
         result = {}
-        for record in records:
+        for record in source_records:
             result[record[self.id_field]] = record
 
         return result
 
-    def values_by_id(self, value_field, where_clause=None):
+    def values_by_id(self, value_field, where_clause=None, batch_size=1000, use_cache=False):
         """
-        returns a lookup dictionary of {record_id: value}
+        returns a lookup dictionary of {record_id: value}.  The records are streamed from the source one batch at a time
+        and are not cached, unless use_cache is True.
         :param value_field: The value field to be returned.
         :type value_field: str
         :param where_clause: Optional where clause
         :type where_clause:
+        :param batch_size: The number of rows read from the source in each request.  See iter_records
+        :type batch_size: int
+        :param use_cache: If True, the records are loaded through the query cache.  See records
+        :type use_cache: bool
         :return: {record_id: value}
         :rtype: dict
         """
+        fields = [self.id_field, value_field]
+        if use_cache:
+            source_records = self.records(fields, where_clause)
+        else:
+            source_records = self.iter_records(fields=fields, where_clause=where_clause, batch_size=batch_size)
+
         result = {}
-        for item in self.records(fields=[self.id_field, value_field], where_clause=where_clause):
+        for item in source_records:
             result[item[self.id_field]] = item[value_field]
 
         return result
 
-    def records(self, fields, where_clause):
-        if fields is not None:
-            field_list = ','.join(fields)
-        else:
-            field_list = None
-
-        if self.__loaded:
-            if self.__loaded['fields'] == field_list and self.__loaded['where'] == where_clause:
-                return self.__loaded['records']
+    def records(self, fields, where_clause, compact=False):
+        """
+        Returns the records for the fields and where clause, using the query cache where possible.
+        The cache is shared by all helpers, so it holds compact read only records.  Dictionary records are copied from
+        them for each call and can be altered by the caller.
+        :param compact: If True, the cached compact read only records are returned.  See graphc.da.records
+        :type compact: bool
+        """
+        key = self.cache.make_key(self.source, fields, where_clause)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.load_records(fields=fields, where_clause=where_clause, compact=True)
+            self.cache.put(key, result)
 
-        result = self.load_records(fields=fields, where_clause=where_clause)
-        self.__loaded = {'fields': field_list, 'where': where_clause, 'records': result}
+        if compact:
+            return result
+        return [record.as_dict for record in result]
 
-        return result
+    def invalidate_cache(self):
+        """
+        Discards any cached records for this source.  Called whenever the helper writes to the source.
+        """
+        self.cache.invalidate(self.source)
 
     def update_records(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
-                       rounding=4, case_sensitive=True):
+                       rounding=4, case_sensitive=True, use_fingerprints=False):
+        raise NotImplementedError()
+
+    def plan_updates(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
+                     rounding=4, case_sensitive=True, shape_field='Shape'):
+        """
+        Calculates the edits update_records would make, without applying them.
+        :return: The edits, with estimates of their cost.
+        :rtype: graphc.da.edit_plan.EditPlan
+        """
         raise NotImplementedError()
 
+    def apply_edit_plan(self, plan):
+        """
+        Applies an EditPlan created by plan_updates for the same source.
+        :return: {'adds': int, 'deletes': int, 'updates': int, ...}
+        :rtype: dict
+        """
+        raise NotImplementedError()
+
+    def _check_plan(self, plan):
+        if plan.source != self.source:
+            raise ValueError('Edit plan for {} cannot be applied to {}'.format(plan.source, self.source))
+
+    @staticmethod
+    def _plan_options(fields, where_clause, add_new, delete_unmatched, rounding, case_sensitive, shape_field):
+        return {'fields': fields, 'where_clause': where_clause, 'add_new': add_new, 'delete_unmatched': delete_unmatched,
+                'rounding': rounding, 'case_sensitive': case_sensitive, 'shape_field': shape_field}
+
     @staticmethod
     def new_helper(source, id_field):
         source_lower = source.lower()
         if source_lower.startswith('https:') or source_lower.startswith('http:'):
             return FeatureServiceHelper(source=source, id_field=id_field)
+        elif SQLiteHelper.is_sqlite_source(source):
+            return SQLiteHelper(source=source, id_field=id_field)
         else:
             return FeatureClassHelper(source=source, id_field=id_field)
 
 
+# field types that are not included in the edits when no fields are requested.
+_not_edited_types = ['OID', 'GEOMETRY', 'GLOBALID', 'GUID', 'RASTER', 'BLOB']
+
+
 class FeatureClassHelper(FeatureSourceHelper):
     def __init__(self, source, id_field):
         super().__init__(source=source, id_field=id_field)
 
         self.last_records = {}
 
-    def load_records(self, fields=None, where_clause=None):
+    def iter_records(self, fields=None, where_clause=None, batch_size=1000):
         """
-        Loads records from the feature class and returns it as a list and returns them as a list of dictionary items.
+        Yields records from the feature class as dictionary items, streamed from a SearchCursor.
+        The cursor manages its own buffering, so batch_size is not used.
         :param fields: The list of fields to be returned.
         :type fields:
         :param where_clause: An optional where clause
         :type where_clause:
-        :return: [{fieldname1: value1, fieldname2: value2, ...}, ...]
-        :rtype: list
+        :param batch_size: Not used.
+        :type batch_size: int
+        :return: {fieldname1: value1, fieldname2: value2, ...}
+        :rtype: generator
         """
-        shape_renamed = False
         logging.info('Loading: ' + self.source)
         field_types = self.field_types()
         if fields is None:
             fields = list(field_types.keys())
-            for i in range(len(fields)):
-                if fields[i] == 'Shape':
-                    fields[i] = 'SHAPE@'
-                    shape_renamed = True
+            # the Shape field is read using the SHAPE@ token, but returned using the field name.
+            cursor_fields = ['SHAPE@' if field_name == 'Shape' else field_name for field_name in fields]
+        else:
+            cursor_fields = fields
 
-        result = []
-        with arcpy.da.SearchCursor(in_table=self.source, field_names=fields, where_clause=where_clause) as cursor:
+        with arcpy.da.SearchCursor(in_table=self.source, field_names=cursor_fields, where_clause=where_clause) as cursor:
             for row in cursor:
-                if shape_renamed:
-                    for i in range(len(fields)):
-                        if fields[i] == 'SHAPE@':
-                            fields[i] = 'Shape'
-                item = self.row_to_record(row, fields, field_types)
-                result.append(item)
-
-        return result
+                yield self.row_to_record(row, fields, field_types)
 
     def field_types(self):
         """
@@ -216,7 +333,7 @@ class FeatureClassHelper(FeatureSourceHelper):
         return True
 
     @staticmethod
-    def update_geometry_field(row, field_index: int, new_value: arcpy.Geometry = None):
+    def update_geometry_field(row, field_index: int, new_value: 'arcpy.Geometry' = None):
         current_value = row[field_index]
 
         if current_value == new_value:
@@ -225,27 +342,82 @@ class FeatureClassHelper(FeatureSourceHelper):
         row[field_index] = new_value
         return True
 
-    def update_field(self, row, field_index: int, new_value, field_type: str):
+    def comparator(self, field_type: str):
+        """
+        Returns the bound update function for the field type, or None if fields of this type are not updated.
+        Update functions have the signature f(row, field_index, new_value) and return True if the row was changed.
+        """
         ignore_types = ['OID', "RASTER", 'BLOB']
         uc_field_type = field_type.upper()
 
         if uc_field_type in ['STRING']:
-            return self.update_str_field(row, field_index, new_value)
+            return self.update_str_field
         elif uc_field_type in ['SINGLE', 'DOUBLE']:
-            return self.update_float_field(row, field_index, new_value)
+            return self.update_float_field
         elif uc_field_type in ['INTEGER', 'SMALLINTEGER']:
-            return self.update_int_field(row, field_index, new_value)
+            return self.update_int_field
         elif uc_field_type in ['DATE']:
-            return self.update_date_field(row, field_index, new_value)
+            return self.update_date_field
         elif uc_field_type == 'GEOMETRY':
-            return self.update_geometry_field(row, field_index, new_value)
+            return self.update_geometry_field
         elif uc_field_type in ignore_types:
-            return False
+            return None
         else:
             raise ValueError('Unhandled field_type: ' + field_type)
 
+    def update_field(self, row, field_index: int, new_value, field_type: str):
+        comparator = self.comparator(field_type)
+        if comparator is None:
+            return False
+        return comparator(row, field_index, new_value)
+
+    def compile_plan(self, fields, field_types, shape_field=None, skip_field=None):
+        """
+        Compiles the comparisons for a row layout once, so the row loop does not dispatch on field types for each cell.
+        :param fields: The row fields.  The 'SHAPE@' token is compared with the new_data shape_field.
+        :type fields: list
+        :param field_types: {field_name: field_type}
+        :type field_types: dict
+        :param shape_field: The new_data field holding the geometries.
+        :type shape_field: str
+        :param skip_field: An optional field that will not be compared, typically the id field.
+        :type skip_field: str
+        :return: ((row index, comparator, new_data field name, field type), ...)
+        :rtype: tuple
+        """
+        plan = []
+        for i in range(len(fields)):
+            field_name = fields[i]
+            if field_name == skip_field:
+                continue
+            if field_name == 'SHAPE@':
+                source_field = shape_field
+                field_type = 'Geometry'
+            else:
+                source_field = field_name
+                field_type = field_types[field_name]
+            comparator = self.comparator(field_type)
+            if comparator is not None:
+                plan.append((i, comparator, source_field, field_type))
+
+        return tuple(plan)
+
+    @staticmethod
+    def apply_plan(plan, row, new_item):
+        """
+        Applies a compiled plan to a row.
+        :return: True if any field was changed.
+        :rtype: bool
+        """
+        update_required = False
+        for index, comparator, source_field, field_type in plan:
+            if comparator(row, index, new_item[source_field]):
+                update_required = True
+
+        return update_required
+
     def update_records(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
-                       rounding=4, case_sensitive=True, shape_field='Shape'):
+                       rounding=4, case_sensitive=True, shape_field='Shape', use_fingerprints=False):
         """
         Updates the feature class using the new_data, with each record uniquely identified by the self.record_id_field.
         :param new_data: Dictionary records indexed by id.  {record_id: {field_name1: value1, field_name2: value2,...}}
@@ -265,18 +437,21 @@ class FeatureClassHelper(FeatureSourceHelper):
         :type shape_field: str
         :param case_sensitive:
         :type case_sensitive:
+        :param use_fingerprints: If True, rows with the same fingerprint as their new_data record are skipped without
+        comparing each field.  The number of rows skipped is returned as 'skipped_by_hash'.
+        :type use_fingerprints: bool
         :return:
         :rtype:
         """
 
         logging.info('Updating: ' + self.source)
-        result = {'adds': 0, 'deletes': 0, 'updates': 0}
+        result = {'adds': 0, 'deletes': 0, 'updates': 0, 'skipped_by_hash': 0}
 
         self._rounding = rounding
         self._case_sensitive = case_sensitive
 
-        # use a local copy of new_data because we will be popping items.
-        my_data = copy.deepcopy(new_data)
+        # new_data is read-only.  Matched records are tracked by the diff rather than popped from a copy.
+        diff = RecordDiff(new_data)
 
         field_types = self.field_types()
 
@@ -294,53 +469,182 @@ class FeatureClassHelper(FeatureSourceHelper):
                 all_fields.append('SHAPE@')
 
         field_count = len(all_fields)
+
+        # compile the field comparisons once, rather than dispatching on the field type for every cell.
+        update_plan = self.compile_plan(all_fields, field_types, shape_field=shape_field, skip_field=self.id_field)
+        insert_plan = self.compile_plan(all_fields, field_types, shape_field=shape_field)
+
+        fingerprinter = None
+        if use_fingerprints:
+            fingerprinter = fingerprints.RecordFingerprinter.for_field_types(field_types=[f[3] for f in update_plan],
+                                                                             rounding=rounding,
+                                                                             case_sensitive=case_sensitive)
+            # new records are fingerprinted once, so only the current row is hashed within the cursor.
+            new_fingerprints = fingerprinter.fingerprint_records(new_data, [f[2] for f in update_plan])
+
         with arcpy.da.UpdateCursor(self.source, all_fields, where_clause) as cursor:
             for row in cursor:
                 key = row[id_index]
-                new_item = my_data.pop(key, None)
+                new_item = diff.match(key)
                 if new_item:
-                    update_required = False
-                    for i in range(field_count):
-                        field_name = all_fields[i]
-                        if field_name != self.id_field:
-                            if field_name == 'SHAPE@':
-                                new_value = new_item[shape_field]
-                                field_type = 'Geometry'
-                            else:
-                                new_value = new_item[field_name]
-                                field_type = field_types[field_name]
-                            if self.update_field(row, i, new_value, field_type):
-                                update_required = True
-                    if update_required:
+                    if fingerprinter and key in new_fingerprints:
+                        current_hash = fingerprinter.fingerprint([row[f[0]] for f in update_plan])
+                        if current_hash == new_fingerprints[key]:
+                            result['skipped_by_hash'] += 1
+                            continue
+
+                    if self.apply_plan(update_plan, row, new_item):
                         cursor.updateRow(row)
                         result['updates'] += 1
                 elif delete_unmatched:
                     cursor.deleteRow()
                     result['deletes'] += 1
 
-        if my_data and add_new:
+        if add_new:
             with arcpy.da.InsertCursor(self.source, all_fields) as cursor:
-                for item in my_data.values():
+                for key, item in diff.unmatched():
                     row = [None] * field_count
-                    for i in range(field_count):
-                        field_name = all_fields[i]
-                        if field_name == 'SHAPE@':
-                            new_value = item[shape_field]
-                            field_type = 'Geometry'
-                        else:
-                            new_value = item[field_name]
-                            field_type = field_types[field_name]
-                        self.update_field(row, i, new_value, field_type)  # ensure all data rules are applied to the value being added.
+                    self.apply_plan(insert_plan, row, item)  # ensure all data rules are applied to the value being added.
                     cursor.insertRow(row)
                     result['adds'] += 1
 
+        self.invalidate_cache()
+        return result
+
+    def read_only_fields(self):
+        """
+        Returns the names of the fields that cannot be edited, such as the geometry length and area fields.
+        :rtype: set
+        """
+        description = arcpy.Describe(self.source)
+        result = {getattr(description, 'lengthFieldName', None), getattr(description, 'areaFieldName', None)}
+        result.update(field.name for field in arcpy.ListFields(self.source) if not field.editable)
+        result.discard(None)
+        result.discard('')
+        return result
+
+    def _edit_fields(self, fields, field_types, shape_field):
+        """
+        Returns the fields read to calculate edits: the requested fields (or all editable fields), the id field and, if
+        the source has geometries and a shape_field is used, the 'SHAPE@' token in place of the shape_field.
+        """
+        if fields:
+            all_fields = list(fields)
+        else:
+            read_only = self.read_only_fields()
+            all_fields = [name for name, field_type in field_types.items()
+                          if field_type.upper() not in _not_edited_types and name not in read_only]
+        if self.id_field not in all_fields:
+            all_fields.append(self.id_field)
+        if shape_field and 'Geometry' in field_types.values():
+            if shape_field in all_fields:
+                all_fields.remove(shape_field)
+            all_fields.append('SHAPE@')
+        return all_fields
+
+    def _read_rows(self, fields, field_types, where_clause=None):
+        """
+        Yields (object id, [value, ...]) for each row, with values in field order.
+        """
+        with arcpy.da.SearchCursor(self.source, fields + ['OID@'], where_clause) as cursor:
+            for row in cursor:
+                yield row[-1], list(row[:-1])
+
+    def plan_updates(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
+                     rounding=4, case_sensitive=True, shape_field='Shape'):
+        """
+        Calculates the edits update_records would make, without applying them.  See update_records for the parameters.
+        Updates and deletes are identified by object id.
+        :return: EditPlan with adds [{field_name: value, ...}], updates [{'id': id, 'object_id': oid, 'values': {...}}]
+        and deletes [oid, ...]
+        :rtype: graphc.da.edit_plan.EditPlan
+        """
+        logging.info('Planning updates: ' + self.source)
+        self._rounding = rounding
+        self._case_sensitive = case_sensitive
+
+        diff = RecordDiff(new_data)
+        field_types = self.field_types()
+        all_fields = self._edit_fields(fields, field_types, shape_field)
+        id_index = all_fields.index(self.id_field)
+
+        update_plan = self.compile_plan(all_fields, field_types, shape_field=shape_field, skip_field=self.id_field)
+        insert_plan = self.compile_plan(all_fields, field_types, shape_field=shape_field)
+
+        field_changes = collections.Counter()
+        for object_id, row in self._read_rows(all_fields, field_types, where_clause):
+            key = row[id_index]
+            new_item = diff.match(key)
+            if new_item:
+                values = {}
+                for index, comparator, source_field, field_type in update_plan:
+                    if comparator(row, index, new_item[source_field]):
+                        values[all_fields[index]] = row[index]
+                        field_changes[source_field] += 1
+                if values:
+                    diff.updates.append({'id': key, 'object_id': object_id, 'values': values})
+            elif delete_unmatched:
+                diff.deletes.append(object_id)
+
+        if add_new:
+            for key, item in diff.unmatched():
+                row = [None] * len(all_fields)
+                self.apply_plan(insert_plan, row, item)  # ensure all data rules are applied to the value being added.
+                diff.adds.append(dict(zip(all_fields, row)))
+
+        return EditPlan(source=self.source, id_field=self.id_field, adds=diff.adds, updates=diff.updates, deletes=diff.deletes,
+                        field_changes=field_changes,
+                        options=self._plan_options(fields, where_clause, add_new, delete_unmatched, rounding, case_sensitive, shape_field))
+
+    def apply_edit_plan(self, plan):
+        self._check_plan(plan)
+        logging.info('Applying edit plan: ' + self.source)
+        result = {'adds': 0, 'deletes': 0, 'updates': 0}
+
+        updates = {item['object_id']: item['values'] for item in plan.updates}
+        deletes = set(plan.deletes)
+        if updates or deletes:
+            update_fields = sorted({field_name for values in updates.values() for field_name in values})
+            with arcpy.da.UpdateCursor(self.source, ['OID@'] + update_fields) as cursor:
+                for row in cursor:
+                    object_id = row[0]
+                    if object_id in deletes:
+                        cursor.deleteRow()
+                        result['deletes'] += 1
+                    elif object_id in updates:
+                        values = updates[object_id]
+                        for i in range(len(update_fields)):
+                            if update_fields[i] in values:
+                                row[i + 1] = values[update_fields[i]]
+                        cursor.updateRow(row)
+                        result['updates'] += 1
+
+        if plan.adds:
+            add_fields = list(plan.adds[0].keys())
+            with arcpy.da.InsertCursor(self.source, add_fields) as cursor:
+                for item in plan.adds:
+                    cursor.insertRow([item[field_name] for field_name in add_fields])
+                    result['adds'] += 1
+
+        self.invalidate_cache()
         return result
 
 
 class FeatureServiceHelper(FeatureSourceHelper):
     def __init__(self, source, id_field):
         super().__init__(source=source, id_field=id_field)
-        self.layer = FeatureLayer(source)
+        self.layer = layer_pool.default_pool.layer(source)
+
+        # paginated query settings.  See da_agol.query_pages
+        self.page_size = None
+        self.max_workers = 4
+        self.retries = 3
+
+        # geometries are only updated when a coordinate moves by more than the tolerance, in map units.
+        self.geometry_tolerance = 1e-6
+
+        # an optional graphc.da.layer_mirror.LayerMirror used by update_records in place of querying the layer.
+        self.mirror = None
 
     def query(self, fields=None, where_clause=None):
         if fields is None:
@@ -350,10 +654,47 @@ class FeatureServiceHelper(FeatureSourceHelper):
         if where_clause is None:
             where_clause = '1=1'
 
-        return self.layer.query(out_fields=fields, where=where_clause)
+        return da_agol.query_pages(layer=self.layer, where=where_clause, out_fields=fields,
+                                   page_size=self.page_size, max_workers=self.max_workers, retries=self.retries)
 
-    def load_records(self, fields=None, where_clause=None):
-        return self.query(fields=fields, where_clause=where_clause).to_dict('records')
+    def iter_records(self, fields=None, where_clause=None, batch_size=1000):
+        """
+        Yields records from the feature service as dictionary items, reading one page of batch_size rows at a time.
+        Layers that do not support pagination are paged by object id ranges.  See da_agol.paged_queries
+        Date values are returned as datetimes and geometries are returned in the 'SHAPE' field.
+        :param fields: The list of fields to be returned.
+        :type fields:
+        :param where_clause: An optional where clause
+        :type where_clause:
+        :param batch_size: The number of rows requested in each page.  Limited by the service maxRecordCount.
+        :type batch_size: int
+        :return: {fieldname1: value1, fieldname2: value2, ...}
+        :rtype: generator
+        """
+        logging.info('Loading: ' + self.source)
+        if fields is None:
+            out_fields = '*'
+        else:
+            out_fields = ','.join(fields)
+        if where_clause is None:
+            where_clause = '1=1'
+
+        properties = self.layer.properties
+        page_size = min(batch_size, properties.get('maxRecordCount', batch_size) or batch_size)
+
+        # the paging method is chosen once, before any rows are yielded.
+        page_queries = da_agol.paged_queries(self.layer, where=where_clause, page_size=page_size)
+        for index, page_query in enumerate(page_queries):
+            page = da_agol.query_page(self.layer, page_query, out_fields=out_fields, retries=self.retries, index=index)
+            date_fields = [name for name, field_type in self._field_types(page).items() if field_type == 'esriFieldTypeDate']
+            for feature in page.features:
+                record = dict(feature.attributes)
+                for field_name in date_fields:
+                    if record.get(field_name, None) is not None:
+                        record[field_name] = datetime_utils.to_datetime(record[field_name])
+                if feature.geometry:
+                    record['SHAPE'] = feature.geometry
+                yield record
 
     @staticmethod
     def _field_types(query_result):
@@ -367,7 +708,7 @@ class FeatureServiceHelper(FeatureSourceHelper):
         return self.layer.properties.fields
 
     def update_records(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
-                       rounding=4, case_sensitive=True, shape_field='Shape'):
+                       rounding=4, case_sensitive=True, shape_field='Shape', use_fingerprints=False, journal=None, mirror=None):
         """
         Updates the feature class using the new_data, with each record uniquely identified by the self.record_id_field.
         :param new_data: Dictionary records indexed by id.  {record_id: {field_name1: value1, field_name2: value2,...}}
@@ -386,44 +727,204 @@ class FeatureServiceHelper(FeatureSourceHelper):
         :type case_sensitive:
         :param shape_field: The name of the geometry field in the new_data.  Set to None if geometry is not to be updated.  Default='Shape'
         :type shape_field: str
+        :param use_fingerprints: If True, rows with the same fingerprint as their new_data record are skipped without
+        comparing each field.  The number of rows skipped is returned as 'skipped_by_hash'.
+        :type use_fingerprints: bool
+        :param journal: Optional.  If supplied, the edits are journaled.  If the journal holds an incomplete plan for this
+        service, that plan is resumed before the new_data is compared and applied, and its result is returned as 'resumed'.
+        A plan that keeps failing is marked as failed by the journal after its max_attempts, and is no longer resumed.
+        :type journal: graphc.da.edit_journal.EditJournal
+        :param mirror: Optional.  If supplied, the diff is made against a local mirror of the layer.  The mirror is
+        synchronised first, which only reads the service when a verify pass or full rescan is due, and the applied edits
+        are written back to the mirror.  If None, self.mirror is used.
+        :type mirror: graphc.da.layer_mirror.LayerMirror
         :return:
         :rtype:
         """
+        if mirror is None:
+            mirror = self.mirror
+
+        resumed = None
+        if journal is not None:
+            pending_plan = journal.pending(self.source)
+            if pending_plan:
+                # the incomplete plan is finished first, so the diff below is made against the resumed edits.
+                logging.info('Resuming incomplete edit plan {} for {}'.format(pending_plan, self.source))
+                submitter = EditSubmitter(layer=self.layer, max_workers=self.max_workers, retries=self.retries,
+                                          add_key_field=self.id_field)
+                resumed = journal.apply(pending_plan, submitter.submit)
+                self.invalidate_cache()
+                if mirror is not None:
+                    mirror.invalidate(self.layer.url)
+
+        diff, object_id_field, skipped_by_hash, projection = self._diff(new_data=new_data, fields=fields, where_clause=where_clause,
+                                                                        add_new=add_new, delete_unmatched=delete_unmatched,
+                                                                        rounding=rounding, case_sensitive=case_sensitive,
+                                                                        shape_field=shape_field, use_fingerprints=use_fingerprints,
+                                                                        mirror=mirror)
+
+        result = self.update_layer(adds=diff.adds, deletes=diff.deletes, updates=diff.updates, journal=journal)
+        result['skipped_by_hash'] = skipped_by_hash
+        result['resumed'] = resumed
+        if mirror is not None:
+            if journal is not None:
+                # journaled chunks are not aligned with the submitted lists, so the mirror is verified on the next sync.
+                mirror.invalidate(self.layer.url)
+            else:
+                mirror.apply_edits(self.layer.url, object_id_field, result, adds=diff.adds, deletes=diff.deletes,
+                                   updates=diff.updates)
+        if projection is not None:
+            result['projection'] = projection.report(projection.row_count)
+        return result
+
+    def plan_updates(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
+                     rounding=4, case_sensitive=True, shape_field='Shape'):
+        """
+        Calculates the edits update_records would make, without applying them.  See update_records for the parameters.
+        The plan holds feature json adds and updates, and object id deletes.
+        :rtype: graphc.da.edit_plan.EditPlan
+        """
+        field_changes = collections.Counter()
+        diff, object_id_field, skipped_by_hash, projection = self._diff(new_data=new_data, fields=fields, where_clause=where_clause,
+                                                                        add_new=add_new, delete_unmatched=delete_unmatched,
+                                                                        rounding=rounding, case_sensitive=case_sensitive,
+                                                                        shape_field=shape_field, mirror=self.mirror,
+                                                                        field_changes=field_changes)
+        updates = [update.as_dict if hasattr(update, 'as_dict') else update for update in diff.updates]
+        return EditPlan(source=self.source, id_field=self.id_field, adds=diff.adds, updates=updates, deletes=diff.deletes,
+                        field_changes=field_changes,
+                        options=self._plan_options(fields, where_clause, add_new, delete_unmatched, rounding, case_sensitive, shape_field))
+
+    def apply_edit_plan(self, plan, journal=None):
+        self._check_plan(plan)
+        result = self.update_layer(adds=plan.adds, deletes=plan.deletes, updates=plan.updates, journal=journal)
+        if self.mirror is not None:
+            self.mirror.invalidate(self.layer.url)
+        return result
+
+    def _diff(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False, rounding=4,
+              case_sensitive=True, shape_field='Shape', use_fingerprints=False, mirror=None, field_changes=None):
+        """
+        Calculates the edits required to update the layer using the new_data.  See update_records.
+        :param field_changes: Optional.  A counter incremented for each changed value, by field name.
+        :type field_changes: collections.Counter
+        :return: (diff, object id field name, rows skipped by hash, projection or None)
+        :rtype: tuple
+        """
         self._rounding = rounding
         self._case_sensitive = case_sensitive
 
-        # use a local copy of new_data because we will be popping items.
-        my_data = copy.deepcopy(new_data)
+        # new_data is read-only.  Matched records are tracked by the diff rather than popped from a copy.
+        diff = RecordDiff(new_data)
 
         if fields and self.id_field not in fields:
             fields.append(self.id_field)
 
-        query_result = self.query(fields=fields, where_clause=where_clause)
-        field_types = self._field_types(query_result)
-
-        updates = []
-        deletes = []
-
-        for row in query_result:
+        projection = None
+        if mirror is not None:
+            rows, field_types, object_id_field = self._mirror_rows(mirror, fields, where_clause)
+        else:
+            # only the id, compared and object id fields are requested, and geometries only if they are compared.
+            compared_fields = fields or self._new_data_fields(new_data, shape_field)
+            compare_geometry = bool(shape_field) and any(item.get(shape_field, None) is not None for item in new_data.values())
+            projection = QueryProjection.for_diff(self.layer, key_fields=[self.id_field], compared_fields=compared_fields,
+                                                  return_geometry=compare_geometry)
+            query_result = projection.query(self.layer, where_clause=where_clause or '1=1', page_size=self.page_size,
+                                            max_workers=self.max_workers, retries=self.retries)
+            rows = query_result
+            field_types = self._field_types(query_result)
+            object_id_field = query_result.object_id_field_name
+
+        skipped_by_hash = 0
+        plan = self.compile_plan(field_types)
+
+        fingerprinter = None
+        if use_fingerprints:
+            # only the fields found in the new_data are updated, so the other fields are not fingerprinted.
+            new_data_fields = set(self._new_data_fields(new_data, shape_field))
+            compared_fields = [name for name in field_types.keys() if name != self.id_field and name in new_data_fields]
+            fingerprinter = fingerprints.RecordFingerprinter.for_field_types(field_types=[field_types[name] for name in compared_fields],
+                                                                             rounding=rounding,
+                                                                             case_sensitive=case_sensitive)
+            # new records are fingerprinted once.  Records missing any of the compared fields are compared field by field.
+            new_fingerprints = fingerprinter.fingerprint_records(new_data, compared_fields)
+            signature = fingerprinter.signature(compared_fields)
+            # the fingerprints of mirrored rows are stored, so only rows rewritten since the last diff are hashed.
+            stored_fingerprints = mirror.fingerprints(self.layer.url, signature) if mirror is not None else {}
+            calculated_fingerprints = {}
+
+        for row in rows:
             id_value = row.attributes[self.id_field]
-            new_row = my_data.pop(id_value, None)
+            new_row = diff.match(id_value)
             if new_row:
-                if self.update_row(row=row, field_types=field_types, new_values=new_row, shape_field=shape_field):
-                    updates.append(row)
+                geometry_changed = bool(shape_field) and self.update_geometry(row, new_row.get(shape_field, None))
+                if geometry_changed and field_changes is not None:
+                    field_changes[shape_field] += 1
+                if fingerprinter and not geometry_changed and id_value in new_fingerprints:
+                    object_id = row.attributes[object_id_field]
+                    current_hash = stored_fingerprints.get(object_id, None)
+                    if current_hash is None:
+                        current_hash = fingerprinter.fingerprint([row.attributes[name] for name in compared_fields])
+                        calculated_fingerprints[object_id] = current_hash
+                    if current_hash == new_fingerprints[id_value]:
+                        skipped_by_hash += 1
+                        continue
+
+                attributes_changed = self.update_row(row=row, field_types=field_types, new_values=new_row, plan=plan,
+                                                     field_changes=field_changes)
+                if geometry_changed:
+                    diff.updates.append(row)
+                elif attributes_changed:
+                    # geometry is unchanged, so only the attributes are sent.
+                    diff.updates.append({'attributes': row.attributes})
             elif delete_unmatched:
-                deletes.append(row.attributes[query_result.object_id_field_name])
+                diff.deletes.append(row.attributes[object_id_field])
+
+        if fingerprinter and mirror is not None:
+            mirror.set_fingerprints(self.layer.url, signature, calculated_fingerprints)
 
-        adds = []
         if add_new:
+            # records often share a geometry object (eg: the postcode of each date), so each geometry is converted once.
+            # The cache is keyed by geometry identity, so it only lives for this call, while new_data holds the geometries.
+            json_cache = geometry_json_cache.GeometryJsonCache()
             # any remaining data_models items are new records
-            for id_value, new_item in my_data.items():
-                new_geometry = new_item.pop(shape_field, None)
-                row = self.generate_new_row(new_item, new_geometry)
-                adds.append(row)
+            for id_value, new_item in diff.unmatched():
+                row = self.generate_new_row(new_item, new_item.get(shape_field, None), shape_field=shape_field, json_cache=json_cache)
+                diff.adds.append(row)
 
-        return self.update_layer(adds=adds, deletes=None, updates=updates)
+        return diff, object_id_field, skipped_by_hash, projection
 
-    def update_layer(self, adds=None, deletes=None, updates=None, chunk_size=1000):
+    @staticmethod
+    def _new_data_fields(new_data, shape_field=None):
+        """
+        Returns the names of all fields found in the new_data records, other than the shape_field.
+        """
+        result = set()
+        for item in new_data.values():
+            result.update(item.keys())
+        result.discard(shape_field)
+        return list(result)
+
+    def _mirror_rows(self, mirror, fields=None, where_clause=None):
+        """
+        Synchronises the mirror of the layer and returns the mirrored rows, the types of the requested fields and the
+        object id field name.  The whole layer is mirrored, so rows matching a where clause are selected from the mirror
+        by the object ids returned by an ids only query.
+        """
+        mirror.sync(self.layer)
+
+        object_ids = None
+        if where_clause and where_clause != '1=1':
+            object_ids = set(self.layer.query(where=where_clause, return_ids_only=True)['objectIds'] or [])
+
+        field_types = {}
+        for field in self.layer.properties.fields:
+            if not fields or field['name'] in fields:
+                field_types[field['name']] = field['type']
+
+        return mirror.features(self.layer.url, object_ids), field_types, self.layer.properties.objectIdField
+
+    def update_layer(self, adds=None, deletes=None, updates=None, chunk_size=1000, on_chunk=None, journal=None):
         """
         Performs updates on an arcgis feature service in manageable chunks.
         Updates are performed using multiple calls to the service where needed.  Large sets of updates are broken into
@@ -432,6 +933,7 @@ class FeatureServiceHelper(FeatureSourceHelper):
         - Adds
         - Updates
         If no elements are submitted for Adds, Deletes or Updates, then that stage of the process is skipped.
+        Chunks are sized by payload and submitted concurrently within each stage.  See edit_submitter.EditSubmitter
 
         :param adds: The list of add items to be added.
         :type adds:
@@ -439,36 +941,27 @@ class FeatureServiceHelper(FeatureSourceHelper):
         :type deletes:
         :param updates:
         :type updates:
-        :param chunk_size:
-        :type chunk_size:
-        :return:
-        :rtype:
+        :param chunk_size: The maximum number of rows in each chunk.
+        :type chunk_size: int
+        :param on_chunk: Optional.  A function called with the chunk detail as each chunk completes.  Ignored if a journal is used.
+        :type on_chunk: function
+        :param journal: Optional.  If supplied, the edits are recorded as a plan and each applied chunk is journaled.
+        See da_agol.update_layer
+        :type journal: graphc.da.edit_journal.EditJournal
+        :return: {'adds': int, 'deletes': int, 'updates': int, 'chunks': [detail, ...], 'failures': [detail, ...]}
+        :rtype: dict
         """
         logging.info('Updating: ' + self.source)
-        result = {'adds': 0, 'deletes': 0, 'updates': 0}
-        # perform updates in order deletes, adds, updates to support models where:
-        # - updates are performed by deleting old records and replacing with new (remove old items before adding new)
-        # - items can be added and updated in same cycles (ensure adds are in place before updates are applied)
-        if deletes:
-            for chunk in self._list_chunks(master_list=deletes, chunk_size=chunk_size):
-                logging.info('Applying {} Deletes'.format(len(chunk)))
-                self.layer.edit_features(deletes=str(chunk))
-            result['deletes'] = len(deletes)
-            logging.info('Total Deletes: {}'.format(result['deletes']))
-
-        if adds:
-            for chunk in self._list_chunks(master_list=adds, chunk_size=chunk_size):
-                logging.info('Applying {} Adds'.format(len(chunk)))
-                self.layer.edit_features(adds=chunk)
-            result['adds'] = len(adds)
-            logging.info('Total Adds: {}'.format(result['adds']))
-
-        if updates:
-            for chunk in self._list_chunks(master_list=updates, chunk_size=chunk_size):
-                logging.info('Applying {} Updates'.format(len(chunk)))
-                self.layer.edit_features(updates=chunk)
-            result['updates'] = len(updates)
-            logging.info('Total Updates: {}'.format(result['updates']))
+        submitter = EditSubmitter(layer=self.layer, max_workers=self.max_workers, max_rows=chunk_size, retries=self.retries,
+                                  add_key_field=self.id_field)
+        if journal is not None:
+            plan_id = journal.begin(self.source, adds=adds, deletes=deletes, updates=updates)
+            result = journal.apply(plan_id, submitter.submit)
+        else:
+            result = submitter.submit(adds=adds, deletes=deletes, updates=updates, on_chunk=on_chunk)
+
+        if adds or deletes or updates:
+            self.invalidate_cache()
 
         return result
 
@@ -530,47 +1023,98 @@ class FeatureServiceHelper(FeatureSourceHelper):
         row.attributes[field_name] = new_value
         return True
 
-    def update_field(self, row: Feature, field_name: str, field_type: str, new_value):
+    def comparator(self, field_type: str):
+        """
+        Returns the bound update function for the field type, or None if fields of this type are not updated.
+        Update functions have the signature f(row, field_name, new_value) and return True if the row was changed.
+        """
         ignore_types = ['esriFieldTypeOID', 'esriFieldTypeGeometry', 'esriFieldTypeBlob', 'esriFieldTypeRaster']
         if field_type in ['esriFieldTypeSmallInteger', 'esriFieldTypeInteger']:
-            return self.update_int_field(row, field_name=field_name, new_value=new_value)
+            return self.update_int_field
         elif field_type in ['esriFieldTypeSingle', 'esriFieldTypeDouble']:
-            return self.update_float_field(row=row, field_name=field_name, new_value=new_value)
+            return self.update_float_field
         elif field_type == 'esriFieldTypeString':
-            return self.update_str_field(row=row, field_name=field_name, new_value=new_value)
+            return self.update_str_field
         elif field_type == 'esriFieldTypeDate':
-            return self.update_date_field(row=row, field_name=field_name, new_value=new_value)
+            return self.update_date_field
         elif field_type in ignore_types:
-            return False
+            return None
 
         raise ValueError('Unhandled field type: ' + field_type)
 
-    def update_row(self, row: Feature, field_types, new_values, shape_field=None):
+    def update_field(self, row: Feature, field_name: str, field_type: str, new_value):
+        comparator = self.comparator(field_type)
+        if comparator is None:
+            return False
+        return comparator(row, field_name, new_value)
+
+    def compile_plan(self, field_types):
+        """
+        Compiles the attribute comparisons for a query result once, so the row loop does not dispatch on field types for each cell.
+        :param field_types: {field_name: field_type}
+        :type field_types: dict
+        :return: ((field_name, comparator), ...)
+        :rtype: tuple
+        """
+        plan = []
+        for field_name, field_type in field_types.items():
+            if field_name != self.id_field:
+                comparator = self.comparator(field_type)
+                if comparator is not None:
+                    plan.append((field_name, comparator))
+
+        return tuple(plan)
+
+    def update_row(self, row: Feature, field_types, new_values, shape_field=None, plan=None, field_changes=None):
+        if plan is None:
+            plan = self.compile_plan(field_types)
+
         update_required = False
-        for field_name in row.fields:
-            if field_name != self.id_field and field_name in new_values:
-                field_type = field_types[field_name]
-                new_value = new_values[field_name]
-                if self.update_field(row=row, field_name=field_name, field_type=field_type, new_value=new_value):
+        for field_name, comparator in plan:
+            if field_name in new_values:
+                if comparator(row, field_name, new_values[field_name]):
                     update_required = True
-        #if shape_field:  TODO implement feature updates in a way that handles minor locational variations (nm)
-        #
-        #    new_wkt = self.to_wkt(new_values[shape_field])
-        #    current_wkt = self.to_wkt(row.geometry)
-
-        #    if current_wkt != new_wkt:
-        #        row.geometry = self.to_geometry(new_values[shape_field])
-        #        update_required = True
+                    if field_changes is not None:
+                        field_changes[field_name] += 1
+        if shape_field and shape_field in new_values:
+            if self.update_geometry(row, new_values[shape_field]):
+                update_required = True
 
         return update_required
 
+    def update_geometry(self, row: Feature, new_geometry):
+        """
+        Replaces the row geometry if the new geometry differs by more than self.geometry_tolerance.
+        Arcpy geometries are projected to the spatial reference of the row before they are compared.
+        :param row: The feature to be updated.
+        :type row: arcgis.features.Feature
+        :param new_geometry: The new geometry.  If None, the row geometry is not changed.
+        :type new_geometry:
+        :return: True if the row geometry was changed.
+        :rtype: bool
+        """
+        if new_geometry is None:
+            return False
+
+        current_geometry = row.geometry
+        if current_geometry and is_arcpy_geometry(new_geometry):
+            current_wkid = geometry_diff.wkid(current_geometry)
+            if current_wkid and new_geometry.spatialReference and new_geometry.spatialReference.factoryCode != current_wkid:
+                new_geometry = new_geometry.projectAs(arcpy.SpatialReference(current_wkid))
+
+        if not geometry_diff.geometries_differ(current_geometry, new_geometry, tolerance=self.geometry_tolerance):
+            return False
+
+        row.geometry = self.to_geometry(new_geometry)
+        return True
+
     @ staticmethod
     def to_wkt(source):
         if source is None:
             return None
         if isinstance(source, Geometry):
             return source.WKT
-        if isinstance(source, arcpy.Geometry):
+        if is_arcpy_geometry(source):
             return source.WKT
 
         geom = Geometry(source)
@@ -584,20 +1128,30 @@ class FeatureServiceHelper(FeatureSourceHelper):
         if isinstance(source, Geometry):
             return source
 
-        if isinstance(source, arcpy.Geometry):
+        if is_arcpy_geometry(source):
             return Geometry(source.JSON)
 
         return Geometry(source)
 
     @staticmethod
-    def generate_new_row(new_values, geometry=None):
+    def generate_new_row(new_values, geometry=None, shape_field=None, json_cache=None):
+        """
+        Returns the feature json used to add a new_data record.
+        :param json_cache: Optional.  A cache used to convert arcpy geometries.  The geometry json is shared with other
+        rows using the same geometry.  If None, the geometry is converted for this row.
+        :type json_cache: graphc.da.geometry_json_cache.GeometryJsonCache
+        """
         attributes = {}
         for field_name, value in new_values.items():
-            attributes[field_name] = value
+            if field_name != shape_field:
+                attributes[field_name] = value
 
         geometry_value = geometry
-        if geometry_value and isinstance(geometry_value, arcpy.Geometry):
-            geometry_value = json.loads(geometry_value.JSON)
+        if geometry_value and is_arcpy_geometry(geometry_value):
+            if json_cache is None:
+                geometry_value = json.loads(geometry_value.JSON)
+            else:
+                geometry_value = json_cache.to_json(geometry_value)
 
         return {"attributes": attributes,
                 "geometry": geometry_value}
@@ -612,6 +1166,397 @@ class FeatureServiceHelper(FeatureSourceHelper):
             yield master_list[i:i + chunk_size]
 
 
+class SQLiteHelper(FeatureClassHelper):
+    """
+    A helper for tables held in SQLite databases and GeoPackages, using only the standard library sqlite3 module.
+    The source is the database path followed by the table name, in the same way a feature class path follows the
+    geodatabase path.  eg: r'C:\\Staging\\AuthorityData.gpkg\\CasesByDateAndState2'
+    Geometries are stored as WKB.  GeoPackage geometries carry the standard GeoPackage binary header, which is added and
+    removed as geometries are written and read.
+    Dates are stored as ISO format strings.
+    """
+    _source_pattern = re.compile(r'^(.*\.(?:gpkg|sqlite))[\\/]([^\\/]+)$', re.IGNORECASE)
+    _geometry_types = ['GEOMETRY', 'POINT', 'LINESTRING', 'POLYGON', 'MULTIPOINT', 'MULTILINESTRING', 'MULTIPOLYGON',
+                       'GEOMETRYCOLLECTION']
+
+    def __init__(self, source, id_field):
+        super().__init__(source=source, id_field=id_field)
+
+        match = self._source_pattern.match(source)
+        if not match:
+            raise ValueError('Invalid SQLite source, expected <database path>\\<table name>: ' + source)
+        self.database = match.group(1)
+        self.table = match.group(2)
+        self.is_geopackage = self.database.lower().endswith('.gpkg')
+
+    @staticmethod
+    def is_sqlite_source(source):
+        return SQLiteHelper._source_pattern.match(source) is not None
+
+    def connect(self):
+        return sqlite3.connect(self.database)
+
+    def _geometry_column(self, connection):
+        """
+        Returns the (geometry column name, srs_id) registered for the table in a GeoPackage, or (None, 0).
+        """
+        if self.is_geopackage:
+            row = connection.execute('SELECT column_name, srs_id FROM gpkg_geometry_columns WHERE table_name = ?',
+                                     (self.table,)).fetchone()
+            if row:
+                return row[0], row[1]
+        return None, 0
+
+    def field_types(self):
+        """
+        returns a dictionary of field types indexed by field name.  Types use the arcpy field type names.
+        :return: {field_name: field_type}
+        :rtype:
+        """
+        with closing(self.connect()) as connection:
+            geometry_column, srs_id = self._geometry_column(connection)
+            columns = connection.execute('PRAGMA table_info("{}")'.format(self.table)).fetchall()
+
+        field_types = {}
+        for cid, name, declared_type, not_null, default_value, primary_key in columns:
+            declared_type = (declared_type or '').upper()
+            if name == geometry_column or declared_type in self._geometry_types:
+                field_types[name] = 'Geometry'
+            elif primary_key and declared_type == 'INTEGER':
+                field_types[name] = 'OID'
+            elif 'INT' in declared_type:
+                field_types[name] = 'Integer'
+            elif declared_type.startswith('DATE'):
+                field_types[name] = 'Date'
+            elif any(t in declared_type for t in ['REAL', 'FLOA', 'DOUB', 'NUMERIC']):
+                field_types[name] = 'Double'
+            elif declared_type == 'BLOB':
+                field_types[name] = 'Blob'
+            else:
+                field_types[name] = 'String'
+        return field_types
+
+    def field_names(self):
+        return list(self.field_types().keys())
+
+    def read_only_fields(self):
+        """
+        Returns the names of the fields that cannot be edited.  All sqlite columns are editable, other than the primary
+        key and geometry columns, which are excluded by type.
+        :rtype: set
+        """
+        return set()
+
+    def _column_names(self, fields, field_types):
+        """
+        Converts a field list to table column names, replacing geometry tokens (eg: 'SHAPE@') with the geometry column.
+        """
+        geometry_column = None
+        for field_name, field_type in field_types.items():
+            if field_type == 'Geometry':
+                geometry_column = field_name
+
+        result = []
+        for field_name in fields:
+            if field_name.upper().startswith('SHAPE@'):
+                if not geometry_column:
+                    raise ValueError('No geometry column found in: ' + self.source)
+                result.append(geometry_column)
+            else:
+                result.append(field_name)
+        return result
+
+    def _select(self, connection, columns, where_clause=None):
+        sql = 'SELECT {} FROM "{}"'.format(','.join('"{}"'.format(c) for c in columns), self.table)
+        if where_clause:
+            sql += ' WHERE ' + where_clause
+        return connection.execute(sql)
+
+    def iter_records(self, fields=None, where_clause=None, batch_size=1000):
+        """
+        Yields records from the table as dictionary items, fetching batch_size rows at a time.
+        :param fields: The list of fields to be returned.
+        :type fields:
+        :param where_clause: An optional where clause
+        :type where_clause:
+        :param batch_size: The number of rows fetched from the cursor at a time.
+        :type batch_size: int
+        :return: {fieldname1: value1, fieldname2: value2, ...}
+        :rtype: generator
+        """
+        logging.info('Loading: ' + self.source)
+        field_types = self.field_types()
+        if fields is None:
+            fields = list(field_types.keys())
+        columns = self._column_names(fields, field_types)
+        readers = [self._reader(field_types[c]) for c in columns]
+
+        with closing(self.connect()) as connection:
+            geometry_column, srs_id = self._geometry_column(connection)
+            cursor = self._select(connection, columns, where_clause)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    item = {}
+                    for i in range(len(fields)):
+                        value = readers[i](row[i])
+                        if value is not None and field_types[columns[i]] == 'Geometry':
+                            value = self.to_arcpy_geometry(value, srs_id)
+                        item[fields[i]] = value
+                    yield item
+
+    def _reader(self, field_type):
+        """Returns the function that converts a stored value to the value used for comparisons."""
+        if field_type == 'Date':
+            return self.read_date
+        if field_type == 'Geometry':
+            return self.read_wkb
+        return lambda value: value
+
+    @staticmethod
+    def read_date(value):
+        if value is None or isinstance(value, datetime.datetime):
+            return value
+        if isinstance(value, (int, float)):
+            return datetime.datetime.fromtimestamp(value / 1000.0)
+        return datetime.datetime.fromisoformat(value)
+
+    @staticmethod
+    def write_date(value):
+        value = datetime_utils.to_datetime(value)
+        if value is None:
+            return None
+        return value.isoformat(sep=' ')
+
+    @staticmethod
+    def read_wkb(value):
+        """
+        Returns the WKB component of a stored geometry, removing the GeoPackage binary header if present.
+        Geometries stored as esri json text, when arcpy is not available, are returned as is.
+        """
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        if value[:2] == b'GP':
+            envelope_sizes = [0, 32, 48, 48, 64]
+            envelope = (value[3] >> 1) & 0x07
+            return value[8 + envelope_sizes[envelope]:]
+        return value
+
+    def write_geometry(self, wkb, srs_id):
+        if wkb is None or isinstance(wkb, str):
+            return wkb
+        if self.is_geopackage:
+            # GeoPackage binary header: magic, version 0, flags (little endian, no envelope), srs_id.
+            return b'GP' + struct.pack('<BBi', 0, 1, srs_id) + wkb
+        return wkb
+
+    @staticmethod
+    def to_wkb(geometry):
+        """
+        Converts an arcpy geometry, esri json geometry or WKB value to WKB bytes.
+        When arcpy is not available, esri json geometries cannot be converted, so they are returned as json text.
+        """
+        if geometry is None:
+            return None
+        if isinstance(geometry, (bytes, bytearray)):
+            return bytes(geometry)
+        if isinstance(geometry, (dict, str)):
+            if arcpy is None:
+                return geometry if isinstance(geometry, str) else json.dumps(geometry, sort_keys=True)
+            geometry = arcpy.AsShape(geometry, True)
+        return bytes(geometry.WKB)
+
+    @staticmethod
+    def to_arcpy_geometry(wkb, srs_id=0):
+        """
+        Converts a stored geometry to an arcpy geometry.  When arcpy is not available, WKB is returned as bytes and
+        esri json text as a dictionary.
+        """
+        if arcpy is None:
+            return json.loads(wkb) if isinstance(wkb, str) else bytes(wkb)
+        if isinstance(wkb, str):
+            return arcpy.AsShape(wkb, True)
+        if srs_id:
+            return arcpy.FromWKB(bytearray(wkb), arcpy.SpatialReference(srs_id))
+        return arcpy.FromWKB(bytearray(wkb))
+
+    def _new_value(self, item, source_field, field_type):
+        """Returns a new_data value, converted to the form used for comparisons."""
+        if field_type == 'Geometry':
+            return self.to_wkb(item.get(source_field, None))
+        return item[source_field]
+
+    def update_wkb_field(self, row, field_index: int, new_value=None):
+        return self.update_geometry_field(row, field_index, self.to_wkb(new_value))
+
+    def comparator(self, field_type: str):
+        """
+        Returns the bound update function for the field type.  Stored geometries are compared as WKB.
+        """
+        if field_type.upper() == 'GEOMETRY':
+            return self.update_wkb_field
+        return super().comparator(field_type)
+
+    def update_records(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
+                       rounding=4, case_sensitive=True, shape_field='Shape', use_fingerprints=False):
+        """
+        Updates the table using the new_data, with each record uniquely identified by the self.record_id_field.
+        All edits are committed in a single transaction.
+        :param new_data: Dictionary records indexed by id.  {record_id: {field_name1: value1, field_name2: value2,...}}
+        :type new_data: dict
+        :param fields: The list of fields to be updated.  If an id_field is included, it will not be updated.
+        :type fields:
+        :param where_clause: An optional where clause to filter the updates.
+        :type where_clause:
+        :param add_new: If true, any records found in the new_data that do not have a corresponding record in the table will be added.
+        :type add_new: bool
+        :param delete_unmatched:  If true, any table records found that do not have a corresponding record in the new_data will be deleted.
+        :type delete_unmatched: bool
+        :param rounding: decimal rounding to be used when comparing double format numbers.
+        :type rounding: int
+        :param case_sensitive:
+        :type case_sensitive:
+        :param shape_field: The name of the new_data field containing the geometries to be updated.
+        Set to None if geometry is not to be updated.  Default='Shape'
+        :type shape_field: str
+        :param use_fingerprints: If True, rows with the same fingerprint as their new_data record are skipped without
+        comparing each field.  The number of rows skipped is returned as 'skipped_by_hash'.
+        :type use_fingerprints: bool
+        :return:
+        :rtype:
+        """
+        logging.info('Updating: ' + self.source)
+        result = {'adds': 0, 'deletes': 0, 'updates': 0, 'skipped_by_hash': 0}
+
+        self._rounding = rounding
+        self._case_sensitive = case_sensitive
+
+        diff = RecordDiff(new_data)
+        field_types = self.field_types()
+
+        all_fields = fields[:]
+        if self.id_field not in all_fields:
+            all_fields.append(self.id_field)
+        if shape_field and 'Geometry' in field_types.values():
+            if shape_field in all_fields:
+                all_fields.remove(shape_field)
+            all_fields.append('SHAPE@')
+        columns = self._column_names(all_fields, field_types)
+        column_types = [field_types[c] for c in columns]
+        readers = [self._reader(t) for t in column_types]
+        id_index = all_fields.index(self.id_field)
+        field_count = len(all_fields)
+
+        update_plan = self.compile_plan(all_fields, field_types, shape_field=shape_field, skip_field=self.id_field)
+        insert_plan = self.compile_plan(all_fields, field_types, shape_field=shape_field)
+
+        fingerprinter = None
+        if use_fingerprints:
+            fingerprinter = fingerprints.RecordFingerprinter.for_field_types(field_types=[f[3] for f in update_plan],
+                                                                             rounding=rounding,
+                                                                             case_sensitive=case_sensitive)
+            # new records are fingerprinted once, with their geometries converted to WKB, before the rows are read.
+            new_fingerprints = {key: fingerprinter.fingerprint([self._new_value(item, f[2], f[3]) for f in update_plan])
+                                for key, item in new_data.items()}
+
+        with closing(self.connect()) as connection:
+            geometry_column, srs_id = self._geometry_column(connection)
+
+            select_columns = ['rowid'] + columns
+            for stored_row in self._select(connection, select_columns, where_clause).fetchall():
+                rowid = stored_row[0]
+                row = [readers[i](stored_row[i + 1]) for i in range(field_count)]
+                new_item = diff.match(row[id_index])
+                if new_item:
+                    if fingerprinter:
+                        current_hash = fingerprinter.fingerprint([row[f[0]] for f in update_plan])
+                        if current_hash == new_fingerprints[row[id_index]]:
+                            result['skipped_by_hash'] += 1
+                            continue
+
+                    if self.apply_plan(update_plan, row, new_item):
+                        diff.updates.append(self._write_values(row, column_types, srs_id) + [rowid])
+                elif delete_unmatched:
+                    diff.deletes.append((rowid,))
+
+            if add_new:
+                for key, item in diff.unmatched():
+                    row = [None] * field_count
+                    self.apply_plan(insert_plan, row, item)  # ensure all data rules are applied to the value being added.
+                    diff.adds.append(self._write_values(row, column_types, srs_id))
+
+            quoted_columns = ['"{}"'.format(c) for c in columns]
+            with connection:  # a single transaction for all edits.
+                if diff.deletes:
+                    connection.executemany('DELETE FROM "{}" WHERE rowid = ?'.format(self.table), diff.deletes)
+                if diff.updates:
+                    connection.executemany('UPDATE "{}" SET {} WHERE rowid = ?'.format(self.table, ','.join(c + ' = ?' for c in quoted_columns)),
+                                           diff.updates)
+                if diff.adds:
+                    connection.executemany('INSERT INTO "{}" ({}) VALUES ({})'.format(self.table, ','.join(quoted_columns), ','.join('?' * field_count)),
+                                           diff.adds)
+
+        result.update(diff.counts())
+        self.invalidate_cache()
+        return result
+
+    def _read_rows(self, fields, field_types, where_clause=None):
+        """
+        Yields (rowid, [value, ...]) for each row, with values in field order and in the form used for comparisons.
+        """
+        columns = self._column_names(fields, field_types)
+        readers = [self._reader(field_types[c]) for c in columns]
+        with closing(self.connect()) as connection:
+            for stored_row in self._select(connection, ['rowid'] + columns, where_clause).fetchall():
+                yield stored_row[0], [readers[i](stored_row[i + 1]) for i in range(len(columns))]
+
+    def apply_edit_plan(self, plan):
+        """
+        Applies an EditPlan created by plan_updates in a single transaction.  Rows are identified by rowid.
+        """
+        self._check_plan(plan)
+        logging.info('Applying edit plan: ' + self.source)
+        field_types = self.field_types()
+
+        with closing(self.connect()) as connection:
+            geometry_column, srs_id = self._geometry_column(connection)
+            with connection:  # a single transaction for all edits.
+                if plan.deletes:
+                    connection.executemany('DELETE FROM "{}" WHERE rowid = ?'.format(self.table), [(rowid,) for rowid in plan.deletes])
+
+                for item in plan.updates:
+                    fields = list(item['values'].keys())
+                    columns = self._column_names(fields, field_types)
+                    values = self._write_values([item['values'][f] for f in fields], [field_types[c] for c in columns], srs_id)
+                    connection.execute('UPDATE "{}" SET {} WHERE rowid = ?'.format(self.table, ','.join('"{}" = ?'.format(c) for c in columns)),
+                                       values + [item['object_id']])
+
+                if plan.adds:
+                    fields = list(plan.adds[0].keys())
+                    columns = self._column_names(fields, field_types)
+                    column_types = [field_types[c] for c in columns]
+                    connection.executemany('INSERT INTO "{}" ({}) VALUES ({})'.format(self.table, ','.join('"{}"'.format(c) for c in columns),
+                                                                                     ','.join('?' * len(columns))),
+                                           [self._write_values([item[f] for f in fields], column_types, srs_id) for item in plan.adds])
+
+        self.invalidate_cache()
+        return plan.counts()
+
+    def _write_values(self, row, column_types, srs_id):
+        """Converts row values to their stored form."""
+        result = []
+        for value, field_type in zip(row, column_types):
+            if field_type == 'Date':
+                value = self.write_date(value)
+            elif field_type == 'Geometry':
+                value = self.write_geometry(value, srs_id)
+            result.append(value)
+        return result
+
+
 class TableBase(object):
     def __init__(self, source, id_field, shape_field='Shape'):
         self.source = source
@@ -619,12 +1564,57 @@ class TableBase(object):
         self.shape_field = shape_field
         self._helper = FeatureSourceHelper.new_helper(source, id_field)
 
-    def records(self, fields=None, where_clause=None):
-        return self._helper.records(fields=fields, where_clause=where_clause)
+    def records(self, fields=None, where_clause=None, compact=False):
+        return self._helper.records(fields=fields, where_clause=where_clause, compact=compact)
 
-    def indexed_records(self, fields, id_field=None, where_clause=None):
+    def plan_updates(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
+                     rounding=4, case_sensitive=True):
+        """
+        Calculates the edits update_records would make, without applying them.
+        The plan can be inspected, saved using EditPlan.save and applied later, including from another machine.
+        :return:
+        :rtype: graphc.da.edit_plan.EditPlan
+        """
+        return self._helper.plan_updates(new_data=new_data,
+                                         fields=fields,
+                                         where_clause=where_clause,
+                                         add_new=add_new,
+                                         delete_unmatched=delete_unmatched,
+                                         rounding=rounding,
+                                         case_sensitive=case_sensitive,
+                                         shape_field=self.shape_field)
+
+    def apply(self, plan):
+        """
+        Applies an EditPlan created by plan_updates for this source.
+        :param plan: The plan to be applied.
+        :type plan: graphc.da.edit_plan.EditPlan
+        :return: {'adds': int, 'deletes': int, 'updates': int, ...}
+        :rtype: dict
+        """
+        return self._helper.apply_edit_plan(plan)
+
+    def use_mirror(self, mirror):
+        """
+        Diffs updates to a feature service source against a local mirror instead of querying the service.
+        Ignored for other sources.  See FeatureServiceHelper.update_records
+        :param mirror: The mirror to be used, or None to query the service.
+        :type mirror: graphc.da.layer_mirror.LayerMirror
+        """
+        if isinstance(self._helper, FeatureServiceHelper):
+            self._helper.mirror = mirror
+
+    def iter_records(self, fields=None, where_clause=None, batch_size=1000):
+        """
+        Yields records one at a time without loading the full table.  The records are not cached.  See
+        FeatureSourceHelper.iterate
+        """
+        return self._helper.iterate(fields=fields, where_clause=where_clause, batch_size=batch_size)
+
+    def indexed_records(self, fields, id_field=None, where_clause=None, batch_size=1000, use_cache=False):
         """
         Loads records from the feature class and returns them as a dictionary of records indexed by the id_field values.
+        The records are streamed from the source one batch at a time and are not cached, unless use_cache is True.
         :param fields: The list of fields to be returned.
         :type fields: list
         :param id_field: Optional.  The field name to be used for indexing.  If None or not defined, the self.id_field value will be used.
@@ -632,6 +1622,10 @@ class TableBase(object):
         :type id_field: string
         :param where_clause: An optional where clause
         :type where_clause:
+        :param batch_size: The number of rows read from the source in each request.  See FeatureSourceHelper.iter_records
+        :type batch_size: int
+        :param use_cache: If True, the records are loaded through the query cache.  See FeatureSourceHelper.records
+        :type use_cache: bool
         :return: {id_field_value: {id_fieldname: id_value, fieldname1: value1, fieldname2: value2, ...}, ...]
         :rtype: dict
         """
@@ -641,16 +1635,21 @@ class TableBase(object):
         if id_field not in fields:
             fields.append(id_field)
 
-        records = self.records(fields, where_clause)
+        if use_cache:
+            source_records = self._helper.records(fields, where_clause)
+        else:
+            source_records = self._helper.iter_records(fields=fields, where_clause=where_clause, batch_size=batch_size)
+
         result = {}
-        for record in records:
+        for record in source_records:
             result[record[id_field]] = record
 
         return result
 
-    def values_by_id(self, value_field, id_field=None, where_clause=None):
+    def values_by_id(self, value_field, id_field=None, where_clause=None, batch_size=1000, use_cache=False):
         """
-        returns a lookup dictionary of {record_id: value}
+        returns a lookup dictionary of {record_id: value}.  The records are streamed from the source one batch at a time
+        and are not cached, unless use_cache is True.
         :param value_field: The value field to be returned.
         :type value_field: str
         :param id_field: Optional.  The field name to be used for indexing.  If None or not defined, the self.id_field value will be used.
@@ -658,26 +1657,66 @@ class TableBase(object):
         :type id_field: string
         :param where_clause: Optional where clause
         :type where_clause:
+        :param batch_size: The number of rows read from the source in each request.  See FeatureSourceHelper.iter_records
+        :type batch_size: int
+        :param use_cache: If True, the records are loaded through the query cache.  See FeatureSourceHelper.records
+        :type use_cache: bool
         :return: {record_id: value}
         :rtype: dict
         """
-        result = {}
         if not id_field:
             id_field = self.id_field
-        for item in self.records(fields=[id_field, value_field], where_clause=where_clause):
+
+        fields = [id_field, value_field]
+        if use_cache:
+            source_records = self._helper.records(fields, where_clause)
+        else:
+            source_records = self._helper.iter_records(fields=fields, where_clause=where_clause, batch_size=batch_size)
+
+        result = {}
+        for item in source_records:
             result[item[id_field]] = item[value_field]
 
         return result
 
+    def geometries_by_id(self, id_field=None, where_clause=None, cache=None):
+        """
+        Returns a lookup of {record_id: arcpy geometry} for a local feature class, using the on-disk geometry cache.
+        The source is only read when it has changed since it was cached.
+        :param id_field: Optional.  The field name to be used for indexing.  If None or not defined, the self.id_field value will be used.
+        :type id_field: string
+        :param where_clause: Optional where clause
+        :type where_clause:
+        :param cache: Optional.  The cache to be used.  If None, the shared cache is used.
+        :type cache: graphc.da.geometry_cache.GeometryCache
+        :return: {record_id: geometry}
+        :rtype: graphc.da.geometry_cache.CachedGeometries
+        """
+        # the geometry cache reads feature classes with arcpy, so it is only imported for local feature classes.
+        from graphc.da import geometry_cache
+
+        if cache is None:
+            cache = geometry_cache.default_cache()
+        return cache.load(source=self.source, id_field=id_field or self.id_field, where_clause=where_clause)
+
+    def xy_arrays(self, id_field=None, where_clause=None, cache=None):
+        """
+        Returns the xy coords of a local point feature class as arrays indexed by id, using the on-disk geometry cache.
+        See da_arcpy.load_xy_arrays
+        :rtype: graphc.da.da_arcpy.IndexedArrays
+        """
+        return self.geometries_by_id(id_field=id_field, where_clause=where_clause, cache=cache).xy_arrays()
+
     def field_names(self):
         return self._helper.field_names()
 
     def update_records(self, new_data, fields=None, where_clause=None, add_new=False, delete_unmatched=False,
-                       rounding=4, case_sensitive=True):
-        self._helper.update_records(new_data=new_data,
-                                    fields=fields,
-                                    where_clause=where_clause,
-                                    add_new=add_new,
-                                    delete_unmatched=delete_unmatched,
-                                    rounding=rounding,
-                                    case_sensitive=case_sensitive)
+                       rounding=4, case_sensitive=True, use_fingerprints=False):
+        return self._helper.update_records(new_data=new_data,
+                                           fields=fields,
+                                           where_clause=where_clause,
+                                           add_new=add_new,
+                                           delete_unmatched=delete_unmatched,
+                                           rounding=rounding,
+                                           case_sensitive=case_sensitive,
+                                           use_fingerprints=use_fingerprints)
@@ -0,0 +1,95 @@
+"""
+A micro-benchmark comparing per-cell update_field dispatch with a compiled comparator plan.
+The benchmark runs against synthetic in-memory rows, so no feature class is read or written.
+
+Usage: python -m graphc.da.benchmark_comparators -n 1000000
+"""
+import argparse
+import datetime
+import random
+import time
+
+from graphc.da.arcgis_helpers import FeatureClassHelper
+
+
+fields = ['RecordId', 'State', 'Value', 'Cases', 'Date']
+field_types = {'RecordId': 'String', 'State': 'String', 'Value': 'Double', 'Cases': 'Integer', 'Date': 'Date'}
+
+
+def synthetic_rows(pool_size=1000, change_rate=0.05, seed=1):
+    """
+    Creates a pool of (row, new_item) pairs.  Approximately change_rate of the new items differ from their row.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+    result = []
+    for i in range(pool_size):
+        row = ['{}_NSW'.format(i), 'NSW', rng.random() * 1000, rng.randint(0, 500), start + datetime.timedelta(days=i % 365)]
+        new_item = dict(zip(fields, row))
+        if rng.random() < change_rate:
+            new_item['Cases'] += 1
+        result.append((row, new_item))
+    return result
+
+
+def run_dispatch(helper, pool, row_count):
+    updates = 0
+    field_count = len(fields)
+    pool_size = len(pool)
+    for n in range(row_count):
+        source_row, new_item = pool[n % pool_size]
+        row = list(source_row)
+        update_required = False
+        for i in range(field_count):
+            field_name = fields[i]
+            if field_name != helper.id_field:
+                if helper.update_field(row, i, new_item[field_name], field_types[field_name]):
+                    update_required = True
+        if update_required:
+            updates += 1
+    return updates
+
+
+def run_plan(helper, pool, row_count):
+    updates = 0
+    plan = helper.compile_plan(fields, field_types, skip_field=helper.id_field)
+    apply_plan = helper.apply_plan
+    pool_size = len(pool)
+    for n in range(row_count):
+        source_row, new_item = pool[n % pool_size]
+        row = list(source_row)
+        if apply_plan(plan, row, new_item):
+            updates += 1
+    return updates
+
+
+def benchmark(row_count=1000000):
+    helper = FeatureClassHelper(source='memory', id_field='RecordId')
+    pool = synthetic_rows()
+
+    result = {}
+    for name, function in [('dispatch', run_dispatch), ('plan', run_plan)]:
+        start = time.perf_counter()
+        updates = function(helper, pool, row_count)
+        elapsed = time.perf_counter() - start
+        result[name] = {'seconds': elapsed, 'rows_per_second': row_count / elapsed, 'updates': updates}
+
+    result['speedup'] = result['plan']['rows_per_second'] / result['dispatch']['rows_per_second']
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows",
+                        type=int,
+                        default=1000000,
+                        help="The number of synthetic rows to compare.")
+    args = parser.parse_args()
+
+    results = benchmark(row_count=args.rows)
+    for method in ['dispatch', 'plan']:
+        print('{:<10}{:>12,.0f} rows/s  ({:.2f}s, {} updates)'.format(method,
+                                                                    results[method]['rows_per_second'],
+                                                                    results[method]['seconds'],
+                                                                    results[method]['updates']))
+    print('speedup: {:.2f}x'.format(results['speedup']))
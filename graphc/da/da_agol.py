@@ -1,9 +1,15 @@
+import asyncio
 import logging
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
 from arcgis.features import Feature
+from arcgis.features import FeatureSet
+
+from graphc.da import edit_pipeline
+from graphc.da import layer_pool
 
 from graphc.utilities import datetime_utils
 
@@ -24,7 +30,7 @@ def date_field_value_to_date_code(value, out_format):
 
 def delete_rows(service_url, where_clause):
     deletes = []
-    lyr = FeatureLayer(service_url)
+    lyr = layer_pool.default_pool.layer(service_url)
     query_result = lyr.query(where=where_clause, return_ids_only=True)
     deletes = query_result['objectIds']
 
@@ -34,7 +40,136 @@ def delete_rows(service_url, where_clause):
         return None
 
 
-def update_layer(layer, adds=None, deletes=None, updates=None, chunk_size=5000):
+def supports_pagination(layer):
+    """
+    Returns True if the layer supports resultOffset/resultRecordCount queries (advancedQueryCapabilities.supportsPagination).
+    """
+    capabilities = layer.properties.get('advancedQueryCapabilities', None) or {}
+    return bool(capabilities.get('supportsPagination', False))
+
+
+def paged_queries(layer, where='1=1', page_size=1000, count=None):
+    """
+    Returns the query arguments for each page of the rows matching the where clause, in object id order.
+    Layers that support pagination are paged using resultOffset/resultRecordCount.  Other layers are paged by object id
+    ranges, using the sorted object ids of the matching rows, so each page holds at most page_size rows.
+    :param layer: The Arcgis Feature Layer to be queried
+    :type layer: arcgis.features.FeatureLayer
+    :param where: The where clause.  Default='1=1'
+    :type where: str
+    :param page_size: The number of rows in each page.
+    :type page_size: int
+    :param count: Optional.  The number of matching rows, if already known.  Only used for layers that support pagination.
+    :type count: int
+    :return: [{query argument: value, ...}, ...]  The where clause is included in each page query.
+    :rtype: list
+    """
+    object_id_field = layer.properties.objectIdField
+    if supports_pagination(layer):
+        if count is None:
+            count = layer.query(where=where, return_count_only=True)
+        order_by = '{} ASC'.format(object_id_field)
+        return [{'where': where, 'order_by_fields': order_by, 'result_offset': offset,
+                 'result_record_count': page_size, 'return_all_records': False}
+                for offset in range(0, count, page_size)]
+
+    object_ids = sorted(layer.query(where=where, return_ids_only=True)['objectIds'] or [])
+    page_queries = []
+    for start in range(0, len(object_ids), page_size):
+        page_ids = object_ids[start:start + page_size]
+        page_where = '({}) AND {} >= {} AND {} <= {}'.format(where, object_id_field, page_ids[0], object_id_field, page_ids[-1])
+        page_queries.append({'where': page_where})
+    return page_queries
+
+
+def query_page(layer, page_query, out_fields='*', return_geometry=True, retries=3, index=0):
+    """
+    Queries a single page returned by paged_queries, retrying failed requests.
+    :param page_query: The query arguments for the page.
+    :type page_query: dict
+    :param retries: The number of times a failed request is retried before the query fails.
+    :type retries: int
+    :param index: The page index, used in log messages.
+    :type index: int
+    :rtype: arcgis.features.FeatureSet
+    """
+    attempt = 0
+    while True:
+        try:
+            return layer.query(out_fields=out_fields, return_geometry=return_geometry, **page_query)
+        except Exception as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            logging.warning('Page {} failed ({}).  Retry {} of {}'.format(index, e, attempt, retries))
+            time.sleep(2 ** attempt)
+
+
+def query_pages(layer, where='1=1', out_fields='*', return_geometry=True, page_size=None, max_workers=4, retries=3):
+    """
+    Queries a feature layer by fetching result pages concurrently.
+    The number of matching rows is queried first, then pages of page_size rows, ordered by object id, are fetched on a
+    bounded thread pool using resultOffset/resultRecordCount.  Pages are returned in order as a single feature set.
+    Layers that do not support pagination (advancedQueryCapabilities.supportsPagination) are paged by object id
+    ranges instead, using the sorted object ids of the matching rows.
+    :param layer: The Arcgis Feature Layer to be queried
+    :type layer: arcgis.features.FeatureLayer
+    :param where: The where clause.  Default='1=1'
+    :type where: str
+    :param out_fields: The fields to be returned, as a comma delimited string or list.  Default='*'
+    :type out_fields: str
+    :param return_geometry: If True, geometries are returned.
+    :type return_geometry: bool
+    :param page_size: The number of rows in each page.  Limited by the layer maxRecordCount.  If None, the maxRecordCount is used.
+    :type page_size: int
+    :param max_workers: The maximum number of pages fetched at the same time.
+    :type max_workers: int
+    :param retries: The number of times a failed page is retried before the query fails.
+    :type retries: int
+    :return: The combined result.
+    :rtype: arcgis.features.FeatureSet
+    """
+    if isinstance(out_fields, list):
+        out_fields = ','.join(out_fields)
+
+    properties = layer.properties
+    max_record_count = properties.get('maxRecordCount', None) or 1000
+    if page_size:
+        page_size = min(page_size, max_record_count)
+    else:
+        page_size = max_record_count
+
+    count = layer.query(where=where, return_count_only=True)
+    if count <= page_size:
+        return layer.query(where=where, out_fields=out_fields, return_geometry=return_geometry)
+
+    page_queries = paged_queries(layer, where=where, page_size=page_size, count=count)
+    if not page_queries:
+        return layer.query(where=where, out_fields=out_fields, return_geometry=return_geometry)
+
+    def fetch_page(page):
+        index, page_query = page
+        return query_page(layer, page_query, out_fields=out_fields, return_geometry=return_geometry, retries=retries, index=index)
+
+    logging.info('Querying {} rows from {} in pages of {}'.format(count, layer.url, page_size))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = list(executor.map(fetch_page, enumerate(page_queries)))
+
+    features = []
+    for page in pages:
+        features.extend(page.features)
+
+    first = pages[0]
+    return FeatureSet(features=features,
+                      fields=first.fields,
+                      geometry_type=first.geometry_type,
+                      spatial_reference=first.spatial_reference,
+                      object_id_field_name=first.object_id_field_name,
+                      global_id_field_name=first.global_id_field_name)
+
+
+def update_layer(layer, adds=None, deletes=None, updates=None, chunk_size=5000, max_workers=4, on_chunk=None, journal=None,
+                 add_key_field=None):
     """
     Performs updates on an arcgis feature service in manageable chunks.
     Updates are performed using multiple calls to the service where needed.  Large sets of updates are broken into
@@ -43,6 +178,8 @@ def update_layer(layer, adds=None, deletes=None, updates=None, chunk_size=5000):
     - Adds
     - Updates
     If no elements are submitted for Adds, Deletes or Updates, then that stage of the process is skipped.
+    Chunks are sized by payload and submitted concurrently within each stage.  See edit_submitter.EditSubmitter
+    This is a synchronous wrapper of update_layer_async.
 
     :param layer: The Arcgis Feature Layer to be updated
     :type layer: arcgis.features.FeatureLayer
@@ -52,39 +189,78 @@ def update_layer(layer, adds=None, deletes=None, updates=None, chunk_size=5000):
     :type deletes:
     :param updates:
     :type updates:
-    :param chunk_size:
-    :type chunk_size:
-    :return:
-    :rtype:
-    """
-    logging.info('Updating: ' + layer.url)
-    result = {'adds': 0, 'deletes': 0, 'updates': 0}
-    # perform updates in order deletes, adds, updates to support models where:
-    # - updates are performed by deleting old records and replacing with new (remove old items before adding new)
-    # - items can be added and updated in same cycles (ensure adds are in place before updates are applied)
-    if deletes:
-        for chunk in _list_chunks(master_list=deletes, chunk_size=chunk_size):
-            logging.info('Applying {} Deletes'.format(len(chunk)))
-            layer.edit_features(deletes=str(chunk))
-        result['deletes'] = len(deletes)
-        logging.info('Total Deletes: {}'.format(result['deletes']))
-
-    x = None
-    if adds:
-        for chunk in _list_chunks(master_list=adds, chunk_size=chunk_size):
-            logging.info('Applying {} Adds'.format(len(chunk)))
-            x = layer.edit_features(adds=chunk)
-        result['adds'] = len(adds)
-        logging.info('Total Adds: {}'.format(result['adds']))
-
-    if updates:
-        for chunk in _list_chunks(master_list=updates, chunk_size=chunk_size):
-            logging.info('Applying {} Updates'.format(len(chunk)))
-            layer.edit_features(updates=chunk)
-        result['updates'] = len(updates)
-        logging.info('Total Updates: {}'.format(result['updates']))
-
-    return result
+    :param chunk_size: The maximum number of rows in each chunk.
+    :type chunk_size: int
+    :param max_workers: The maximum number of chunks submitted at the same time.
+    :type max_workers: int
+    :param on_chunk: Optional.  A function called with the chunk detail as each chunk completes.  Ignored if a journal is used.
+    :type on_chunk: function
+    :param journal: Optional.  If supplied, the edits are recorded as a plan and each applied chunk is journaled, so an
+    interrupted update resumes from the unapplied items when the same edits are submitted again.
+    :type journal: graphc.da.edit_journal.EditJournal
+    :param add_key_field: Optional.  A field holding a unique key for each add.  An add chunk that fails after it may have
+    been committed is only retried when a key field is supplied, and then only for the adds not found in the layer by
+    key.  See edit_submitter.EditSubmitter
+    :type add_key_field: str
+    :return: {'adds': int, 'deletes': int, 'updates': int, 'chunks': [detail, ...], 'failures': [detail, ...]}
+    :rtype: dict
+    """
+    return edit_pipeline.run(update_layer_async, layer, adds=adds, deletes=deletes, updates=updates, chunk_size=chunk_size,
+                             max_workers=max_workers, on_chunk=on_chunk, journal=journal, add_key_field=add_key_field)
+
+
+async def update_layer_async(layer, adds=None, deletes=None, updates=None, chunk_size=5000, max_workers=4, on_chunk=None,
+                             journal=None, limiter=None, transport=None, add_key_field=None):
+    """
+    Performs updates on an arcgis feature service within an event loop.  See update_layer.
+    :param layer: The Arcgis Feature Layer to be updated.  Only used to create the default transport if transport is None.
+    :type layer: arcgis.features.FeatureLayer
+    :param limiter: Optional.  Limits the concurrent requests to each host when several layers are updated together.
+    :type limiter: graphc.da.edit_pipeline.HostLimiter
+    :param transport: Optional.  The transport used to apply the edits.  Default: edit_pipeline.LayerTransport(layer)
+    :type transport:
+    :param add_key_field: Optional.  A field holding a unique key for each add.  See update_layer
+    :type add_key_field: str
+    :return: {'adds': int, 'deletes': int, 'updates': int, 'chunks': [detail, ...], 'failures': [detail, ...]}
+    :rtype: dict
+    """
+    if transport is None:
+        transport = edit_pipeline.LayerTransport(layer)
+    logging.info('Updating: ' + transport.url)
+    submitter = edit_pipeline.AsyncEditSubmitter(transport=transport, limiter=limiter, max_workers=max_workers, max_rows=chunk_size,
+                                                 add_key_field=add_key_field)
+    if journal is not None:
+        plan_id = journal.begin(transport.url, adds=adds, deletes=deletes, updates=updates)
+        return await journal.apply_async(plan_id, submitter.submit_async)
+
+    return await submitter.submit_async(adds=adds, deletes=deletes, updates=updates, on_chunk=on_chunk)
+
+
+async def update_layers_async(jobs, per_host=4):
+    """
+    Updates several layers at the same time, with the requests to each host limited to per_host.
+    :param jobs: The updates for each layer.  [{'layer': FeatureLayer, 'adds': list, 'deletes': list, 'updates': list}, ...]
+    Each job can also include the other update_layer_async arguments, eg: 'transport', 'journal' or 'chunk_size'.
+    :type jobs: list
+    :param per_host: The maximum number of concurrent requests to a host.
+    :type per_host: int
+    :return: The update_layer_async result for each job, in job order.
+    :rtype: list
+    """
+    limiter = edit_pipeline.HostLimiter(per_host=per_host)
+    tasks = []
+    for job in jobs:
+        job = dict(job)
+        layer = job.pop('layer', None)
+        tasks.append(update_layer_async(layer, limiter=limiter, **job))
+    return list(await asyncio.gather(*tasks))
+
+
+def update_layers(jobs, per_host=4):
+    """
+    Updates several layers at the same time.  This is a synchronous wrapper of update_layers_async.
+    """
+    return edit_pipeline.run(update_layers_async, jobs, per_host=per_host)
 
 
 # Field Update Utils
@@ -7,6 +7,8 @@ import arcpy
 import numpy
 import logging
 
+from graphc.da import records
+
 
 def load_xy_geometries(source, id_field, where_clause=None):
     """
@@ -81,7 +83,7 @@ def load_indexed_values(source, id_field, value_field, where_clause=None):
     return result
 
 
-def load_indexed_items(source, id_field, value_fields, where_clause=None):
+def load_indexed_items(source, id_field, value_fields, where_clause=None, compact=False):
     """
     Builds a lookup of named values indexed by an id. {id, {field_name: value, ...}}
     :param source: The path to the data source.
@@ -92,6 +94,8 @@ def load_indexed_items(source, id_field, value_fields, where_clause=None):
     :param value_fields: list
     :param where_clause: Optional: A where clause to filter the results returned.
     :type where_clause: str
+    :param compact: If True, items are returned as compact read only records instead of dictionaries.  See graphc.da.records
+    :type compact: bool
 
     :return: {id, value}
     :rtype: dict
@@ -106,6 +110,13 @@ def load_indexed_items(source, id_field, value_fields, where_clause=None):
 
     field_count = len(fields)
     result = {}
+    if compact:
+        record_class = records.record_type(fields)
+        with arcpy.da.SearchCursor(source, fields, where_clause) as cursor:
+            for row in cursor:
+                result[row[0]] = record_class(row)
+        return result
+
     with arcpy.da.SearchCursor(source, fields, where_clause) as cursor:
         for row in cursor:
             id_value = row[0]
@@ -117,6 +128,158 @@ def load_indexed_items(source, id_field, value_fields, where_clause=None):
     return result
 
 
+# integer nulls are read as this value, then converted to NaN when the column is converted to float64.
+_null_integer = numpy.iinfo(numpy.int32).min
+
+_float_field_types = ('Double', 'Single')
+_integer_field_types = ('Integer', 'SmallInteger', 'OID')
+_string_field_types = ('String', 'GUID', 'GlobalID')
+
+
+class IndexedArrays(object):
+    def __init__(self, ids, columns):
+        """
+        Column arrays with a lookup of the row index of each id.  If ids are not unique, the last row found is indexed.
+        :param ids: The id of each row.
+        :type ids: numpy.ndarray
+        :param columns: The value arrays, by name.  Each array has the same length as ids.
+        :type columns: dict
+        """
+        self.ids = ids
+        self.columns = columns
+        self.index = {id_value: i for i, id_value in enumerate(ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_value):
+        return id_value in self.index
+
+    def row_index(self, id_value):
+        """
+        Returns the row index of an id, or None if the id is not found.
+        """
+        return self.index.get(id_value, None)
+
+    def row_indexes(self, id_values):
+        """
+        Returns the row index of each id as an array, with -1 for ids that are not found.
+        :rtype: numpy.ndarray
+        """
+        return numpy.fromiter((self.index.get(id_value, -1) for id_value in id_values), dtype=numpy.int64)
+
+    def value(self, id_value, field, default=None):
+        """
+        Returns the value of a field for an id.  Null numeric values are returned as NaN.
+        """
+        i = self.index.get(id_value, None)
+        if i is None:
+            return default
+        return self.columns[field][i].item()
+
+    def item(self, id_value):
+        """
+        Returns the values for an id as a dictionary, or None if the id is not found.  {field_name: value, ...}
+        """
+        i = self.index.get(id_value, None)
+        if i is None:
+            return None
+        return {field: column[i].item() for field, column in self.columns.items()}
+
+    def xy(self, id_value):
+        """
+        Returns the xy coords for an id in the geometry format used by load_xy_geometries, or None if the id is not
+        found or the geometry is empty.
+        :return: {'x': float, 'y': float}
+        :rtype: dict
+        """
+        i = self.index.get(id_value, None)
+        if i is None:
+            return None
+        x = self.columns['x'][i]
+        y = self.columns['y'][i]
+        if numpy.isnan(x) or numpy.isnan(y):
+            return None
+        return {'x': float(x), 'y': float(y)}
+
+    def xy_tuple(self, id_value):
+        """
+        Returns the xy coords for an id as a tuple, or None if the id is not found or the geometry is empty.
+        :rtype: tuple
+        """
+        xy = self.xy(id_value)
+        return (xy['x'], xy['y']) if xy else None
+
+
+def load_xy_arrays(source, id_field, where_clause=None):
+    """
+    Gets xy coords as contiguous float64 arrays, with an index of the row for each id_field value.  Empty geometries
+    have NaN coords.  This is the array equivalent of load_xy_geometries and load_xy_tuples.
+    :param source: The path to the data source.
+    :type source: str
+    :param id_field: the field that will be used to index the result.  If ids are not unique, only last item found will be returned.
+    :type id_field: str
+    :param where_clause: Optional: A where clause to filter the results returned.
+    :type where_clause: str
+    :return: Arrays with 'x' and 'y' columns.
+    :rtype: IndexedArrays
+    """
+    logging.info('Loading xy arrays from: ' + source)
+    data = arcpy.da.FeatureClassToNumPyArray(source, [id_field, 'SHAPE@X', 'SHAPE@Y'], where_clause,
+                                             null_value={'SHAPE@X': numpy.nan, 'SHAPE@Y': numpy.nan})
+
+    columns = {'x': numpy.ascontiguousarray(data['SHAPE@X'], dtype=numpy.float64),
+               'y': numpy.ascontiguousarray(data['SHAPE@Y'], dtype=numpy.float64)}
+    return IndexedArrays(ids=data[id_field], columns=columns)
+
+
+def load_value_arrays(source, id_field, value_fields, where_clause=None):
+    """
+    Gets field values as arrays, with an index of the row for each id_field value.  Numeric fields are returned as
+    contiguous float64 arrays with NaN for nulls, string fields as string arrays with '' for nulls, and other fields in
+    the array type used by arcpy.  This is the array equivalent of load_indexed_values and load_indexed_items.
+    :param source: The path to the data source.
+    :type source: str
+    :param id_field: the field that will be used to index the result.  If ids are not unique, only last item found will be returned.
+    :type id_field: str
+    :param value_fields: the list of fields to be returned.
+    :type value_fields: list
+    :param where_clause: Optional: A where clause to filter the results returned.
+    :type where_clause: str
+    :return: Arrays for each value field.
+    :rtype: IndexedArrays
+    """
+    logging.info('Loading value arrays from: ' + source)
+    field_types = {field.name: field.type for field in arcpy.ListFields(source)}
+
+    fields = [id_field] + [field for field in value_fields if field != id_field]
+    null_values = {}
+    for field in fields:
+        field_type = field_types.get(field, None)
+        if field_type in _float_field_types:
+            null_values[field] = numpy.nan
+        elif field_type in _integer_field_types:
+            null_values[field] = _null_integer
+        elif field_type in _string_field_types:
+            null_values[field] = ''
+
+    data = arcpy.da.TableToNumPyArray(source, fields, where_clause, null_value=null_values)
+
+    columns = {}
+    for field in value_fields:
+        field_type = field_types.get(field, None)
+        if field_type in _float_field_types:
+            columns[field] = numpy.ascontiguousarray(data[field], dtype=numpy.float64)
+        elif field_type in _integer_field_types:
+            column = numpy.ascontiguousarray(data[field], dtype=numpy.float64)
+            column[data[field] == _null_integer] = numpy.nan
+            columns[field] = column
+        else:
+            columns[field] = numpy.ascontiguousarray(data[field])
+
+    return IndexedArrays(ids=data[id_field], columns=columns)
+
+
 def unique_field_values(table, field):
     data = arcpy.da.TableToNumPyArray(table, [field])
     return numpy.unique(data[field])
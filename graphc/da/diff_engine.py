@@ -0,0 +1,107 @@
+"""
+A copy free diff engine used to match existing rows against a dictionary of new records.
+The new records are treated as read-only.  Matched keys are tracked in a set instead of popping items from a copy of the
+new records, so the cost of a diff does not depend on the size of the records or the geometries they carry.
+"""
+
+
+class RecordDiff(object):
+    """
+    Collects the adds, updates and deletes required to bring a set of existing rows into line with the new records.
+    Typical use:
+    - call match(key) for each existing row.  A None result means the row has no (remaining) new record.
+    - append changed rows to updates and unmatched row ids to deletes.
+    - call unmatched() once all rows have been visited to find the new records that require adds.
+    """
+    def __init__(self, new_data):
+        """
+        :param new_data: The new records indexed by key.  {key: record, ...}  The dictionary and its records are not altered,
+        so records can be dictionaries or compact read only records (see graphc.da.records).
+        :type new_data: dict
+        """
+        self.new_data = new_data
+        self.adds = []
+        self.updates = []
+        self.deletes = []
+
+        self._matched = set()
+        self._claims = {}
+
+    def available(self, key):
+        """
+        Returns True if the key has a new record that has not yet been matched.
+        :param key: The record key
+        :type key:
+        :return:
+        :rtype: bool
+        """
+        return key in self.new_data and key not in self._matched
+
+    def match(self, key):
+        """
+        Returns the new record for the key and marks it as matched.  Each key can only be matched once, subsequent
+        matches (eg: duplicate rows in the existing data) return None.
+        :param key: The record key
+        :type key:
+        :return: The new record, or None if the key has no available record.
+        :rtype: dict
+        """
+        if key in self._matched:
+            return None
+
+        item = self.new_data.get(key, None)
+        if key in self.new_data:
+            self._matched.add(key)
+
+        return item
+
+    def claim(self, key, count_field):
+        """
+        Claims one instance of a counted record, where each new record represents record[count_field] existing rows.
+        The key is marked as matched once all instances have been claimed.
+        :param key: The record key
+        :type key:
+        :param count_field: The name of the record field holding the number of instances.
+        :type count_field: str
+        :return: The new record, or None if the key has no remaining instances.
+        :rtype: dict
+        """
+        if key in self._matched:
+            return None
+
+        item = self.new_data.get(key, None)
+        if not item:
+            return None
+
+        claimed = self._claims.get(key, 0) + 1
+        self._claims[key] = claimed
+        if item[count_field] - claimed < 1:
+            self._matched.add(key)
+
+        return item
+
+    def remaining(self, key, count_field):
+        """
+        Returns the number of unclaimed instances of a counted record.
+        :param key: The record key
+        :type key:
+        :param count_field: The name of the record field holding the number of instances.
+        :type count_field: str
+        :return:
+        :rtype: int
+        """
+        return self.new_data[key][count_field] - self._claims.get(key, 0)
+
+    def unmatched(self):
+        """
+        Yields the new records that were not matched.
+        :return: (key, record) pairs.
+        :rtype: generator
+        """
+        matched = self._matched
+        for key, item in self.new_data.items():
+            if key not in matched:
+                yield key, item
+
+    def counts(self):
+        return {'adds': len(self.adds), 'deletes': len(self.deletes), 'updates': len(self.updates)}
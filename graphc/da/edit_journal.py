@@ -0,0 +1,303 @@
+"""
+A local SQLite journal of the edits planned for, and applied to, arcgis feature services.
+Each plan is keyed by its service url and a hash of its edits.  As chunks are applied the indexes of the items the
+service reports as applied are recorded, so an interrupted plan can be resumed by submitting only the items that have
+not yet been applied, without querying the target service again.
+A plan is complete once every item has been applied.  A plan that still has items remaining after max_attempts
+applications is marked as failed, so it is no longer resumed and cannot block later updates to the service.
+The edits of a completed plan are discarded, as they are no longer needed to resume it.  Completed and failed plans are
+deleted along with their chunks once they are older than keep_days, or beyond the most recent keep_plans for their url.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import sqlite3
+from contextlib import closing
+
+
+def json_default(value):
+    """
+    Encodes the values json does not handle, in the form used by the arcgis rest api.  Dates are written as epoch
+    milliseconds, and records as dictionaries.  Use as json.dumps(value, default=json_default)
+    """
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, datetime.date):
+        return int(datetime.datetime(value.year, value.month, value.day).timestamp() * 1000)
+    if hasattr(value, 'as_dict'):
+        return value.as_dict
+    return str(value)
+
+
+def _to_json(value):
+    return json.dumps(value, default=json_default, sort_keys=True)
+
+
+class EditJournal(object):
+    def __init__(self, path, max_attempts=3, keep_days=30, keep_plans=20):
+        """
+        :param path: The path to the journal database.  The database is created if it does not exist.
+        :type path: str
+        :param max_attempts: The number of times a plan is applied before it is marked as failed.
+        :type max_attempts: int
+        :param keep_days: The number of days completed and failed plans are kept.  Set to None to keep them regardless of age.
+        :type keep_days: int
+        :param keep_plans: The number of completed and failed plans kept for each url.  Set to None to keep them
+        regardless of number.
+        :type keep_plans: int
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.keep_days = keep_days
+        self.keep_plans = keep_plans
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS plans (plan_id TEXT PRIMARY KEY, url TEXT, created TEXT, '
+                                   'completed TEXT, adds TEXT, deletes TEXT, updates TEXT, attempts INTEGER DEFAULT 0, '
+                                   'failed TEXT)')
+                connection.execute('CREATE TABLE IF NOT EXISTS chunks (plan_id TEXT, operation TEXT, item_indexes TEXT, '
+                                   'object_ids TEXT, applied TEXT)')
+                connection.execute('CREATE INDEX IF NOT EXISTS chunks_plan_id ON chunks (plan_id)')
+
+                # journals created before plans could fail.
+                columns = [row[1] for row in connection.execute('PRAGMA table_info(plans)')]
+                if 'attempts' not in columns:
+                    connection.execute('ALTER TABLE plans ADD COLUMN attempts INTEGER DEFAULT 0')
+                if 'failed' not in columns:
+                    connection.execute('ALTER TABLE plans ADD COLUMN failed TEXT')
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    @staticmethod
+    def plan_id(url, adds=None, deletes=None, updates=None):
+        """
+        Returns the hash identifying a set of edits for a service.
+        """
+        content = _to_json({'url': url, 'adds': adds or [], 'deletes': deletes or [], 'updates': updates or []})
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def begin(self, url, adds=None, deletes=None, updates=None):
+        """
+        Records a plan and returns its id.  If the same edits are already recorded in an incomplete plan, that plan is
+        returned so it can be resumed.  Edits matching a completed or failed plan are recorded as a new plan, so the same
+        edits can be applied again.
+        :param url: The service url.
+        :type url: str
+        :return: The plan id.
+        :rtype: str
+        """
+        self.prune(url)
+
+        edits_id = self.plan_id(url, adds, deletes, updates)
+        with closing(self.connect()) as connection:
+            with connection:
+                plans = connection.execute('SELECT plan_id, completed, failed FROM plans WHERE plan_id = ? OR plan_id LIKE ?',
+                                           (edits_id, edits_id + '-%')).fetchall()
+                for plan_id, completed, failed in plans:
+                    if completed is None and failed is None:
+                        return plan_id
+
+                # earlier plans for the same edits may have been pruned, so the next suffix follows the largest in use.
+                suffixes = [int(plan_id.rsplit('-', 1)[1]) if plan_id != edits_id else 0 for plan_id, completed, failed in plans]
+                plan_id = edits_id if not plans else '{}-{}'.format(edits_id, max(suffixes) + 1)
+                connection.execute('INSERT INTO plans (plan_id, url, created, completed, adds, deletes, updates, attempts) '
+                                   'VALUES (?, ?, ?, NULL, ?, ?, ?, 0)',
+                                   (plan_id, url, datetime.datetime.now().isoformat(),
+                                    _to_json(adds or []), _to_json(deletes or []), _to_json(updates or [])))
+        return plan_id
+
+    def pending(self, url):
+        """
+        Returns the id of the most recent incomplete plan for the url, or None if all plans have been completed or have
+        failed.
+        """
+        with closing(self.connect()) as connection:
+            row = connection.execute('SELECT plan_id FROM plans WHERE url = ? AND completed IS NULL AND failed IS NULL '
+                                     'ORDER BY created DESC LIMIT 1', (url,)).fetchone()
+        return row[0] if row else None
+
+    def remaining(self, plan_id):
+        """
+        Returns the items of the plan that have not yet been applied, with the index of each item in the original plan.
+        :return: {'adds': [(index, item), ...], 'deletes': [...], 'updates': [...]}
+        :rtype: dict
+        """
+        with closing(self.connect()) as connection:
+            plan = connection.execute('SELECT adds, deletes, updates FROM plans WHERE plan_id = ?', (plan_id,)).fetchone()
+            if plan is None:
+                raise KeyError('Unknown edit plan: {}'.format(plan_id))
+
+            applied = {'adds': set(), 'deletes': set(), 'updates': set()}
+            for operation, item_indexes in connection.execute('SELECT operation, item_indexes FROM chunks WHERE plan_id = ?', (plan_id,)):
+                applied[operation].update(json.loads(item_indexes))
+
+        result = {}
+        for operation, content in zip(['adds', 'deletes', 'updates'], plan):
+            done = applied[operation]
+            result[operation] = [(index, item) for index, item in enumerate(json.loads(content)) if index not in done]
+        return result
+
+    def record_chunk(self, plan_id, operation, item_indexes, object_ids=None):
+        """
+        Records the plan items applied by a chunk.
+        :param operation: 'adds', 'deletes' or 'updates'
+        :type operation: str
+        :param item_indexes: The indexes of the applied items in the original plan.
+        :type item_indexes: list
+        :param object_ids: The object ids returned by the service for the chunk.
+        :type object_ids: list
+        """
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute('INSERT INTO chunks (plan_id, operation, item_indexes, object_ids, applied) VALUES (?, ?, ?, ?, ?)',
+                                   (plan_id, operation, json.dumps(list(item_indexes)), json.dumps(object_ids or []),
+                                    datetime.datetime.now().isoformat()))
+
+    def complete(self, plan_id):
+        """
+        Marks a plan as complete.  The edits of the plan are discarded, as every item has been applied.
+        """
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute("UPDATE plans SET completed = ?, adds = '[]', deletes = '[]', updates = '[]' WHERE plan_id = ?",
+                                   (datetime.datetime.now().isoformat(), plan_id))
+
+    def prune(self, url=None):
+        """
+        Deletes the completed and failed plans, and their chunks, that are older than keep_days or beyond the most recent
+        keep_plans for their url.  Incomplete plans are never deleted.
+        :param url: Optional.  If supplied, only the plans for this url are pruned.
+        :type url: str
+        :return: The number of plans deleted.
+        :rtype: int
+        """
+        sql = 'SELECT plan_id, url, created FROM plans WHERE (completed IS NOT NULL OR failed IS NOT NULL)'
+        parameters = ()
+        if url is not None:
+            sql += ' AND url = ?'
+            parameters = (url,)
+        sql += ' ORDER BY created DESC'
+
+        cutoff = None
+        if self.keep_days is not None:
+            cutoff = (datetime.datetime.now() - datetime.timedelta(days=self.keep_days)).isoformat()
+
+        with closing(self.connect()) as connection:
+            with connection:
+                kept = {}  # {url: number of plans kept}
+                expired = []
+                for plan_id, plan_url, created in connection.execute(sql, parameters).fetchall():
+                    count = kept.get(plan_url, 0)
+                    if (cutoff is not None and created < cutoff) or (self.keep_plans is not None and count >= self.keep_plans):
+                        expired.append((plan_id,))
+                    else:
+                        kept[plan_url] = count + 1
+
+                connection.executemany('DELETE FROM chunks WHERE plan_id = ?', expired)
+                connection.executemany('DELETE FROM plans WHERE plan_id = ?', expired)
+
+        if expired:
+            logging.info('Pruned {} edit plans from the journal'.format(len(expired)))
+        return len(expired)
+
+    def fail(self, plan_id):
+        """
+        Marks a plan as failed.  Failed plans are not returned by pending, and their remaining items are not applied.
+        """
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute('UPDATE plans SET failed = ? WHERE plan_id = ?', (datetime.datetime.now().isoformat(), plan_id))
+
+    def status(self, plan_id):
+        """
+        :return: 'complete', 'failed' or 'pending'
+        :rtype: str
+        """
+        with closing(self.connect()) as connection:
+            row = connection.execute('SELECT completed, failed FROM plans WHERE plan_id = ?', (plan_id,)).fetchone()
+        if row is None:
+            raise KeyError('Unknown edit plan: {}'.format(plan_id))
+        if row[0] is not None:
+            return 'complete'
+        if row[1] is not None:
+            return 'failed'
+        return 'pending'
+
+    def _add_attempt(self, plan_id):
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute('UPDATE plans SET attempts = COALESCE(attempts, 0) + 1 WHERE plan_id = ?', (plan_id,))
+                return connection.execute('SELECT attempts FROM plans WHERE plan_id = ?', (plan_id,)).fetchone()[0]
+
+    def apply(self, plan_id, submit):
+        """
+        Applies the remaining items of a plan, recording each item the service reports as applied.  The plan is marked
+        as complete once every item has been applied, or as failed once it has been applied max_attempts times with
+        items remaining.
+        :param plan_id: The plan id.
+        :type plan_id: str
+        :param submit: A function with the signature of da_agol.update_layer, less the layer.
+        eg: lambda **kwargs: da_agol.update_layer(layer, **kwargs)
+        :type submit: function
+        :return: The submit result.
+        :rtype: dict
+        """
+        remaining, on_chunk = self._start(plan_id)
+        result = submit(adds=[item for index, item in remaining['adds']],
+                        deletes=[item for index, item in remaining['deletes']],
+                        updates=[item for index, item in remaining['updates']],
+                        on_chunk=on_chunk)
+        return self._finish(plan_id, result)
+
+    async def apply_async(self, plan_id, submit):
+        """
+        Applies the remaining items of a plan within an event loop.  See apply.
+        :param submit: A coroutine function with the signature of da_agol.update_layer_async, less the layer.
+        :type submit: function
+        """
+        remaining, on_chunk = self._start(plan_id)
+        result = await submit(adds=[item for index, item in remaining['adds']],
+                              deletes=[item for index, item in remaining['deletes']],
+                              updates=[item for index, item in remaining['updates']],
+                              on_chunk=on_chunk)
+        return self._finish(plan_id, result)
+
+    def _start(self, plan_id):
+        """
+        Returns the remaining items of a plan, and the on_chunk function that journals each applied chunk.
+        """
+        remaining = self.remaining(plan_id)
+        indexes = {operation: [index for index, item in items] for operation, items in remaining.items()}
+
+        def on_chunk(detail):
+            if detail['error'] is not None:
+                return
+            # only the items the service reports as applied are recorded.  Failed items remain in the plan.
+            chunk_indexes = indexes[detail['operation']][detail['start']:detail['start'] + detail['count']]
+            applied = [(index, object_id) for index, object_id in zip(chunk_indexes, detail['object_ids']) if object_id is not None]
+            if applied:
+                self.record_chunk(plan_id, detail['operation'], [index for index, object_id in applied],
+                                  [object_id for index, object_id in applied])
+
+        logging.info('Applying edit plan {}: {} adds, {} deletes, {} updates remaining'.format(plan_id,
+                                                                                               len(remaining['adds']),
+                                                                                               len(remaining['deletes']),
+                                                                                               len(remaining['updates'])))
+        return remaining, on_chunk
+
+    def _finish(self, plan_id, result):
+        remaining = sum(len(items) for items in self.remaining(plan_id).values())
+        if remaining == 0:
+            self.complete(plan_id)
+        else:
+            attempts = self._add_attempt(plan_id)
+            if attempts >= self.max_attempts:
+                logging.error('Edit plan {} failed with {} items remaining after {} attempts'.format(plan_id, remaining, attempts))
+                self.fail(plan_id)
+            else:
+                logging.warning('Edit plan {} has {} items remaining after {} attempts'.format(plan_id, remaining, attempts))
+        result['plan_id'] = plan_id
+        result['plan_status'] = self.status(plan_id)
+        return result
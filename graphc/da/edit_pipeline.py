@@ -0,0 +1,212 @@
+"""
+An asyncio pipeline that applies edits to several arcgis feature layers at the same time.
+Each layer is updated by an AsyncEditSubmitter, which uses the same payload based chunk sizing and stage order as
+EditSubmitter.  Chunks are created as workers become free and passed through a bounded queue, so only a few chunks
+are held in memory per layer.  Calls to each host are limited by a shared HostLimiter, so many layers on the same
+service cannot flood it with requests.
+Requests are made by a transport:
+- LayerTransport calls FeatureLayer.edit_features on a worker thread, using the layer connection and credentials.
+- HttpTransport posts directly to the layer applyEdits endpoint.  It only needs a url, so it can be used against a
+  local stub server.
+"""
+import asyncio
+import json
+import logging
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from graphc.da import geometry_json_cache
+from graphc.da.edit_submitter import ChunkAttempt, EditSubmitter, payload_size, DELETES, ADDS, UPDATES
+
+
+class HostLimiter(object):
+    def __init__(self, per_host=4):
+        """
+        Limits the number of concurrent requests made to each host.
+        Semaphores are created on first use, so a limiter must only be used within a single event loop.
+        :param per_host: The maximum number of concurrent requests to a host.
+        :type per_host: int
+        """
+        self.per_host = per_host
+        self._semaphores = {}
+
+    def semaphore(self, url):
+        host = urllib.parse.urlparse(url).netloc.lower()
+        semaphore = self._semaphores.get(host, None)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host)
+            self._semaphores[host] = semaphore
+        return semaphore
+
+
+class LayerTransport(object):
+    def __init__(self, layer):
+        """
+        Applies edits using FeatureLayer.edit_features, called on a worker thread.
+        :param layer: The Arcgis Feature Layer to be updated
+        :type layer: arcgis.features.FeatureLayer
+        """
+        self.layer = layer
+        self.url = layer.url
+
+    async def __call__(self, operation, chunk):
+        if operation == DELETES:
+            kwargs = {'deletes': str(chunk)}
+        else:
+            kwargs = {operation: chunk}
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: self.layer.edit_features(**kwargs))
+
+
+class HttpTransport(object):
+    def __init__(self, url, token=None, timeout=300):
+        """
+        Applies edits by posting to the applyEdits endpoint of a layer.
+        :param url: The layer url.  eg: https://services.arcgis.com/.../FeatureServer/0
+        :type url: str
+        :param token: Optional.  The token used to access the layer.
+        :type token: str
+        :param timeout: The request timeout in seconds.
+        :type timeout: float
+        """
+        self.url = url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def encode(self, operation, chunk):
+        """
+        Returns the form encoded request body for a chunk.
+        :rtype: bytes
+        """
+        parameters = {'f': 'json'}
+        if operation == DELETES:
+            parameters[DELETES] = ','.join(str(object_id) for object_id in chunk)
+        else:
+            items = [item.as_dict if hasattr(item, 'as_dict') else item for item in chunk]
+            # cached geometries are written from their encoded json.
+            parameters[operation] = '[' + ','.join(geometry_json_cache.default_cache.encode_item(item) for item in items) + ']'
+        if self.token:
+            parameters['token'] = self.token
+        return urllib.parse.urlencode(parameters).encode('utf-8')
+
+    def post(self, body):
+        request = urllib.request.Request(self.url + '/applyEdits', data=body,
+                                         headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            content = json.loads(response.read().decode('utf-8'))
+        if 'error' in content:
+            raise RuntimeError('applyEdits failed: {}'.format(content['error']))
+        return content
+
+    async def __call__(self, operation, chunk):
+        body = self.encode(operation, chunk)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.post, body)
+
+
+class AsyncEditSubmitter(EditSubmitter):
+    def __init__(self, transport, limiter=None, **kwargs):
+        """
+        Submits edits to a single layer within an event loop.  See EditSubmitter for the chunk sizing arguments.
+        :param transport: The transport used to apply each chunk.  See LayerTransport and HttpTransport.
+        :type transport:
+        :param limiter: Optional.  The host limiter shared by the layers being updated.  If None, requests are only
+        limited by max_workers.
+        :type limiter: HostLimiter
+        """
+        super().__init__(layer=getattr(transport, 'layer', None), **kwargs)
+        self.transport = transport
+        self.limiter = limiter
+
+    async def submit_async(self, adds=None, deletes=None, updates=None, on_chunk=None):
+        """
+        Applies the edits and returns the submitted counts along with the details of each chunk.
+        See EditSubmitter.submit for the result.
+        :rtype: dict
+        """
+        result = {ADDS: 0, DELETES: 0, UPDATES: 0, 'chunks': [], 'failures': []}
+        for operation, items in [(DELETES, deletes), (ADDS, adds), (UPDATES, updates)]:
+            if not items:
+                continue
+            for detail in await self._submit_stage_async(operation, items, on_chunk):
+                result['chunks'].append(detail)
+                if detail['error'] or detail['failed']:
+                    result['failures'].append(detail)
+            result[operation] = len(items)
+            logging.info('Total {} for {}: {}'.format(operation.capitalize(), self.transport.url, result[operation]))
+
+        return result
+
+    async def _submit_stage_async(self, operation, items, on_chunk):
+        sizes = [payload_size(item) for item in items]
+        queue = asyncio.Queue(maxsize=self.max_workers)
+        details = []
+
+        async def produce():
+            # chunks are sized when a queue slot is free, so adaptations from completed chunks are applied.
+            position = 0
+            while position < len(items):
+                end, chunk_bytes = self._next_chunk(items, position, sizes)
+                await queue.put((items[position:end], position, chunk_bytes))
+                position = end
+            for _ in range(self.max_workers):
+                await queue.put(None)
+
+        async def consume():
+            while True:
+                entry = await queue.get()
+                if entry is None:
+                    return
+                detail = await self._apply_chunk_async(operation, *entry)
+                self._adapt(detail)
+                details.append(detail)
+                if on_chunk:
+                    on_chunk(detail)
+
+        await asyncio.gather(produce(), *[consume() for _ in range(self.max_workers)])
+        details.sort(key=lambda d: d['start'])
+        return details
+
+    async def _apply_chunk_async(self, operation, chunk, start, chunk_bytes):
+        logging.info('Applying {} {} to {}'.format(len(chunk), operation.capitalize(), self.transport.url))
+        attempt = ChunkAttempt(self, operation, chunk, start, chunk_bytes)
+        while True:
+            attempt.begin()
+            try:
+                if self.limiter is None:
+                    response = await self.transport(operation, attempt.items())
+                else:
+                    async with self.limiter.semaphore(self.transport.url):
+                        response = await self.transport(operation, attempt.items())
+            except Exception as e:
+                # finding committed adds queries the layer, so failures are handled on a worker thread.
+                loop = asyncio.get_event_loop()
+                wait_seconds = await loop.run_in_executor(None, attempt.failed, e)
+                if wait_seconds is None:
+                    break
+                await asyncio.sleep(wait_seconds)
+                continue
+            attempt.succeeded(response)
+            break
+
+        return attempt.finish()
+
+
+def run(coroutine_function, *args, **kwargs):
+    """
+    Runs a coroutine to completion from synchronous code and returns its result.
+    The coroutine runs in a new event loop on a separate thread, so this can also be called where an event loop is
+    already running, such as a notebook.
+    :param coroutine_function: The coroutine function.
+    :type coroutine_function: function
+    """
+    def run_in_new_loop():
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine_function(*args, **kwargs))
+        finally:
+            loop.close()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run_in_new_loop).result()
@@ -0,0 +1,162 @@
+"""
+Edit plans separate the calculation of the edits required to update a source from the application of those edits.
+A plan holds the adds, updates and deletes for a source along with a per field histogram of the changed values, and
+estimates of the payload size and number of requests needed to apply it.  Plans can be saved as json and applied on
+another machine.
+
+Plans for feature classes and SQLite tables hold:
+- adds: [{field_name: value, ...}, ...], with the geometry held by the 'SHAPE@' field.
+- updates: [{'id': id_value, 'object_id': object_id, 'values': {field_name: value, ...}}, ...], where the values only
+  hold the changed fields.
+- deletes: [object_id, ...]
+Plans for feature services hold feature json adds and updates, and object id deletes, in the form used by applyEdits.
+"""
+import base64
+import datetime
+import json
+import math
+
+from graphc.da import edit_submitter
+
+try:
+    import arcpy
+except ImportError:
+    # geometries are only restored as arcpy geometries when arcpy is available.  See decode_value
+    arcpy = None
+
+
+def encode_value(value):
+    """
+    Converts a value to a json compatible form.  Dates, geometries and binary values are tagged so they can be restored.
+    """
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'$bytes': base64.b64encode(bytes(value)).decode('ascii')}
+    if arcpy is not None and isinstance(value, arcpy.Geometry):
+        return {'$geometry': json.loads(value.JSON)}
+    if hasattr(value, 'as_dict'):
+        return encode_value(value.as_dict)
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    return value
+
+
+def decode_value(value):
+    """
+    Restores a value converted by encode_value.
+    """
+    if isinstance(value, dict):
+        if len(value) == 1:
+            tag, content = next(iter(value.items()))
+            if tag == '$datetime':
+                return datetime.datetime.fromisoformat(content)
+            if tag == '$date':
+                return datetime.date.fromisoformat(content)
+            if tag == '$bytes':
+                return base64.b64decode(content)
+            if tag == '$geometry':
+                if arcpy is None:
+                    return content
+                return arcpy.AsShape(content, True)
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+class EditPlan(object):
+    def __init__(self, source, id_field, adds=None, updates=None, deletes=None, field_changes=None, options=None):
+        """
+        :param source: The source path or url the plan applies to.
+        :type source: str
+        :param id_field: The field used to identify records.
+        :type id_field: str
+        :param adds: The records to be added.
+        :type adds: list
+        :param updates: The updated records.
+        :type updates: list
+        :param deletes: The records to be deleted.
+        :type deletes: list
+        :param field_changes: The number of changed values for each field.  {field_name: count}
+        :type field_changes: dict
+        :param options: The update options used to calculate the plan.  eg: {'add_new': True, ...}
+        :type options: dict
+        """
+        self.source = source
+        self.id_field = id_field
+        self.adds = adds or []
+        self.updates = updates or []
+        self.deletes = deletes or []
+        self.field_changes = dict(field_changes or {})
+        self.options = options or {}
+
+    def counts(self):
+        return {'adds': len(self.adds), 'deletes': len(self.deletes), 'updates': len(self.updates)}
+
+    def is_empty(self):
+        return not (self.adds or self.updates or self.deletes)
+
+    def estimated_bytes(self):
+        """
+        The estimated serialized size of the edits in bytes.
+        :rtype: dict
+        """
+        result = {}
+        for operation, items in [('adds', self.adds), ('deletes', self.deletes), ('updates', self.updates)]:
+            result[operation] = sum(edit_submitter.payload_size(encode_value(item)) for item in items)
+        result['total'] = result['adds'] + result['deletes'] + result['updates']
+        return result
+
+    def estimated_requests(self, target_bytes=2 * 1024 * 1024, max_rows=5000):
+        """
+        The estimated number of applyEdits requests, for chunks of up to target_bytes and max_rows.
+        Feature class and table plans are applied in a single pass, but the estimate indicates the relative cost.
+        :rtype: int
+        """
+        sizes = self.estimated_bytes()
+        requests = 0
+        for operation, items in [('adds', self.adds), ('deletes', self.deletes), ('updates', self.updates)]:
+            if items:
+                requests += max(math.ceil(sizes[operation] / target_bytes), math.ceil(len(items) / max_rows))
+        return requests
+
+    def summary(self):
+        result = self.counts()
+        result['estimated_bytes'] = self.estimated_bytes()['total']
+        result['estimated_requests'] = self.estimated_requests()
+        result['field_changes'] = dict(self.field_changes)
+        return result
+
+    def to_json(self):
+        return json.dumps({'source': self.source,
+                           'id_field': self.id_field,
+                           'options': self.options,
+                           'field_changes': self.field_changes,
+                           'adds': encode_value(self.adds),
+                           'updates': encode_value(self.updates),
+                           'deletes': encode_value(self.deletes)})
+
+    @staticmethod
+    def from_json(text):
+        content = json.loads(text)
+        return EditPlan(source=content['source'],
+                        id_field=content['id_field'],
+                        adds=decode_value(content['adds']),
+                        updates=decode_value(content['updates']),
+                        deletes=decode_value(content['deletes']),
+                        field_changes=content['field_changes'],
+                        options=content['options'])
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            file.write(self.to_json())
+
+    @staticmethod
+    def load(path):
+        with open(path, 'r') as file:
+            return EditPlan.from_json(file.read())
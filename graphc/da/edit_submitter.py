@@ -0,0 +1,365 @@
+"""
+Submits large sets of edits to an arcgis feature layer as a series of applyEdits calls.
+Chunks are sized by their serialized payload rather than by row count.  The target payload size grows while calls
+return quickly and shrinks when calls are slow or fail, so each service settles on a chunk size it can process.
+Chunks within a stage are submitted concurrently, but the stages are always executed in the order:
+- Deletes
+- Adds
+- Updates
+Failed updates and deletes are retried, as applying them again has the same result.  A failed add may already have
+been committed (eg: a timed out request), so adds are only retried after errors known to come before the commit, or
+when a key field is defined and the adds found in the layer have been removed from the retry.
+"""
+import json
+import logging
+import socket
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from graphc.da import geometry_json_cache
+from graphc.da.edit_journal import json_default
+
+
+DELETES = 'deletes'
+ADDS = 'adds'
+UPDATES = 'updates'
+
+_result_keys = {DELETES: 'deleteResults', ADDS: 'addResults', UPDATES: 'updateResults'}
+
+# error classes and messages raised before a request reaches the service, or when it is rejected without being applied.
+_pre_commit_error_names = {'ConnectTimeout', 'NewConnectionError'}
+_pre_commit_messages = ('Failed to establish a new connection', 'Name or service not known', 'Too Many Requests',
+                        'Error Code: 429')
+
+# the number of keys in each query used to find committed adds.
+_key_batch_size = 500
+
+
+def payload_size(item):
+    """
+    Estimates the serialized size of an edit item in bytes.
+    :param item: An object id, a feature json dictionary or an arcgis Feature.
+    :type item:
+    :return:
+    :rtype: int
+    """
+    if isinstance(item, (int, str)):
+        return len(str(item)) + 1
+    if hasattr(item, 'as_dict'):
+        item = item.as_dict
+    if isinstance(item, dict):
+        return len(geometry_json_cache.default_cache.encode_item(item)) + 1
+    return len(json.dumps(item, default=json_default)) + 1
+
+
+def is_pre_commit_error(error):
+    """
+    Returns True if an error is known to have occurred before the edits could be applied, so the request can be repeated
+    without duplicating adds.  Connection failures and rate limit responses are pre commit errors.  Timeouts and server
+    errors are not, as the service may have applied the edits before the response was lost.
+    :param error: The exception raised by the request.
+    :type error: Exception
+    :rtype: bool
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429
+    if isinstance(error, urllib.error.URLError):
+        error = error.reason
+    if isinstance(error, (ConnectionRefusedError, socket.gaierror)):
+        return True
+    if _pre_commit_error_names.intersection(cls.__name__ for cls in type(error).__mro__):
+        return True
+    message = str(error)
+    return any(pattern in message for pattern in _pre_commit_messages)
+
+
+class EditSubmitter(object):
+    def __init__(self, layer, max_workers=4, target_bytes=2 * 1024 * 1024, min_bytes=64 * 1024, max_bytes=16 * 1024 * 1024,
+                 max_rows=5000, target_seconds=30.0, retries=3, backoff=2.0, add_key_field=None):
+        """
+        :param layer: The Arcgis Feature Layer to be updated
+        :type layer: arcgis.features.FeatureLayer
+        :param max_workers: The maximum number of chunks submitted at the same time.
+        :type max_workers: int
+        :param target_bytes: The initial payload size of each chunk.
+        :type target_bytes: int
+        :param min_bytes: The smallest payload size the chunks are reduced to.
+        :type min_bytes: int
+        :param max_bytes: The largest payload size the chunks are grown to.
+        :type max_bytes: int
+        :param max_rows: The maximum number of rows in a chunk, regardless of payload size.
+        :type max_rows: int
+        :param target_seconds: Chunks faster than half this time grow the payload size, slower chunks shrink it.
+        :type target_seconds: float
+        :param retries: The number of times a failed chunk is retried.
+        :type retries: int
+        :param backoff: The initial wait in seconds before a retry.  The wait doubles for each subsequent retry.
+        :type backoff: float
+        :param add_key_field: Optional.  A field holding a unique key for each add.  If supplied, adds that fail after
+        they may have been committed are looked up in the layer by key, and only the adds not found are retried.  If
+        None, these adds are not retried.
+        :type add_key_field: str
+        """
+        self.layer = layer
+        self.max_workers = max_workers
+        self.target_bytes = target_bytes
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.target_seconds = target_seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.add_key_field = add_key_field
+
+    def submit(self, adds=None, deletes=None, updates=None, on_chunk=None):
+        """
+        Applies the edits and returns the submitted counts along with the details of each chunk.
+        :param adds: The feature items to be added.
+        :type adds: list
+        :param deletes: The object ids to be deleted.
+        :type deletes: list
+        :param updates: The feature items to be updated.
+        :type updates: list
+        :param on_chunk: Optional.  A function called with the chunk detail as each chunk completes.
+        :type on_chunk: function
+        :return: {'adds': int, 'deletes': int, 'updates': int, 'chunks': [detail, ...], 'failures': [detail, ...]}
+        Each chunk detail is {'operation': str, 'start': int, 'count': int, 'bytes': int, 'seconds': float,
+        'attempts': int, 'succeeded': int, 'failed': int, 'object_ids': list, 'error': str}, where start is the index
+        of the first chunk item in the submitted list and object_ids holds the object id returned for each chunk item,
+        or None where the item failed.
+        :rtype: dict
+        """
+        result = {ADDS: 0, DELETES: 0, UPDATES: 0, 'chunks': [], 'failures': []}
+        # perform updates in order deletes, adds, updates to support models where:
+        # - updates are performed by deleting old records and replacing with new (remove old items before adding new)
+        # - items can be added and updated in same cycles (ensure adds are in place before updates are applied)
+        for operation, items in [(DELETES, deletes), (ADDS, adds), (UPDATES, updates)]:
+            if not items:
+                continue
+            for detail in self._submit_stage(operation, items, on_chunk):
+                result['chunks'].append(detail)
+                if detail['error'] or detail['failed']:
+                    result['failures'].append(detail)
+            result[operation] = len(items)
+            logging.info('Total {}: {}'.format(operation.capitalize(), result[operation]))
+
+        return result
+
+    def _next_chunk(self, items, start, sizes):
+        end = start
+        chunk_bytes = 0
+        limit = min(len(items), start + self.max_rows)
+        while end < limit:
+            if end > start and chunk_bytes + sizes[end] > self.target_bytes:
+                break
+            chunk_bytes += sizes[end]
+            end += 1
+        return end, chunk_bytes
+
+    def _submit_stage(self, operation, items, on_chunk):
+        sizes = [payload_size(item) for item in items]
+        position = 0
+        pending = {}
+        details = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while position < len(items) or pending:
+                while position < len(items) and len(pending) < self.max_workers:
+                    end, chunk_bytes = self._next_chunk(items, position, sizes)
+                    future = executor.submit(self._apply_chunk, operation, items[position:end], position, chunk_bytes)
+                    pending[future] = position
+                    position = end
+
+                done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    del pending[future]
+                    detail = future.result()
+                    self._adapt(detail)
+                    details.append(detail)
+                    if on_chunk:
+                        on_chunk(detail)
+
+        details.sort(key=lambda d: d['start'])
+        return details
+
+    def _adapt(self, detail):
+        """Grows or shrinks the target payload size based on the outcome of a chunk."""
+        if detail['error'] or detail['attempts'] > 1 or detail['seconds'] > self.target_seconds:
+            self.target_bytes = max(self.min_bytes, int(self.target_bytes / 2))
+        elif detail['seconds'] < self.target_seconds / 2 and detail['bytes'] >= self.target_bytes / 2:
+            self.target_bytes = min(self.max_bytes, int(self.target_bytes * 1.5))
+
+    def _apply_chunk(self, operation, chunk, start, chunk_bytes):
+        logging.info('Applying {} {}'.format(len(chunk), operation.capitalize()))
+        attempt = ChunkAttempt(self, operation, chunk, start, chunk_bytes)
+        while True:
+            attempt.begin()
+            try:
+                response = self._edit_features(operation, attempt.items())
+            except Exception as e:
+                wait_seconds = attempt.failed(e)
+                if wait_seconds is None:
+                    break
+                time.sleep(wait_seconds)
+                continue
+            attempt.succeeded(response)
+            break
+
+        return attempt.finish()
+
+    def _retry_indexes(self, operation, chunk, indexes, committed, error, start, attempts):
+        """
+        Returns the indexes of the chunk items to be retried after a failed request, or None if the chunk is not retried.
+        Adds found in the layer are added to committed and are not retried.
+        """
+        if attempts > self.retries:
+            logging.error('{} chunk at {} failed after {} attempts: {}'.format(operation.capitalize(), start, attempts, error))
+            return None
+        if operation != ADDS or is_pre_commit_error(error):
+            return indexes
+        if self.add_key_field is None or self.layer is None:
+            logging.error('Adds chunk at {} failed and may have been applied, so it is not retried: {}'.format(start, error))
+            return None
+
+        try:
+            found = self._find_adds([chunk[i] for i in indexes])
+        except Exception as e:
+            logging.error('Adds chunk at {} failed and the applied adds could not be found, so it is not retried: {}'.format(start, e))
+            return None
+        for position, object_id in found.items():
+            committed[indexes[position]] = object_id
+        if found:
+            logging.info('{} of {} adds in chunk at {} were applied before the failure'.format(len(found), len(indexes), start))
+        return [i for i in indexes if i not in committed]
+
+    def _find_adds(self, items):
+        """
+        Finds adds that have been committed to the layer, using the add_key_field.
+        :return: {item index: object id}
+        :rtype: dict
+        """
+        keys = {}
+        for i, item in enumerate(items):
+            if hasattr(item, 'as_dict'):
+                item = item.as_dict
+            key = item['attributes'].get(self.add_key_field, None)
+            if key is None:
+                raise ValueError('Add has no {} value'.format(self.add_key_field))
+            keys.setdefault(key, []).append(i)
+
+        result = {}
+        key_values = list(keys.keys())
+        for batch_start in range(0, len(key_values), _key_batch_size):
+            batch = key_values[batch_start:batch_start + _key_batch_size]
+            literals = ["'{}'".format(key.replace("'", "''")) if isinstance(key, str) else str(key) for key in batch]
+            where_clause = '{} IN ({})'.format(self.add_key_field, ','.join(literals))
+            feature_set = self.layer.query(where=where_clause, out_fields=self.add_key_field, return_geometry=False)
+            object_id_field = feature_set.object_id_field_name
+            for feature in feature_set.features:
+                for i in keys.get(feature.attributes[self.add_key_field], []):
+                    result[i] = feature.attributes[object_id_field]
+        return result
+
+    def _edit_features(self, operation, chunk):
+        if operation == DELETES:
+            return self.layer.edit_features(deletes=str(chunk))
+        elif operation == ADDS:
+            return self.layer.edit_features(adds=chunk)
+        else:
+            return self.layer.edit_features(updates=chunk)
+
+    @staticmethod
+    def _new_detail(operation, chunk, start, chunk_bytes):
+        return {'operation': operation, 'start': start, 'count': len(chunk), 'bytes': chunk_bytes, 'seconds': 0.0,
+                'attempts': 0, 'succeeded': 0, 'failed': 0, 'object_ids': [], 'error': None}
+
+    @staticmethod
+    def _read_response(detail, operation, response):
+        for edit_result in (response or {}).get(_result_keys[operation], []):
+            if edit_result.get('success', False):
+                detail['succeeded'] += 1
+                detail['object_ids'].append(edit_result.get('objectId', None))
+            else:
+                detail['failed'] += 1
+                detail['object_ids'].append(None)
+
+    def _read_chunk_response(self, detail, operation, response, count, indexes, committed):
+        """
+        Reads the response for the items applied by the last request, and merges the adds found in the layer, so the
+        object ids are in chunk order.
+        """
+        if not committed:
+            if detail['error'] is None:
+                self._read_response(detail, operation, response)
+            return
+
+        object_ids = [None] * count
+        for i, object_id in committed.items():
+            object_ids[i] = object_id
+        detail['succeeded'] = len(committed)
+        if detail['error'] is None and indexes:
+            applied = self._new_detail(operation, indexes, 0, 0)
+            self._read_response(applied, operation, response)
+            for i, object_id in zip(indexes, applied['object_ids']):
+                object_ids[i] = object_id
+            detail['succeeded'] += applied['succeeded']
+            detail['failed'] = applied['failed']
+        elif detail['error'] is not None:
+            detail['failed'] = count - len(committed)
+        detail['object_ids'] = object_ids
+
+
+class ChunkAttempt(object):
+    """
+    The state of a chunk while it is applied, shared by the synchronous and asynchronous submitters so both apply the
+    same retry rules.  The submitter makes the requests:
+    - begin is called before each request, and items returns the chunk items to be sent.
+    - succeeded is called with the response of a successful request.
+    - failed is called with the error of a failed request, and returns the seconds to wait before the next request, or
+      None if the chunk is finished.  It may query the layer for committed adds.
+    - finish returns the chunk detail.
+    """
+    def __init__(self, submitter, operation, chunk, start, chunk_bytes):
+        self.submitter = submitter
+        self.operation = operation
+        self.chunk = chunk
+        self.start = start
+        self.detail = submitter._new_detail(operation, chunk, start, chunk_bytes)
+        self.indexes = list(range(len(chunk)))  # the chunk items still to be applied
+        self.committed = {}  # {chunk index: object id} for adds found in the layer after a failure
+        self.response = None
+        self._started = None
+
+    def begin(self):
+        self.detail['attempts'] += 1
+        self._started = time.perf_counter()
+
+    def items(self):
+        return [self.chunk[i] for i in self.indexes]
+
+    def succeeded(self, response):
+        self.detail['seconds'] = time.perf_counter() - self._started
+        self.detail['error'] = None
+        self.response = response
+
+    def failed(self, error):
+        self.detail['seconds'] = time.perf_counter() - self._started
+        self.detail['error'] = str(error)
+        indexes = self.submitter._retry_indexes(self.operation, self.chunk, self.indexes, self.committed, error, self.start,
+                                                self.detail['attempts'])
+        if indexes is None:
+            return None
+        self.indexes = indexes
+        if not indexes:
+            # every remaining add was found in the layer.
+            self.detail['error'] = None
+            return None
+
+        wait_seconds = self.submitter.backoff * 2 ** (self.detail['attempts'] - 1)
+        logging.warning('{} chunk at {} failed ({}).  Retrying in {}s'.format(self.operation.capitalize(), self.start, error, wait_seconds))
+        return wait_seconds
+
+    def finish(self):
+        self.submitter._read_chunk_response(self.detail, self.operation, self.response, len(self.chunk), self.indexes,
+                                            self.committed)
+        return self.detail
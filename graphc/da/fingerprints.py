@@ -0,0 +1,194 @@
+"""
+Canonical record fingerprints used to identify unchanged records with a single hash comparison.
+Values are reduced to a canonical form before hashing.  Each form is at least as strict as the field comparison, so
+values with the same form always compare as equal:
+- floats are rounded to the comparison rounding.
+- integers are compared exactly.
+- strings are upper cased when comparisons are not case sensitive.
+- dates are compared as full datetimes.
+- geometries are reduced to their exact coordinates.
+Two records with equal fingerprints are treated as unchanged.  Records with different fingerprints must still be compared
+field by field, as values that compare as equal may still have different forms.
+The fingerprints of the new records are calculated once, before the target rows are read, and the fingerprints of
+target rows can be stored (eg: in a layer mirror) under the signature of the fingerprinter, so an unchanged row costs a
+single comparison.
+"""
+import hashlib
+import json
+
+from graphc.utilities import datetime_utils
+
+
+# field kinds, shared by the arcpy (eg: 'DOUBLE') and rest (eg: 'esriFieldTypeDouble') field type names.
+KIND_STRING = 'STRING'
+KIND_FLOAT = 'FLOAT'
+KIND_INTEGER = 'INTEGER'
+KIND_DATE = 'DATE'
+KIND_GEOMETRY = 'GEOMETRY'
+KIND_IGNORE = 'IGNORE'
+
+_field_kinds = {'STRING': KIND_STRING,
+                'ESRIFIELDTYPESTRING': KIND_STRING,
+                'SINGLE': KIND_FLOAT,
+                'DOUBLE': KIND_FLOAT,
+                'ESRIFIELDTYPESINGLE': KIND_FLOAT,
+                'ESRIFIELDTYPEDOUBLE': KIND_FLOAT,
+                'INTEGER': KIND_INTEGER,
+                'SMALLINTEGER': KIND_INTEGER,
+                'ESRIFIELDTYPEINTEGER': KIND_INTEGER,
+                'ESRIFIELDTYPESMALLINTEGER': KIND_INTEGER,
+                'DATE': KIND_DATE,
+                'ESRIFIELDTYPEDATE': KIND_DATE,
+                'GEOMETRY': KIND_GEOMETRY,
+                'OID': KIND_IGNORE,
+                'RASTER': KIND_IGNORE,
+                'BLOB': KIND_IGNORE,
+                'ESRIFIELDTYPEOID': KIND_IGNORE,
+                'ESRIFIELDTYPEGEOMETRY': KIND_IGNORE,
+                'ESRIFIELDTYPEBLOB': KIND_IGNORE,
+                'ESRIFIELDTYPERASTER': KIND_IGNORE,
+                'GLOBALID': KIND_IGNORE,
+                'GUID': KIND_IGNORE,
+                'ESRIFIELDTYPEGLOBALID': KIND_IGNORE,
+                'ESRIFIELDTYPEGUID': KIND_IGNORE}
+
+
+def field_kind(field_type):
+    """
+    Returns the fingerprint kind for an arcpy or rest field type name.
+    :param field_type: The field type name.  eg: 'Double' or 'esriFieldTypeDouble'
+    :type field_type: str
+    :return: One of the KIND_* values.
+    :rtype: str
+    """
+    kind = _field_kinds.get(field_type.upper(), None)
+    if kind is None:
+        raise ValueError('Unhandled field_type: ' + field_type)
+    return kind
+
+
+def _freeze(value):
+    """Recursively converts a geometry json structure to tuples."""
+    if isinstance(value, float):
+        return value + 0.0  # + 0.0 folds -0.0 into 0.0
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in sorted(value.items()) if key != 'spatialReference')
+    return value
+
+
+def canonical_geometry(geometry):
+    """
+    Reduces a geometry to a hashable tuple of its exact coordinates.
+    Accepts arcpy geometries (or any object with a JSON property), arcgis geometries, json dictionaries and WKB bytes.
+    :param geometry: The geometry to be converted
+    :type geometry:
+    :return: tuple
+    :rtype: tuple
+    """
+    if geometry is None:
+        return None
+
+    if isinstance(geometry, (bytes, bytearray)):
+        return bytes(geometry)
+
+    # geometries are converted directly rather than through the shared json cache.  Each cursor geometry is only
+    # fingerprinted once, and caching them would hold every geometry read and evict the shared entries.
+    if isinstance(geometry, str):
+        geometry = json.loads(geometry)
+    elif not isinstance(geometry, dict):
+        geometry = json.loads(geometry.JSON)
+
+    return _freeze(geometry)
+
+
+class RecordFingerprinter(object):
+    """
+    Calculates fingerprints for a fixed list of field kinds.  Values must be submitted in the same order as the kinds.
+    """
+    def __init__(self, kinds, rounding=4, case_sensitive=True):
+        """
+        :param kinds: The KIND_* value for each value that will be submitted.
+        :type kinds: list
+        :param rounding: decimal rounding applied to float values.
+        :type rounding: int
+        :param case_sensitive: If False, strings are upper cased before hashing.
+        :type case_sensitive: bool
+        """
+        self.kinds = tuple(kinds)
+        self.rounding = rounding
+        self.case_sensitive = case_sensitive
+
+    @staticmethod
+    def for_field_types(field_types, rounding=4, case_sensitive=True):
+        """
+        Creates a fingerprinter from a list of arcpy or rest field type names.
+        :param field_types: [field_type, ...]
+        :type field_types: list
+        """
+        kinds = [field_kind(field_type) for field_type in field_types]
+        return RecordFingerprinter(kinds=kinds, rounding=rounding, case_sensitive=case_sensitive)
+
+    def canonical_value(self, value, kind):
+        if value is None or kind == KIND_IGNORE:
+            return None
+
+        if kind == KIND_FLOAT or kind == KIND_INTEGER:
+            if isinstance(value, float):
+                if kind == KIND_FLOAT:
+                    value = round(value, self.rounding) + 0.0
+                if value.is_integer():
+                    return int(value)  # ensure 1.0 and 1 produce the same fingerprint.
+            return value
+
+        if kind == KIND_STRING:
+            if not self.case_sensitive:
+                return value.upper()
+            return value
+
+        if kind == KIND_DATE:
+            return datetime_utils.to_datetime(value).isoformat()
+
+        if kind == KIND_GEOMETRY:
+            return canonical_geometry(value)
+
+        return value
+
+    def fingerprint(self, values):
+        """
+        Returns the fingerprint for the submitted values.
+        :param values: The values to be fingerprinted, in the same order as self.kinds
+        :type values: list
+        :return: A 16 byte digest.
+        :rtype: bytes
+        """
+        canonical = tuple(self.canonical_value(value, kind) for value, kind in zip(values, self.kinds))
+        return hashlib.blake2b(repr(canonical).encode('utf-8'), digest_size=16).digest()
+
+    def signature(self, fields):
+        """
+        Returns a key identifying the fingerprints of the fields, so stored fingerprints are only reused by a
+        fingerprinter with the same fields, kinds and comparison settings.
+        :param fields: The field names, in the same order as self.kinds
+        :type fields: list
+        :rtype: str
+        """
+        content = repr((tuple(fields), self.kinds, self.rounding, self.case_sensitive))
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def fingerprint_records(self, records, fields):
+        """
+        Returns the fingerprint of each record, calculated once so they can be compared with many rows.
+        :param records: Dictionary records indexed by id.  {record_id: {field_name1: value1, ...}}
+        :type records: dict
+        :param fields: The fields fingerprinted, in the same order as self.kinds
+        :type fields: list
+        :return: {record_id: fingerprint}.  Records missing any of the fields are not included.
+        :rtype: dict
+        """
+        result = {}
+        for record_id, record in records.items():
+            if all(field_name in record for field_name in fields):
+                result[record_id] = self.fingerprint([record[field_name] for field_name in fields])
+        return result
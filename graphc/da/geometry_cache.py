@@ -0,0 +1,279 @@
+"""
+A persistent on-disk cache of reference geometries read from local feature classes.
+Each cached source is stored as a directory of numpy arrays: the ids, and either the x/y coordinates of point features
+or the WKB of other features as a single byte buffer with an offset for each feature.  The arrays are loaded by memory
+mapping, so reading a cached source does not use an arcpy cursor, and arcpy geometries are only created as they are
+requested.
+Entries are keyed by the source path, the modification time of the source and the fields read, so an entry is replaced
+automatically when the source changes.
+Features with a null id cannot be requested by id, so they are not cached.
+"""
+import collections.abc
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import arcpy
+import numpy
+
+from graphc.da import da_arcpy
+
+
+def source_modified_time(source):
+    """
+    Returns the modification time of a local data source.  For sources within a file geodatabase or other directory
+    based workspace, the latest modification time of the files in the workspace is returned, as editing a feature
+    class does not change the modification time of the workspace directory.  For file sources, the latest modification
+    time of the files with the same base name is returned, so edits to the sidecar files of a shapefile (eg: the .dbf)
+    are found.
+    :param source: The path to the data source.  eg: 'C:\\data\\reference.gdb\\Postcodes'
+    :type source: str
+    :return:
+    :rtype: float
+    """
+    path = os.path.abspath(source)
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            raise ValueError('Source is not a local path: {}'.format(source))
+        path = parent
+
+    result = os.path.getmtime(path)
+    if os.path.isdir(path):
+        directory = path
+        prefix = None
+    else:
+        directory = os.path.dirname(path)
+        prefix = os.path.normcase(os.path.splitext(os.path.basename(path))[0] + '.')
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and (prefix is None or os.path.normcase(entry.name).startswith(prefix)):
+                result = max(result, entry.stat().st_mtime)
+    return result
+
+
+class CachedGeometries(collections.abc.Mapping):
+    def __init__(self, ids, spatial_reference, xy=None, offsets=None, wkb=None):
+        """
+        A read only mapping of {id: arcpy geometry} backed by cached arrays.  Geometries are created when first requested.
+        If ids are not unique, the last item found is returned.
+        :param ids: The id of each feature.
+        :type ids: numpy.ndarray
+        :param spatial_reference: The spatial reference string of the source.  See arcpy.SpatialReference.exportToString
+        :type spatial_reference: str
+        :param xy: Point features only.  The x, y coordinates of each feature, NaN for empty geometries.  shape: (n, 2)
+        :type xy: numpy.ndarray
+        :param offsets: Other features only.  The start of the WKB of each feature in wkb, plus the end of the last.
+        :type offsets: numpy.ndarray
+        :param wkb: Other features only.  The WKB of all features.
+        :type wkb: numpy.ndarray
+        """
+        self.ids = ids
+        self.spatial_reference = spatial_reference
+        self.xy = xy
+        self.offsets = offsets
+        self.wkb = wkb
+        self.index = {id_value: i for i, id_value in enumerate(ids.tolist())}
+        self._spatial_reference = None
+        self._geometries = {}
+
+    def __getitem__(self, id_value):
+        geometry = self._geometries.get(id_value, None)
+        if geometry is None:
+            geometry = self._geometry(self.index[id_value])
+            self._geometries[id_value] = geometry
+        return geometry
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, id_value):
+        return id_value in self.index
+
+    def _get_spatial_reference(self):
+        if self._spatial_reference is None:
+            self._spatial_reference = arcpy.SpatialReference()
+            self._spatial_reference.loadFromString(self.spatial_reference)
+        return self._spatial_reference
+
+    def _geometry(self, i):
+        if self.xy is not None:
+            x, y = self.xy[i]
+            if numpy.isnan(x) or numpy.isnan(y):
+                return None
+            return arcpy.PointGeometry(arcpy.Point(float(x), float(y)), self._get_spatial_reference())
+
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if start == end:
+            return None
+        return arcpy.FromWKB(bytearray(self.wkb[start:end]), self._get_spatial_reference())
+
+    def xy_arrays(self):
+        """
+        Returns the point coordinates in the form returned by da_arcpy.load_xy_arrays.
+        :rtype: graphc.da.da_arcpy.IndexedArrays
+        """
+        if self.xy is None:
+            raise ValueError('xy arrays are only available for point features.')
+        return da_arcpy.IndexedArrays(ids=self.ids, columns={'x': self.xy[:, 0], 'y': self.xy[:, 1]})
+
+
+class GeometryCache(object):
+    def __init__(self, directory):
+        """
+        :param directory: The directory holding the cached sources.  The directory is created if it does not exist.
+        :type directory: str
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _source_key(source):
+        return hashlib.blake2b(os.path.normcase(os.path.abspath(source)).encode('utf-8'), digest_size=8).hexdigest()
+
+    @staticmethod
+    def key(source, id_field, where_clause=None, upper_ids=False):
+        """
+        Returns the name of the cache entry for a source in its current state.
+        The name starts with a hash of the source path, so entries for earlier states of the source can be found.
+        :rtype: str
+        """
+        content = json.dumps({'source': os.path.normcase(os.path.abspath(source)),
+                              'modified': source_modified_time(source),
+                              'fields': [id_field, 'SHAPE@'],
+                              'where_clause': where_clause,
+                              'upper_ids': upper_ids,
+                              'null_ids': 'skipped'})
+        content_key = hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+        return '{}_{}'.format(GeometryCache._source_key(source), content_key)
+
+    def load(self, source, id_field, where_clause=None, upper_ids=False):
+        """
+        Returns the geometries of a local feature class indexed by id_field, reading the source only if it has changed
+        since it was cached.
+        :param source: The path to the data source.
+        :type source: str
+        :param id_field: the field that will be used to index the result.  If ids are not unique, only last item found will be returned.
+        :type id_field: str
+        :param where_clause: Optional: A where clause to filter the results returned.
+        :type where_clause: str
+        :param upper_ids: If True, string ids are converted to upper case.
+        :type upper_ids: bool
+        :return: {id: arcpy geometry}
+        :rtype: CachedGeometries
+        """
+        key = self.key(source, id_field, where_clause, upper_ids)
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            self._write(path, source, id_field, where_clause, upper_ids)
+        else:
+            logging.info('Loading cached geometries for: ' + source)
+
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+
+        def array(name):
+            return numpy.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+        if meta['kind'] == 'point':
+            return CachedGeometries(ids=array('ids'), spatial_reference=meta['spatial_reference'], xy=array('xy'))
+        return CachedGeometries(ids=array('ids'), spatial_reference=meta['spatial_reference'],
+                                offsets=array('offsets'), wkb=array('wkb'))
+
+    def _write(self, path, source, id_field, where_clause, upper_ids):
+        logging.info('Caching geometries for: ' + source)
+        description = arcpy.Describe(source)
+        is_point = description.shapeType == 'Point'
+
+        ids = []
+        xy = []
+        offsets = [0]
+        wkb = bytearray()
+        null_ids = 0
+        with arcpy.da.SearchCursor(source, [id_field, 'SHAPE@'], where_clause) as cursor:
+            for row in cursor:
+                id_value = row[0]
+                if id_value is None:
+                    null_ids += 1
+                    continue
+                if upper_ids and isinstance(id_value, str):
+                    id_value = id_value.upper()
+                ids.append(id_value)
+
+                geometry = row[1]
+                if is_point:
+                    point = geometry.firstPoint if geometry else None
+                    xy.append((point.X, point.Y) if point else (numpy.nan, numpy.nan))
+                else:
+                    if geometry:
+                        wkb.extend(geometry.WKB)
+                    offsets.append(len(wkb))
+
+        if null_ids:
+            logging.warning('{} features with a null {} were not cached for: {}'.format(null_ids, id_field, source))
+
+        # write to a temporary directory in the cache, so an interrupted write is never loaded.
+        temp_path = tempfile.mkdtemp(dir=self.directory, prefix='tmp_')
+        try:
+            numpy.save(os.path.join(temp_path, 'ids.npy'), numpy.array(ids))
+            if is_point:
+                numpy.save(os.path.join(temp_path, 'xy.npy'), numpy.array(xy, dtype=numpy.float64).reshape(-1, 2))
+            else:
+                numpy.save(os.path.join(temp_path, 'offsets.npy'), numpy.array(offsets, dtype=numpy.int64))
+                numpy.save(os.path.join(temp_path, 'wkb.npy'), numpy.frombuffer(bytes(wkb), dtype=numpy.uint8))
+            with open(os.path.join(temp_path, 'meta.json'), 'w') as file:
+                json.dump({'source': source,
+                           'id_field': id_field,
+                           'where_clause': where_clause,
+                           'kind': 'point' if is_point else 'wkb',
+                           'spatial_reference': description.spatialReference.exportToString(),
+                           'count': len(ids),
+                           'null_ids': null_ids}, file)
+            try:
+                os.rename(temp_path, path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+                # another process cached the same source state first.
+                shutil.rmtree(temp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+        self._prune(path)
+
+    def _prune(self, path):
+        # remove the entries for earlier states of the source.  Entries that are in use (memory mapped on windows) are
+        # left for a later run.
+        name = os.path.basename(path)
+        source_key = name.split('_')[0]
+        for entry in os.listdir(self.directory):
+            if entry != name and entry.startswith(source_key + '_'):
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def clear(self):
+        for entry in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """
+    Returns the shared cache.  The cache directory is read from the GRAPHC_GEOMETRY_CACHE environment variable, and
+    defaults to a directory in the temp folder.
+    :rtype: GeometryCache
+    """
+    global _default_cache
+    if _default_cache is None:
+        directory = os.environ.get('GRAPHC_GEOMETRY_CACHE', None) or os.path.join(tempfile.gettempdir(), 'graphc_geometry_cache')
+        _default_cache = GeometryCache(directory)
+    return _default_cache
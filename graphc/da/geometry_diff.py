@@ -0,0 +1,115 @@
+"""
+Tolerance based geometry comparison.
+Geometries are reduced to their json coordinates and compared vertex by vertex, with coordinates treated as equal when
+they differ by no more than a tolerance in map units.  The bounding boxes are compared first, so most changed
+geometries are identified without visiting every vertex.
+Geometries with curves (curveRings or curvePaths) hold curve segments as well as vertices, so they are compared by
+exact json equality instead.
+"""
+import json
+
+
+def geometry_json(geometry):
+    """
+    Returns the esri json dictionary for a geometry.
+    Accepts arcpy geometries (or any object with a JSON property), arcgis geometries, json dictionaries and json strings.
+    :param geometry: The geometry to be converted
+    :type geometry:
+    :return:
+    :rtype: dict
+    """
+    if geometry is None or isinstance(geometry, dict):
+        return geometry
+    if isinstance(geometry, str):
+        return json.loads(geometry)
+    return json.loads(geometry.JSON)
+
+
+def wkid(geometry_json_value):
+    spatial_reference = geometry_json_value.get('spatialReference', None) or {}
+    return spatial_reference.get('latestWkid', spatial_reference.get('wkid', None))
+
+
+def coordinates(geometry_json_value):
+    """
+    Returns the x and y coordinate of each vertex as a flat list of (x, y) tuples, with parts in order.
+    Points, multipoints, polylines and polygons are supported.
+    """
+    if 'x' in geometry_json_value:
+        return [(geometry_json_value['x'], geometry_json_value['y'])]
+
+    parts = geometry_json_value.get('rings', None) or geometry_json_value.get('paths', None)
+    if parts is None:
+        parts = [geometry_json_value.get('points', [])]
+
+    result = []
+    for part in parts:
+        for vertex in part:
+            result.append((vertex[0], vertex[1]))
+        result.append(None)  # part separator, so vertices moving between parts are detected.
+    return result
+
+
+def has_curves(geometry_json_value):
+    return 'curveRings' in geometry_json_value or 'curvePaths' in geometry_json_value
+
+
+def _without_spatial_reference(geometry_json_value):
+    return {key: value for key, value in geometry_json_value.items() if key != 'spatialReference'}
+
+
+def extent(vertices):
+    xs = [vertex[0] for vertex in vertices if vertex is not None]
+    ys = [vertex[1] for vertex in vertices if vertex is not None]
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def geometries_differ(current, new, tolerance=1e-6):
+    """
+    Returns True if the geometries differ by more than the tolerance.
+    :param current: The current geometry.
+    :type current:
+    :param new: The new geometry.
+    :type new:
+    :param tolerance: The largest coordinate difference, in map units, treated as equal.
+    :type tolerance: float
+    :return:
+    :rtype: bool
+    """
+    current = geometry_json(current)
+    new = geometry_json(new)
+    if not current or not new:
+        return bool(current) != bool(new)
+
+    current_wkid = wkid(current)
+    new_wkid = wkid(new)
+    if current_wkid and new_wkid and current_wkid != new_wkid:
+        return True
+
+    if has_curves(current) or has_curves(new):
+        return _without_spatial_reference(current) != _without_spatial_reference(new)
+
+    current_vertices = coordinates(current)
+    new_vertices = coordinates(new)
+    if len(current_vertices) != len(new_vertices):
+        return True
+
+    # bounding box prefilter
+    current_extent = extent(current_vertices)
+    new_extent = extent(new_vertices)
+    if current_extent is None or new_extent is None:
+        return current_extent != new_extent
+    for current_bound, new_bound in zip(current_extent, new_extent):
+        if abs(current_bound - new_bound) > tolerance:
+            return True
+
+    for current_vertex, new_vertex in zip(current_vertices, new_vertices):
+        if current_vertex is None or new_vertex is None:
+            if current_vertex is not new_vertex:
+                return True
+        elif abs(current_vertex[0] - new_vertex[0]) > tolerance or abs(current_vertex[1] - new_vertex[1]) > tolerance:
+            return True
+
+    return False
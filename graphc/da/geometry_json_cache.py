@@ -0,0 +1,122 @@
+"""
+A cache of the rest json of arcpy geometries.
+Tables such as cases by postcode and date add the same postcode geometry to hundreds of rows, and converting the
+geometry with json.loads(geometry.JSON) for every row repeats the same work.  The cache converts each geometry once,
+keyed by a region id where one is supplied or by the identity of the geometry object, and returns the same dictionary
+for every use.  The default cache is shared, so region ids must be qualified by their source, eg:
+('postcode_points', '2000').  Identity keys are only meaningful while the geometries are alive, so caches keyed by
+identity should be created for a single update rather than using the shared cache.  The json is also held as encoded
+bytes, so payloads can be written without serializing the geometry again.
+The dictionaries returned are shared and must not be altered.
+"""
+import collections
+import json
+import threading
+
+from graphc.da.edit_journal import json_default
+
+
+class GeometryJsonCache(object):
+    def __init__(self, max_entries=100000):
+        """
+        :param max_entries: The maximum number of geometries held.  Least recently used geometries are discarded first.
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # {key: (geometry, json dict, encoded bytes)}.  The geometry is held so identity keys are not reused.
+        self._entries = collections.OrderedDict()
+        self._encoded = {}  # {id(json dict): encoded bytes}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(geometry, key):
+        if key is not None:
+            return 'key', key
+        return 'id', id(geometry)
+
+    def _entry(self, geometry, key=None):
+        cache_key = self._key(geometry, key)
+        with self._lock:
+            entry = self._entries.get(cache_key, None)
+            if entry is not None and (key is not None or entry[0] is geometry):
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry
+
+        value = json.loads(geometry.JSON)
+        encoded = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        entry = (geometry, value, encoded)
+        with self._lock:
+            self.misses += 1
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self._encoded.pop(id(previous[1]), None)
+            self._entries[cache_key] = entry
+            self._encoded[id(value)] = encoded
+            while len(self._entries) > self.max_entries:
+                discarded = self._entries.popitem(last=False)[1]
+                self._encoded.pop(id(discarded[1]), None)
+        return entry
+
+    def to_json(self, geometry, key=None):
+        """
+        Returns the rest json dictionary for an arcpy geometry.
+        :param geometry: The geometry to be converted.  None is returned as None.
+        :type geometry: arcpy.Geometry
+        :param key: Optional.  An id for the geometry, qualified by its source.  eg: ('postcode_points', '2000').
+        Geometries with the same key are assumed to be equal.  If None, the geometry object identity is used.
+        :type key:
+        :return:
+        :rtype: dict
+        """
+        if geometry is None:
+            return None
+        return self._entry(geometry, key)[1]
+
+    def to_bytes(self, geometry, key=None):
+        """
+        Returns the encoded rest json for an arcpy geometry.  See to_json.
+        :rtype: bytes
+        """
+        if geometry is None:
+            return None
+        return self._entry(geometry, key)[2]
+
+    def encoded(self, value):
+        """
+        Returns the encoded bytes for a json dictionary returned by to_json, or None if the dictionary is not cached.
+        """
+        return self._encoded.get(id(value), None)
+
+    def encode_item(self, item):
+        """
+        Serializes an edit item.  Cached geometries are written from their encoded bytes, and dates as epoch milliseconds.
+        :param item: A feature json dictionary.  {'attributes': {...}, 'geometry': {...}}
+        :type item: dict
+        :rtype: str
+        """
+        geometry = item.get('geometry', None)
+        encoded = self.encoded(geometry) if geometry is not None else None
+        if encoded is None or len(item) != 2 or 'attributes' not in item:
+            return json.dumps(item, default=json_default)
+        return '{{"attributes":{},"geometry":{}}}'.format(json.dumps(item['attributes'], default=json_default), encoded.decode('utf-8'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._encoded.clear()
+
+    def stats(self):
+        """
+        :return: {'hits': int, 'misses': int, 'entries': int}
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+# the cache shared by the helpers and layer wrappers.
+default_cache = GeometryJsonCache()
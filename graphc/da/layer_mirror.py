@@ -0,0 +1,299 @@
+"""
+A local SQLite mirror of the rows in arcgis feature services.
+Each layer is mirrored in full, keyed by its url.  Callers that work with a subset of the rows select them from the
+mirror by object id, so the same mirror is kept current whatever where clauses are used against the layer.
+Edits applied through the helpers are written to the mirror from the applyEdits results, so between verify passes a
+diff can be made against the mirror without reading the service.
+A verify pass queries the rows edited since the last watermark (the largest edit date seen) along with the current
+object ids, then compares the row count and an object id checksum with the mirror.  A full rescan is made if the
+mirror has drifted, on a schedule, and when verifying layers without edit tracking.
+The fingerprint of each mirrored row can be stored with the row, so unchanged rows are identified without hashing
+them again.  Rewriting a row clears its fingerprint.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import sqlite3
+from contextlib import closing
+
+from arcgis.features import Feature
+
+from graphc.da import da_agol
+from graphc.da.edit_journal import json_default
+
+
+class LayerMirror(object):
+    def __init__(self, path, full_scan_interval=datetime.timedelta(days=1), verify_interval=datetime.timedelta(hours=6)):
+        """
+        :param path: The path to the mirror database.  The database is created if it does not exist.
+        :type path: str
+        :param full_scan_interval: The time after which a sync rereads the entire layer instead of the edited rows.
+        :type full_scan_interval: datetime.timedelta
+        :param verify_interval: The time after which a sync verifies the mirror against the service.  Within this
+        interval the mirror is used without reading the service.  Set to None to verify on every sync.
+        :type verify_interval: datetime.timedelta
+        """
+        self.path = path
+        self.full_scan_interval = full_scan_interval
+        self.verify_interval = verify_interval
+        with closing(self.connect()) as connection:
+            with connection:
+                # mirrors were previously partitioned by where clause.  Those tables are discarded, and the layers are
+                # rescanned on their next sync.
+                connection.execute('DROP TABLE IF EXISTS mirror_state')
+                connection.execute('DROP TABLE IF EXISTS mirror_rows')
+                connection.execute('CREATE TABLE IF NOT EXISTS layer_state (url TEXT PRIMARY KEY, watermark INTEGER, '
+                                   'last_full_scan TEXT, last_verified TEXT)')
+                connection.execute('CREATE TABLE IF NOT EXISTS layer_rows (url TEXT, object_id INTEGER, '
+                                   'attributes TEXT, geometry TEXT, fingerprint_signature TEXT, fingerprint BLOB, '
+                                   'PRIMARY KEY (url, object_id))')
+                columns = [row[1] for row in connection.execute('PRAGMA table_info(layer_rows)')]
+                if 'fingerprint' not in columns:
+                    connection.execute('ALTER TABLE layer_rows ADD COLUMN fingerprint_signature TEXT')
+                    connection.execute('ALTER TABLE layer_rows ADD COLUMN fingerprint BLOB')
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    @staticmethod
+    def edit_date_field(layer):
+        """
+        Returns the name of the edit date field for the layer, or None if the layer does not track edits.
+        """
+        edit_fields_info = layer.properties.get('editFieldsInfo', None)
+        if not edit_fields_info:
+            return None
+        return edit_fields_info.get('editDateField', None)
+
+    def state(self, url):
+        """
+        :return: {'watermark': int, 'last_full_scan': datetime.datetime, 'last_verified': datetime.datetime}, or None if
+        the layer has not been mirrored.
+        :rtype: dict
+        """
+        with closing(self.connect()) as connection:
+            row = connection.execute('SELECT watermark, last_full_scan, last_verified FROM layer_state WHERE url = ?',
+                                     (url,)).fetchone()
+        if row is None:
+            return None
+        return {'watermark': row[0],
+                'last_full_scan': datetime.datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S'),
+                'last_verified': datetime.datetime.strptime(row[2], '%Y-%m-%d %H:%M:%S') if row[2] else None}
+
+    def invalidate(self, url):
+        """
+        Forces the next sync of the layer to verify the mirror against the service.
+        """
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute('UPDATE layer_state SET last_verified = NULL WHERE url = ?', (url,))
+
+    @staticmethod
+    def checksum(object_ids):
+        """
+        Returns a checksum of a collection of object ids, independent of their order.
+        """
+        content = ','.join(str(object_id) for object_id in sorted(object_ids))
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    def object_ids(self, url):
+        with closing(self.connect()) as connection:
+            return [row[0] for row in connection.execute('SELECT object_id FROM layer_rows WHERE url = ?', (url,))]
+
+    def sync(self, layer, full_scan=False):
+        """
+        Brings the mirror of the layer up to date.  All rows of the layer are mirrored.
+        :param layer: The Arcgis Feature Layer to be mirrored
+        :type layer: arcgis.features.FeatureLayer
+        :param full_scan: If True, the entire layer is reread regardless of the schedule.
+        :type full_scan: bool
+        :return: {'mode': 'full', 'incremental' or 'local', 'rows_read': int, 'rows_deleted': int}
+        :rtype: dict
+        """
+        url = layer.url
+        edit_date_field = self.edit_date_field(layer)
+        state = self.state(url)
+        now = datetime.datetime.now()
+
+        if full_scan or state is None or now - state['last_full_scan'] > self.full_scan_interval:
+            return self._full_scan(layer, edit_date_field)
+
+        if self.verify_interval and state['last_verified'] and now - state['last_verified'] < self.verify_interval:
+            return {'mode': 'local', 'rows_read': 0, 'rows_deleted': 0}
+
+        if edit_date_field is None or state['watermark'] is None:
+            return self._full_scan(layer, edit_date_field)
+
+        # rows edited in the same second as the watermark are reread, as the timestamp filter is only precise to the second.
+        watermark_text = datetime.datetime.utcfromtimestamp(state['watermark'] / 1000.0).strftime('%Y-%m-%d %H:%M:%S')
+        edited_where = "{} >= timestamp '{}'".format(edit_date_field, watermark_text)
+        query_result = da_agol.query_pages(layer, where=edited_where)
+
+        object_id_field = layer.properties.objectIdField
+        current_ids = set(layer.query(where='1=1', return_ids_only=True)['objectIds'] or [])
+
+        watermark = state['watermark']
+        with closing(self.connect()) as connection:
+            with connection:
+                self._write_rows(connection, url, object_id_field, query_result.features)
+                for feature in query_result.features:
+                    edit_date = feature.attributes.get(edit_date_field, None)
+                    if edit_date is not None and edit_date > watermark:
+                        watermark = edit_date
+
+                mirrored_ids = [row[0] for row in connection.execute('SELECT object_id FROM layer_rows WHERE url = ?', (url,))]
+                deleted_ids = [object_id for object_id in mirrored_ids if object_id not in current_ids]
+                connection.executemany('DELETE FROM layer_rows WHERE url = ? AND object_id = ?',
+                                       [(url, object_id) for object_id in deleted_ids])
+                connection.execute('UPDATE layer_state SET watermark = ? WHERE url = ?', (watermark, url))
+
+        logging.info('Incremental sync of {}: {} rows edited, {} rows deleted'.format(url, len(query_result.features), len(deleted_ids)))
+
+        # verify the row count and object id checksum.  Rows added to the service but missed by the edit date filter
+        # are only found here, and cause a full rescan.
+        mirror_ids = self.object_ids(url)
+        if len(mirror_ids) != len(current_ids) or self.checksum(mirror_ids) != self.checksum(current_ids):
+            logging.warning('Mirror of {} has drifted from the service ({} rows vs {}).  Rescanning'.format(url, len(mirror_ids), len(current_ids)))
+            return self._full_scan(layer, edit_date_field)
+
+        self._set_verified(url)
+        return {'mode': 'incremental', 'rows_read': len(query_result.features), 'rows_deleted': len(deleted_ids)}
+
+    def _set_verified(self, url):
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute('UPDATE layer_state SET last_verified = ? WHERE url = ?',
+                                   (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), url))
+
+    def _full_scan(self, layer, edit_date_field):
+        url = layer.url
+        query_result = da_agol.query_pages(layer, where='1=1')
+        object_id_field = layer.properties.objectIdField
+
+        watermark = None
+        if edit_date_field:
+            edit_dates = [feature.attributes.get(edit_date_field, None) for feature in query_result.features]
+            edit_dates = [edit_date for edit_date in edit_dates if edit_date is not None]
+            if edit_dates:
+                watermark = max(edit_dates)
+
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.execute('DELETE FROM layer_rows WHERE url = ?', (url,))
+                self._write_rows(connection, url, object_id_field, query_result.features)
+                now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                connection.execute('INSERT OR REPLACE INTO layer_state (url, watermark, last_full_scan, last_verified) '
+                                   'VALUES (?, ?, ?, ?)', (url, watermark, now, now))
+
+        logging.info('Full sync of {}: {} rows'.format(url, len(query_result.features)))
+        return {'mode': 'full', 'rows_read': len(query_result.features), 'rows_deleted': 0}
+
+    @staticmethod
+    def _write_rows(connection, url, object_id_field, features):
+        values = []
+        for feature in features:
+            geometry = json.dumps(feature.geometry) if feature.geometry else None
+            values.append((url, feature.attributes[object_id_field], json.dumps(feature.attributes), geometry))
+        connection.executemany('INSERT OR REPLACE INTO layer_rows (url, object_id, attributes, geometry) '
+                               'VALUES (?, ?, ?, ?)', values)
+
+    def features(self, url, object_ids=None):
+        """
+        Returns the mirrored rows as arcgis features, ordered by object id.
+        :param url: The service url.
+        :type url: str
+        :param object_ids: Optional.  The object ids of the rows to be returned.  If None, all rows are returned.
+        :type object_ids: set
+        :rtype: list
+        """
+        result = []
+        with closing(self.connect()) as connection:
+            for object_id, attributes, geometry in connection.execute('SELECT object_id, attributes, geometry FROM layer_rows '
+                                                                      'WHERE url = ? ORDER BY object_id', (url,)):
+                if object_ids is not None and object_id not in object_ids:
+                    continue
+                result.append(Feature(geometry=json.loads(geometry) if geometry else None, attributes=json.loads(attributes)))
+        return result
+
+    def fingerprints(self, url, signature):
+        """
+        Returns the stored fingerprints of the mirrored rows.  Rows rewritten since their fingerprint was stored, or
+        fingerprinted with a different signature, are not included.
+        :param url: The service url.
+        :type url: str
+        :param signature: The signature of the fingerprinter.  See RecordFingerprinter.signature
+        :type signature: str
+        :return: {object_id: fingerprint}
+        :rtype: dict
+        """
+        with closing(self.connect()) as connection:
+            return {row[0]: bytes(row[1]) for row in
+                    connection.execute('SELECT object_id, fingerprint FROM layer_rows WHERE url = ? AND '
+                                       'fingerprint_signature = ? AND fingerprint IS NOT NULL', (url, signature))}
+
+    def set_fingerprints(self, url, signature, fingerprints):
+        """
+        Stores the fingerprints of mirrored rows.
+        :param url: The service url.
+        :type url: str
+        :param signature: The signature of the fingerprinter.  See RecordFingerprinter.signature
+        :type signature: str
+        :param fingerprints: {object_id: fingerprint}
+        :type fingerprints: dict
+        """
+        if not fingerprints:
+            return
+        with closing(self.connect()) as connection:
+            with connection:
+                connection.executemany('UPDATE layer_rows SET fingerprint_signature = ?, fingerprint = ? '
+                                       'WHERE url = ? AND object_id = ?',
+                                       [(signature, fingerprint, url, object_id) for object_id, fingerprint in fingerprints.items()])
+
+    def apply_edits(self, url, object_id_field, result, adds=None, deletes=None, updates=None):
+        """
+        Writes the successful edits from an update_layer result to the mirror.
+        :param url: The service url.
+        :type url: str
+        :param object_id_field: The object id field name.
+        :type object_id_field: str
+        :param result: The update_layer result for the submitted edits.
+        :type result: dict
+        :param adds: The add items submitted to update_layer.
+        :type adds: list
+        :param deletes: The object ids submitted to update_layer.
+        :type deletes: list
+        :param updates: The update items submitted to update_layer.
+        :type updates: list
+        """
+        items = {'adds': adds or [], 'deletes': deletes or [], 'updates': updates or []}
+        with closing(self.connect()) as connection:
+            with connection:
+                for detail in result.get('chunks', []):
+                    chunk_items = items[detail['operation']][detail['start']:detail['start'] + detail['count']]
+                    for item, object_id in zip(chunk_items, detail['object_ids']):
+                        if object_id is None:
+                            continue
+                        if detail['operation'] == 'deletes':
+                            connection.execute('DELETE FROM layer_rows WHERE url = ? AND object_id = ?', (url, object_id))
+                            continue
+
+                        if hasattr(item, 'as_dict'):
+                            item = item.as_dict
+                        attributes = dict(item.get('attributes', {}))
+                        geometry = item.get('geometry', None)
+                        if detail['operation'] == 'updates':
+                            current = connection.execute('SELECT attributes, geometry FROM layer_rows WHERE url = ? AND object_id = ?',
+                                                         (url, object_id)).fetchone()
+                            if current:
+                                current_attributes = json.loads(current[0])
+                                current_attributes.update(attributes)
+                                attributes = current_attributes
+                                if geometry is None and current[1]:
+                                    geometry = json.loads(current[1])
+
+                        attributes[object_id_field] = object_id
+                        connection.execute('INSERT OR REPLACE INTO layer_rows (url, object_id, attributes, geometry) '
+                                           'VALUES (?, ?, ?, ?)',
+                                           (url, object_id, json.dumps(attributes, default=json_default),
+                                            json.dumps(geometry) if geometry else None))
@@ -0,0 +1,106 @@
+"""
+A process wide pool of arcgis feature layers.
+Constructing a FeatureLayer without a GIS creates a new anonymous connection, and every new layer object requests the
+layer properties again on first use.  The pool returns the same layer object for each url, so the properties are only
+requested once, and layers on the same host share one connection (and its keep-alive HTTP session).
+Layers are created using the active GIS if one has been set, for example by GIS(profile=...).
+"""
+import logging
+import threading
+from urllib.parse import urlparse
+
+import arcgis
+from arcgis.features import FeatureLayer
+from arcgis.gis import GIS
+
+
+class LayerPool(object):
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self.reused_connections = 0
+
+        self._layers = {}  # {(url, gis): FeatureLayer}
+        self._connections = {}  # {host: GIS}
+        self._lock = threading.Lock()
+
+    def _connection(self, url):
+        """
+        Returns the GIS used for layers on the url host.
+        """
+        active_gis = arcgis.env.active_gis
+        if active_gis is not None:
+            return active_gis
+
+        host = urlparse(url).netloc.lower()
+        gis = self._connections.get(host, None)
+        if gis is None:
+            gis = GIS(set_active=False)
+            self._connections[host] = gis
+        return gis
+
+    def layer(self, url, gis=None):
+        """
+        Returns the pooled feature layer for the url, creating it if required.
+        :param url: The feature layer url.
+        :type url: str
+        :param gis: Optional.  The GIS used to access the layer.  If None, the active GIS is used, or an anonymous
+        connection shared by all layers on the same host.
+        :type gis: arcgis.gis.GIS
+        :return:
+        :rtype: arcgis.features.FeatureLayer
+        """
+        with self._lock:
+            if gis is None:
+                gis = self._connection(url)
+
+            key = (url, gis)
+            layer = self._layers.get(key, None)
+            if layer is not None:
+                self.reused += 1
+                self.reused_connections += 1
+                return layer
+
+            if any(pooled_key[1] is gis for pooled_key in self._layers):
+                self.reused_connections += 1
+            logging.debug('Creating pooled layer: ' + url)
+            layer = FeatureLayer(url, gis=gis)
+            self._layers[key] = layer
+            self.created += 1
+            return layer
+
+    def properties(self, url, gis=None):
+        """
+        Returns the properties of the pooled layer for the url.  The properties are requested once per layer.
+        """
+        return self.layer(url, gis).properties
+
+    def invalidate(self, url):
+        """
+        Discards the pooled layers for the url, so the next request for the url reads the layer properties again.
+        Use after changing the layer schema.
+        """
+        with self._lock:
+            for key in [key for key in self._layers if key[0] == url]:
+                del self._layers[key]
+
+    def clear(self):
+        with self._lock:
+            self._layers.clear()
+            self._connections.clear()
+
+    def stats(self):
+        """
+        :return: {'layers': int, 'connections': int, 'created': int, 'reused': int, 'reused_connections': int}
+        :rtype: dict
+        """
+        with self._lock:
+            return {'layers': len(self._layers),
+                    'connections': len(set(id(key[1]) for key in self._layers)),
+                    'created': self.created,
+                    'reused': self.reused,
+                    'reused_connections': self.reused_connections}
+
+
+# the pool shared by all feature service wrappers.
+default_pool = LayerPool()
@@ -0,0 +1,135 @@
+"""
+Plans the minimum projection for the queries used to diff a feature service.
+A diff only needs the record key fields, the compared fields and the object id, so the remaining fields and (unless
+geometries are compared) the geometry are not requested.  Delete only passes request object ids alone.
+The saving against a full query is estimated from the layer field definitions.
+"""
+import logging
+
+from graphc.da import da_agol
+
+
+# estimated json size in bytes of a single value, including the field name, by field type.
+_value_sizes = {'esriFieldTypeSmallInteger': 6,
+                'esriFieldTypeInteger': 10,
+                'esriFieldTypeOID': 10,
+                'esriFieldTypeSingle': 12,
+                'esriFieldTypeDouble': 20,
+                'esriFieldTypeDate': 15,
+                'esriFieldTypeGUID': 40,
+                'esriFieldTypeGlobalID': 40}
+
+# estimated json size in bytes of a single geometry, by geometry type.
+_geometry_sizes = {'esriGeometryPoint': 60,
+                   'esriGeometryMultipoint': 500,
+                   'esriGeometryPolyline': 2000,
+                   'esriGeometryPolygon': 5000}
+
+
+def estimated_value_size(field):
+    """
+    Estimates the json size of a value for a rest field definition.
+    :param field: The field definition.  {'name': str, 'type': str, 'length': int, ...}
+    :type field: dict
+    :return:
+    :rtype: int
+    """
+    size = _value_sizes.get(field['type'], None)
+    if size is None:
+        # strings are assumed to be half their maximum length.
+        size = min(field.get('length', None) or 50, 500) // 2 + 2
+    return size + len(field['name']) + 4
+
+
+class QueryProjection(object):
+    def __init__(self, layer_fields, out_fields, return_geometry=False, ids_only=False, geometry_type=None):
+        """
+        :param layer_fields: The rest field definitions of the layer.
+        :type layer_fields: list
+        :param out_fields: The names of the fields to be requested.
+        :type out_fields: list
+        :param return_geometry: If True, geometries are requested.
+        :type return_geometry: bool
+        :param ids_only: If True, only object ids are requested.
+        :type ids_only: bool
+        :param geometry_type: The layer geometry type.  eg: 'esriGeometryPolygon'.  None for tables.
+        :type geometry_type: str
+        """
+        self.layer_fields = layer_fields
+        self.out_fields = out_fields
+        self.return_geometry = return_geometry and not ids_only
+        self.ids_only = ids_only
+        self.geometry_type = geometry_type
+        self.row_count = None  # the number of rows returned by the last query.
+
+    @staticmethod
+    def for_diff(layer, key_fields, compared_fields=None, return_geometry=False, ids_only=False):
+        """
+        Plans the projection for a diff against the layer.
+        :param layer: The Arcgis Feature Layer to be queried
+        :type layer: arcgis.features.FeatureLayer
+        :param key_fields: The fields used to identify each record.
+        :type key_fields: list
+        :param compared_fields: The fields compared with the new records.  Fields not found in the layer are ignored.
+        :type compared_fields: list
+        :param return_geometry: If True, geometries are requested for comparison.
+        :type return_geometry: bool
+        :param ids_only: If True, only object ids are requested.
+        :type ids_only: bool
+        :return:
+        :rtype: QueryProjection
+        """
+        properties = layer.properties
+        layer_fields = list(properties.fields)
+        object_id_field = properties.objectIdField
+
+        required = set(key_fields) | set(compared_fields or [])
+        required.add(object_id_field)
+        out_fields = [field['name'] for field in layer_fields if field['name'] in required]
+
+        return QueryProjection(layer_fields=layer_fields, out_fields=out_fields, return_geometry=return_geometry,
+                               ids_only=ids_only, geometry_type=properties.get('geometryType', None))
+
+    def query(self, layer, where_clause='1=1', page_size=None, max_workers=4, retries=3):
+        """
+        Queries the layer using the projection.
+        :return: A feature set, or a list of object ids if the projection is ids only.
+        :rtype:
+        """
+        if self.ids_only:
+            result = layer.query(where=where_clause, return_ids_only=True)['objectIds'] or []
+            self.row_count = len(result)
+            return result
+
+        result = da_agol.query_pages(layer=layer, where=where_clause, out_fields=self.out_fields, return_geometry=self.return_geometry,
+                                     page_size=page_size, max_workers=max_workers, retries=retries)
+        self.row_count = len(result.features)
+        return result
+
+    def report(self, row_count):
+        """
+        Estimates the bytes saved by the projection against a query for all fields and geometries.
+        :param row_count: The number of rows returned by the query.
+        :type row_count: int
+        :return: {'out_fields': list, 'return_geometry': bool, 'ids_only': bool, 'rows': int, 'estimated_bytes_saved': int}
+        :rtype: dict
+        """
+        requested = set(self.out_fields)
+        omitted_bytes = 0
+        for field in self.layer_fields:
+            if self.ids_only:
+                if field['type'] != 'esriFieldTypeOID':
+                    omitted_bytes += estimated_value_size(field)
+            elif field['name'] not in requested:
+                omitted_bytes += estimated_value_size(field)
+
+        if self.geometry_type and not self.return_geometry:
+            omitted_bytes += _geometry_sizes.get(self.geometry_type, 0)
+
+        result = {'out_fields': self.out_fields,
+                  'return_geometry': self.return_geometry,
+                  'ids_only': self.ids_only,
+                  'rows': row_count,
+                  'estimated_bytes_saved': omitted_bytes * row_count}
+        logging.info('Projected query of {} rows saved an estimated {:,} bytes'.format(row_count, result['estimated_bytes_saved']))
+        return result
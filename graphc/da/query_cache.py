@@ -0,0 +1,141 @@
+"""
+A least recently used cache of loaded records, shared by the feature source helpers.
+Entries are keyed by source, fields and where clause.  The cache is bounded by an estimated memory budget, entries can
+optionally expire after a time to live, and all entries for a source are invalidated when a helper writes to that source.
+"""
+import collections
+import collections.abc
+import logging
+import sys
+import threading
+import time
+
+
+class QueryCache(object):
+    def __init__(self, max_bytes=512 * 1024 * 1024, ttl=None):
+        """
+        :param max_bytes: The estimated memory budget for all cached records.  Least recently used entries are discarded
+        when the budget is exceeded.
+        :type max_bytes: int
+        :param ttl: Optional.  The number of seconds an entry remains valid.  If None, entries remain valid until they are
+        discarded or invalidated.
+        :type ttl: float
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()  # {key: (records, size, load_time)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(source, fields, where_clause):
+        if fields is not None:
+            fields = tuple(fields)
+        return source, fields, where_clause
+
+    @staticmethod
+    def estimate_size(records, sample_size=100):
+        """
+        Estimates the memory used by a list of records from a sample of the records.
+        :param records: [{field_name: value, ...}, ...]
+        :type records: list
+        :param sample_size: The maximum number of records sampled.
+        :type sample_size: int
+        :return: The estimated size in bytes.
+        :rtype: int
+        """
+        count = len(records)
+        size = sys.getsizeof(records)
+        if not count:
+            return size
+
+        step = max(1, count // sample_size)
+        sample = records[::step]
+        sample_bytes = 0
+        for record in sample:
+            sample_bytes += sys.getsizeof(record)
+            if isinstance(record, collections.abc.Mapping):
+                values = record.values()
+            else:
+                values = record
+            for value in values:
+                sample_bytes += sys.getsizeof(value)
+
+        return size + int(sample_bytes * count / len(sample))
+
+    def get(self, key):
+        """
+        Returns the cached records for the key, or None if no valid entry exists.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._discard(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """
+        Returns the cached records for the key without affecting the hit/miss counters or the entry order.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None or (self.ttl is not None and time.monotonic() - entry[2] > self.ttl):
+                return None
+            return entry[0]
+
+    def put(self, key, records):
+        size = self.estimate_size(records)
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+
+            if size > self.max_bytes:
+                logging.info('Query result too large to cache: {} bytes'.format(size))
+                return
+
+            self._entries[key] = (records, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, source):
+        """
+        Discards all entries for the source.
+        :param source: The source path or url.
+        :type source: str
+        """
+        with self._lock:
+            for key in [key for key in self._entries.keys() if key[0] == source]:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
+
+    def stats(self):
+        """
+        :return: {'hits': int, 'misses': int, 'entries': int, 'bytes': int}
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self._bytes}
+
+
+# the cache shared by all feature source helpers.
+default_cache = QueryCache()
@@ -0,0 +1,104 @@
+"""
+Compact read-only records for large loaded tables.
+A record type is generated once for each field list.  Records are tuples of values, with the field names held by the
+type rather than by each record, and support the dictionary access used by the helpers and the diff engine:
+record['field'], record.get('field'), keys(), values(), items() and iteration over the field names.  Field values can
+also be read as attributes where the field name is a valid identifier that is not a tuple method.  eg: record.Postcode
+Records are roughly half the size of the equivalent dictionaries.
+"""
+import collections.abc
+import functools
+
+
+class Record(tuple):
+    __slots__ = ()
+
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        index = self._index.get(name, None)
+        if index is None:
+            raise AttributeError(name)
+        return tuple.__getitem__(self, index)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(field, value) for field, value in self.items()))
+
+    def __reduce__(self):
+        return _make_record, (self._fields, tuple(self.values()))
+
+    def get(self, key, default=None):
+        index = self._index.get(key, None)
+        if index is None:
+            return default
+        return tuple.__getitem__(self, index)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple.__iter__(self)
+
+    def items(self):
+        return zip(self._fields, tuple.__iter__(self))
+
+    @property
+    def as_dict(self):
+        """
+        The record as a new dictionary.  {field_name: value, ...}
+        """
+        return dict(zip(self._fields, tuple.__iter__(self)))
+
+
+collections.abc.Mapping.register(Record)
+
+
+@functools.lru_cache(maxsize=None)
+def _record_type(fields):
+    return type('Record', (Record,), {'__slots__': (), '_fields': fields, '_index': {field: i for i, field in enumerate(fields)}})
+
+
+def record_type(fields):
+    """
+    Returns the record type for a list of field names.  The same type is returned for every call with the same fields.
+    Create records by passing the values in field order.  eg: record_type(['Postcode', 'Cases'])(('2000', 5))
+    :param fields: The field names.
+    :type fields: list
+    :return:
+    :rtype: type
+    """
+    return _record_type(tuple(fields))
+
+
+def _make_record(fields, values):
+    return _record_type(fields)(values)
+
+
+def compact(records):
+    """
+    Converts dictionary records to compact records.
+    :param records: {field_name: value, ...} dictionaries.
+    :type records: iterable
+    :return: Records, in the same order.
+    :rtype: generator
+    """
+    fields = None
+    record_class = None
+    for record in records:
+        keys = tuple(record.keys())
+        if keys != fields:
+            fields = keys
+            record_class = _record_type(fields)
+        yield record_class(record.values())
@@ -1,4 +1,49 @@
 import datetime
+import functools
+import re
+
+import numpy
+
+# the maximum number of distinct date strings and timestamps held by the parse caches.
+_cache_size = 4096
+
+
+# patterns for the formats used by the data sources.  Other formats, and strings that do not exactly match the
+# pattern of their format, are parsed by strptime.
+_patterns = {'%Y%m%d': re.compile(r'([0-9]{4})([0-9]{2})([0-9]{2})\Z'),
+             '%Y-%m-%d': re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})\Z')}
+
+
+@functools.lru_cache(maxsize=_cache_size)
+def parse_string(date_string, date_format='%Y%m%d'):
+    """
+    Parses a date string.  Results are cached, so repeated strings are only parsed once.
+    :param date_string: The date string.
+    :type date_string: str
+    :param date_format: The date string format.
+    :type date_format: str
+    :return:
+    :rtype: datetime.datetime
+    """
+    pattern = _patterns.get(date_format, None)
+    if pattern is not None:
+        match = pattern.match(date_string)
+        if match:
+            year, month, day = match.groups()
+            return datetime.datetime(int(year), int(month), int(day))
+    return datetime.datetime.strptime(date_string, date_format)
+
+
+@functools.lru_cache(maxsize=_cache_size)
+def parse_timestamp(timestamp):
+    """
+    Converts an epoch timestamp in milliseconds to a local datetime.  Results are cached.
+    :param timestamp: The timestamp in milliseconds.
+    :type timestamp: int
+    :return:
+    :rtype: datetime.datetime
+    """
+    return datetime.datetime.fromtimestamp(timestamp / 1000.0)
 
 
 def to_date(date_value, date_format='%Y%m%d'):
@@ -20,9 +65,9 @@ def to_date(date_value, date_format='%Y%m%d'):
     elif isinstance(date_value, datetime.date):
         return date_value
     elif isinstance(date_value, str):
-        return datetime.datetime.strptime(date_value, date_format).date()
+        return parse_string(date_value, date_format).date()
     elif isinstance(date_value, int):
-        return datetime.datetime.fromtimestamp(date_value/1000.0).date()
+        return parse_timestamp(date_value).date()
 
     raise ValueError('Invalid Date value.')
 
@@ -47,12 +92,44 @@ def to_datetime(datetime_value, date_format='%Y%m%d'):
     elif isinstance(datetime_value, datetime.date):
         return datetime.datetime.combine(datetime_value, datetime.datetime.min.time())
     elif isinstance(datetime_value, str):
-        return datetime.datetime.strptime(datetime_value, date_format)
+        return parse_string(datetime_value, date_format)
     elif isinstance(datetime_value, int):
-        return datetime.datetime.fromtimestamp(datetime_value / 1000.0)
+        return parse_timestamp(datetime_value)
 
     raise ValueError('Invalid DateTime value.')
 
 
 def round_to_day(datetime_value, date_format='%Y%m%d'):
     return to_datetime(datetime_value, date_format).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def to_date_ordinals(values, date_format='%Y%m%d'):
+    """
+    Converts a column of date values to day ordinals in a single call.  See datetime.date.toordinal
+    Each distinct value is only converted once.  None values are returned as 0.
+    :param values: The date values.  Any value accepted by to_date.
+    :type values: list
+    :param date_format: The date string format to be used for string values.
+    :type date_format: str
+    :return:
+    :rtype: numpy.ndarray
+    """
+    ordinals = {}
+
+    def to_ordinal(value):
+        ordinal = ordinals.get(value, None)
+        if ordinal is None:
+            date_value = to_date(value, date_format)
+            ordinal = date_value.toordinal() if date_value is not None else 0
+            ordinals[value] = ordinal
+        return ordinal
+
+    return numpy.fromiter((to_ordinal(value) for value in values), dtype=numpy.int32, count=len(values))
+
+
+def clear_cache():
+    """
+    Clears the parse caches.  Use if the local timezone is changed, as timestamps are converted to local time.
+    """
+    parse_string.cache_clear()
+    parse_timestamp.cache_clear()
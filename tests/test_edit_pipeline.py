@@ -0,0 +1,171 @@
+"""
+Tests the asyncio edit pipeline against a local stub of the applyEdits endpoint.
+"""
+import asyncio
+import json
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from graphc.da import edit_pipeline
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.requests = []  # [(layer path, operation, item count), ...] in the order received
+        self.active = 0
+        self.max_active = 0
+        self.failures = {}  # {(layer path, operation): [http status, ...]} returned before the request is applied
+        self.next_object_id = 1
+        self.delay = 0.02
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        path = self.path[:-len('/applyEdits')]
+        body = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        operation = [name for name in ['deletes', 'adds', 'updates'] if name in body][0]
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.delay)
+            with server.lock:
+                statuses = server.failures.get((path, operation), [])
+                status = statuses.pop(0) if statuses else None
+                if status is None:
+                    if operation == 'deletes':
+                        items = body['deletes'][0].split(',')
+                    else:
+                        items = json.loads(body[operation][0])
+                    server.requests.append((path, operation, len(items)))
+                    results = []
+                    for item in items:
+                        if operation == 'adds':
+                            object_id = server.next_object_id
+                            server.next_object_id += 1
+                        elif operation == 'deletes':
+                            object_id = int(item)
+                        else:
+                            object_id = item['attributes']['OBJECTID']
+                        results.append({'objectId': object_id, 'success': True})
+        finally:
+            with server.lock:
+                server.active -= 1
+
+        if status is not None:
+            self.send_response(status)
+            self.end_headers()
+            return
+
+        content = json.dumps({'deleteResults': results if operation == 'deletes' else [],
+                              'addResults': results if operation == 'adds' else [],
+                              'updateResults': results if operation == 'updates' else []}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _edits(count):
+    adds = [{'attributes': {'ID': str(i), 'Value': i}, 'geometry': None} for i in range(count)]
+    deletes = list(range(1000, 1000 + count))
+    updates = [{'attributes': {'OBJECTID': 2000 + i, 'Value': i}} for i in range(count)]
+    return adds, deletes, updates
+
+
+class EditPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stage_order_and_host_limit(self):
+        limiter = edit_pipeline.HostLimiter(per_host=2)
+        submitters = []
+        for layer_index in range(3):
+            transport = edit_pipeline.HttpTransport('{}/layer{}/FeatureServer/0'.format(self.server.url, layer_index))
+            submitters.append(edit_pipeline.AsyncEditSubmitter(transport=transport, limiter=limiter, max_workers=4, max_rows=10))
+
+        async def update_layers():
+            tasks = []
+            for submitter in submitters:
+                adds, deletes, updates = _edits(50)
+                tasks.append(submitter.submit_async(adds=adds, deletes=deletes, updates=updates))
+            return await asyncio.gather(*tasks)
+
+        results = edit_pipeline.run(update_layers)
+
+        # the three layers share a host, so at most 2 requests are made at a time.
+        self.assertEqual(self.server.max_active, 2)
+
+        for layer_index, result in enumerate(results):
+            self.assertEqual(result['failures'], [])
+            self.assertEqual((result['adds'], result['deletes'], result['updates']), (50, 50, 50))
+            self.assertEqual([detail['start'] for detail in result['chunks'] if detail['operation'] == 'adds'],
+                             [0, 10, 20, 30, 40])
+
+            # every delete is applied before the first add, and every add before the first update.
+            path = '/layer{}/FeatureServer/0'.format(layer_index)
+            operations = [operation for request_path, operation, count in self.server.requests if request_path == path]
+            self.assertEqual(operations, sorted(operations, key=['deletes', 'adds', 'updates'].index))
+            self.assertEqual(len(operations), 15)
+
+    def test_failed_chunks_are_retried(self):
+        path = '/layer/FeatureServer/0'
+        # a rate limited add is rejected before it is applied, and updates can always be repeated.
+        self.server.failures[(path, 'adds')] = [429]
+        self.server.failures[(path, 'updates')] = [500, 500]
+
+        adds, deletes, updates = _edits(20)
+        transport = edit_pipeline.HttpTransport(self.server.url + path)
+        submitter = edit_pipeline.AsyncEditSubmitter(transport=transport, max_rows=20, backoff=0)
+        result = edit_pipeline.run(submitter.submit_async, adds=adds, deletes=deletes, updates=updates)
+
+        self.assertEqual(result['failures'], [])
+        attempts = {detail['operation']: detail['attempts'] for detail in result['chunks']}
+        self.assertEqual(attempts, {'deletes': 1, 'adds': 2, 'updates': 3})
+
+        # each add was applied once.
+        applied_adds = sum(count for request_path, operation, count in self.server.requests if operation == 'adds')
+        self.assertEqual(applied_adds, 20)
+        add_detail = [detail for detail in result['chunks'] if detail['operation'] == 'adds'][0]
+        self.assertEqual(add_detail['object_ids'], list(range(1, 21)))
+
+    def test_ambiguous_add_failures_are_not_retried_without_a_key(self):
+        path = '/layer/FeatureServer/0'
+        # the add may have been committed before the server error, so it is not repeated.
+        self.server.failures[(path, 'adds')] = [500]
+
+        adds, deletes, updates = _edits(5)
+        transport = edit_pipeline.HttpTransport(self.server.url + path)
+        submitter = edit_pipeline.AsyncEditSubmitter(transport=transport, backoff=0)
+        result = edit_pipeline.run(submitter.submit_async, adds=adds)
+
+        self.assertEqual(len(result['failures']), 1)
+        self.assertEqual(result['failures'][0]['attempts'], 1)
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()